@@ -0,0 +1,128 @@
+"""
+Throughput benchmark of the password hashing service.
+
+Runs concurrent logins (one password check each) through the hashing pool,
+for several pool sizes, and prints the logins per second, the logins per
+second per core and the number of logins rejected because the pool was full.
+
+Each client stands for one sync gunicorn worker, serving one login at a
+time: use ``--clients`` equal to the number of workers of the host. The
+logins beyond ``--max-pending`` are rejected, as the bound is shared by the
+workers of the host.
+
+Usage:
+    python benchmarks/password_benchmark.py --clients 4 --workers 0 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from flask import Flask
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import password_service  # noqa: E402
+from services.password_service import PasswordHasherBusy, verify_password  # noqa: E402
+
+
+def run_logins(app, password_hash, deadline, results):
+    """
+    Check the password until the deadline.
+
+    Args:
+        app (Flask): The application holding the hashing settings.
+        password_hash (str): The hash checked by each login.
+        deadline (float): The ``time.perf_counter()`` value to stop at.
+        results (list): Receives the ``(completed, rejected)`` counts of the thread.
+    """
+    completed = rejected = 0
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            try:
+                verify_password(password_hash, "benchmark-password")
+                completed += 1
+            except PasswordHasherBusy:
+                rejected += 1
+                time.sleep(0.001)
+    results.append((completed, rejected))
+
+
+def benchmark(method, workers, clients, max_pending, duration):
+    """
+    Measure the login throughput for one pool size.
+
+    Args:
+        method (str): The werkzeug hashing method, with its cost.
+        workers (int): The number of hashing processes (0 to hash in the threads).
+        clients (int): The number of concurrent logins.
+        max_pending (int): The number of operations queued before rejecting.
+        duration (float): The duration of the measure, in seconds.
+
+    Returns:
+        dict: The throughput of the run.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        PASSWORD_HASH_METHOD=method,
+        PASSWORD_HASH_WORKERS=workers,
+        PASSWORD_HASH_MAX_PENDING=max_pending,
+    )
+    password_hash = generate_password_hash("benchmark-password", method)
+
+    # Start the pool before measuring
+    with app.app_context():
+        verify_password(password_hash, "benchmark-password")
+
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(
+            target=run_logins, args=(app, password_hash, deadline, results)
+        )
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    executor = password_service._executor.reset()
+    if executor is not None:
+        executor.shutdown()
+
+    logins_per_second = sum(done for done, _ in results) / duration
+    return {
+        "workers": workers,
+        "logins_per_second": logins_per_second,
+        "per_core": logins_per_second / max(workers, 1),
+        "rejected": sum(rejected for _, rejected in results),
+    }
+
+
+def main():
+    """Parse the command line and print one result line per pool size."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--method", default="pbkdf2:sha256:600000")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} core(s), {args.method}")
+    print("workers  logins/s  per_core  rejected")
+    for workers in args.workers:
+        result = benchmark(
+            args.method, workers, args.clients, args.max_pending, args.duration
+        )
+        print(
+            f"{result['workers']:<8} {result['logins_per_second']:<9.1f} "
+            f"{result['per_core']:<9.1f} {result['rejected']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Load benchmark of the SQL connection pool.
+
+Runs concurrent "requests" (check out a connection, run a query, hold the
+connection for a while to simulate the rest of the request) against the
+configured database, for several pool sizes, and prints the throughput and
+the time spent waiting for a connection.
+
+Usage:
+    python benchmarks/pool_benchmark.py --threads 32 --pool-sizes 2 5 10 20
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from sqlalchemy import create_engine, exc, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.sql_pool import sql_engine_options, sql_pool_metrics  # noqa: E402
+
+
+def run_requests(engine, query, hold_seconds, deadline, results):
+    """
+    Run requests on the engine until the deadline.
+
+    Args:
+        engine (Engine): The engine to query.
+        query (str): The SQL query run by each request.
+        hold_seconds (float): How long each request keeps its connection.
+        deadline (float): The ``time.perf_counter()`` value to stop at.
+        results (list): Receives the ``(completed, timeouts)`` counts of the thread.
+    """
+    statement = text(query)
+    completed = timeouts = 0
+    while time.perf_counter() < deadline:
+        try:
+            with engine.connect() as connection:
+                connection.execute(statement).fetchall()
+                time.sleep(hold_seconds)
+            completed += 1
+        except exc.TimeoutError:
+            timeouts += 1
+    results.append((completed, timeouts))
+
+
+def benchmark(database_uri, pool_size, threads, duration, query, hold_seconds):
+    """
+    Measure the throughput of the database for one pool size.
+
+    Args:
+        database_uri (str): The URI of the SQL database.
+        pool_size (int): The number of connections kept by the pool.
+        threads (int): The number of concurrent clients.
+        duration (float): The duration of the measure, in seconds.
+        query (str): The SQL query run by each request.
+        hold_seconds (float): How long each request keeps its connection.
+
+    Returns:
+        dict: The throughput and the pool metrics at the end of the run.
+    """
+    environ = dict(os.environ, SQLALCHEMY_POOL_SIZE=str(pool_size))
+    engine = create_engine(database_uri, **sql_engine_options(database_uri, environ))
+    results = []
+    deadline = time.perf_counter() + duration
+
+    workers = [
+        threading.Thread(
+            target=run_requests,
+            args=(engine, query, hold_seconds, deadline, results),
+        )
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    metrics = sql_pool_metrics(engine)
+    engine.dispose()
+    return {
+        "pool_size": pool_size,
+        "requests_per_second": sum(done for done, _ in results) / duration,
+        "timeouts": sum(timeouts for _, timeouts in results),
+        **metrics,
+    }
+
+
+def main():
+    """Parse the command line and print one result line per pool size."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--uri",
+        default=os.getenv("SQLALCHEMY_DATABASE_URI"),
+        help="Database URI (default: SQLALCHEMY_DATABASE_URI)",
+    )
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[2, 5, 10, 20])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("--query", default="SELECT 1")
+    parser.add_argument(
+        "--hold-ms",
+        type=float,
+        default=5.0,
+        help="Time each request keeps its connection after the query",
+    )
+    args = parser.parse_args()
+    if not args.uri:
+        parser.error("no database URI, set --uri or SQLALCHEMY_DATABASE_URI")
+
+    print("pool_size  req/s    timeouts  overflow  wait_max_s  wait_total_s")
+    for pool_size in args.pool_sizes:
+        result = benchmark(
+            args.uri,
+            pool_size,
+            args.threads,
+            args.duration,
+            args.query,
+            args.hold_ms / 1000,
+        )
+        print(
+            f"{result['pool_size']:<10} {result['requests_per_second']:<8.1f} "
+            f"{result['timeouts']:<9} {result.get('overflow', '-'):<9} "
+            f"{result.get('wait_seconds_max', '-'):<11} "
+            f"{result.get('wait_seconds_total', '-')}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 import os
 from flask import current_app
-from werkzeug.utils import secure_filename
 import pymysql  # type: ignore
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
+from services.metrics import Metrics
+from services.process_local import ProcessLocal
+from services.profiler import QueryProfiler
+from services.static_assets import StaticAssets
 
 pymysql.install_as_MySQLdb()
 
@@ -18,22 +21,128 @@ load_dotenv()
 db = SQLAlchemy()  # SQLAlchemy for database integration with SQL databases
 migrate = Migrate()  # Flask-Migrate to handle database migrations
 login_manager = LoginManager()  # Flask-Login for user authentication management
+query_profiler = QueryProfiler()  # SQL and MongoDB queries of each request
+metrics = Metrics()  # Prometheus metrics of the process
+static_assets = StaticAssets()  # Fingerprinted URLs and cache headers of static files
 
-# Récupérer les URI depuis les variables d'environnement
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 
-# Initialize MongoDB connection
-client = MongoClient(
-    MONGO_URI, tls=True, tlsAllowInvalidCertificates=True
-)  # Connect to MongoDB Atlas
-try:
-    client.admin.command("ping")  # Test MongoDB connection
-    print("MongoDB connection successful!")
-except ServerSelectionTimeoutError as e:
-    print(f"MongoDB connection error: {e}")
+class MongoExtension:
+    """
+    Lazily created, app-bound MongoDB client.
+
+    No connection is made at import time: the client is created on first use
+    with the ``MONGO_*`` settings of the application, once per process (see
+    ``ProcessLocal``).
+    """
+
+    def init_app(self, app):
+        """
+        Register the extension on a Flask application.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        app.config.setdefault("MONGO_URI", os.getenv("MONGO_URI"))
+        app.config.setdefault("MONGO_DB_NAME", os.getenv("MONGO_DB_NAME"))
+        app.config.setdefault("MONGO_MAX_POOL_SIZE", 50)
+        app.config.setdefault("MONGO_MIN_POOL_SIZE", 0)
+        app.config.setdefault("MONGO_MAX_IDLE_TIME_MS", 60000)
+        app.config.setdefault("MONGO_CONNECT_TIMEOUT_MS", 5000)
+        app.config.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+        app.config.setdefault("MONGO_SOCKET_TIMEOUT_MS", 20000)
+        app.config.setdefault("MONGO_TLS", True)
+        app.config.setdefault("MONGO_TLS_ALLOW_INVALID_CERTIFICATES", False)
+        app.extensions["mongo"] = ProcessLocal(lambda: self._create_client(app.config))
+
+    @staticmethod
+    def _create_client(config):
+        """Create a MongoClient from the application configuration, without connecting."""
+        options = {
+            "maxPoolSize": config["MONGO_MAX_POOL_SIZE"],
+            "minPoolSize": config["MONGO_MIN_POOL_SIZE"],
+            "maxIdleTimeMS": config["MONGO_MAX_IDLE_TIME_MS"],
+            "connectTimeoutMS": config["MONGO_CONNECT_TIMEOUT_MS"],
+            "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+            "socketTimeoutMS": config["MONGO_SOCKET_TIMEOUT_MS"],
+            "connect": False,  # Connect on the first operation, not now
+            "event_listeners": [query_profiler.mongo_listener, metrics.mongo_listener],
+        }
+        if config["MONGO_TLS"]:
+            options["tls"] = True
+            options["tlsAllowInvalidCertificates"] = config[
+                "MONGO_TLS_ALLOW_INVALID_CERTIFICATES"
+            ]
+        return MongoClient(config["MONGO_URI"], **options)
+
+    @property
+    def client(self):
+        """The MongoClient of the current application and process."""
+        return current_app.extensions["mongo"].get()
+
+    @property
+    def db(self):
+        """The MongoDB database of the current application."""
+        return self.client[current_app.config["MONGO_DB_NAME"]]
+
+    def ping(self):
+        """
+        Check that MongoDB answers, for readiness probes.
+
+        Returns:
+            tuple: True and None if MongoDB is reachable, False and the error otherwise.
+        """
+        try:
+            self.client.admin.command("ping")
+            return True, None
+        except PyMongoError as e:
+            return False, str(e)
+
+
+class MongoDatabaseProxy:
+    """
+    Proxy to the MongoDB database of the current application.
+
+    Collections (e.g. ``mongo_db.comments``) are resolved when they are
+    accessed, so modules can import ``mongo_db`` before any client exists.
+    """
+
+    def __getattr__(self, name):
+        """Return the collection (or database attribute) of the current application."""
+        if name.startswith("_"):
+            # Private and dunder lookups (copy, mock, pickle...) never hit the database
+            raise AttributeError(name)
+        return getattr(mongo.db, name)
+
+    def __getitem__(self, name):
+        """Return a collection of the current application's database."""
+        return mongo.db[name]
+
+
+mongo = MongoExtension()  # MongoDB client, created on first use
+mongo_db = MongoDatabaseProxy()  # Database of the current application
+
+
+# Function to create the MongoDB indexes
+def ensure_mongo_indexes():
+    """
+    Create the MongoDB indexes used by the comment queries.
+
+    Creating an index that already exists is a no-op, so this function can be
+    run at every deployment.
 
-mongo_db = client[MONGO_DB_NAME]  # Select the database from the environment variable
+    Returns:
+        list[str]: The names of the indexes ensured on the comments collection.
+    """
+    return [
+        # Comments of a recipe, sorted by date
+        mongo_db.comments.create_index(
+            [("recipe_id", ASCENDING), ("date", ASCENDING)], name="recipe_id_date"
+        ),
+        # Comments of a user
+        mongo_db.comments.create_index([("user_id", ASCENDING)], name="user_id"),
+        # Comments created or modified since a date (incremental backups)
+        mongo_db.comments.create_index([("date", ASCENDING)], name="date"),
+    ]
 
 
 # Function to configure Flask extensions
@@ -45,13 +154,22 @@ def configure_extensions(app):
         app (Flask): The Flask application to configure.
 
     This function sets up all necessary extensions for the app, including
-    database, migrations, user authentication, and file upload handling.
+    database, MongoDB, migrations, user authentication, and file upload handling.
+    Calling it again on the same application does nothing.
     """
+    if "radiscool" in app.extensions:
+        return
+    app.extensions["radiscool"] = True
+
     db.init_app(app)  # Initialize SQLAlchemy with the Flask application
     migrate.init_app(
         app, db
     )  # Initialize Flask-Migrate with the application and database
     login_manager.init_app(app)  # Initialize Flask-Login with the Flask application
+    mongo.init_app(app)  # Register the MongoDB settings, without connecting
+    static_assets.init_app(app)  # Fingerprinted static URLs with cache headers
+    query_profiler.init_app(app)  # Queries counted per request, slow requests logged
+    metrics.init_app(app)  # Prometheus metrics, exported on /metrics
     login_manager.login_view = (
         "users.login"  # Set the default login view for user authentication
     )
@@ -59,32 +177,3 @@ def configure_extensions(app):
     # Ensure the upload directory exists, otherwise create it
     if not os.path.exists(app.config["UPLOADED_PHOTOS_DEST"]):
         os.makedirs(app.config["UPLOADED_PHOTOS_DEST"])
-
-
-# Function to handle file uploads (images)
-def save_uploaded_file(image_file):
-    """
-    Save the uploaded image file to the designated directory.
-
-    Args:
-        image_file (FileStorage): The uploaded image file from the request.
-
-    Returns:
-        str: The filename of the saved image.
-    """
-    if image_file:
-        # Check if the file has a valid extension (you can extend this with more file types)
-        allowed_extensions = {"jpg", "jpeg", "png", "gif", "bmp", "tiff"}
-        filename = secure_filename(image_file.filename)
-        file_extension = filename.rsplit(".", 1)[-1].lower()
-
-        # Check if file extension is valid
-        if file_extension not in allowed_extensions:
-            raise ValueError("File type is not allowed. Only image files are accepted.")
-
-        # Save the file to the designated folder
-        file_path = os.path.join(current_app.config["UPLOADED_PHOTOS_DEST"], filename)
-        image_file.save(file_path)
-
-        return filename
-    return None
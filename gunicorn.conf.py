@@ -0,0 +1,44 @@
+"""
+Gunicorn settings of the web workers.
+
+The Prometheus metrics of the workers are aggregated through the files of
+the PROMETHEUS_MULTIPROC_DIR directory, which must be set in the environment
+of gunicorn (and of the scheduler process, to export the job metrics). When
+gunicorn starts, only the files of the processes no longer running are
+removed: a scheduler running meanwhile keeps its metrics.
+"""
+
+import glob
+import os
+
+
+def _is_running(pid):
+    """Tell whether a process exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running under another user
+    return True
+
+
+def on_starting(server):
+    """Remove the metrics of the dead processes, so the values of a previous run are not counted."""
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    # Files are named <metric type>_<pid>.db, e.g. gauge_livesum_1234.db
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        pid = os.path.basename(path)[: -len(".db")].rsplit("_", 1)[-1]
+        if not pid.isdigit() or not _is_running(int(pid)):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    """Remove the gauges of a dead worker from the aggregated metrics."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
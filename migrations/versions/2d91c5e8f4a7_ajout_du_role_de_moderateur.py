@@ -0,0 +1,30 @@
+"""Ajout du rôle de modérateur aux utilisateurs
+
+Revision ID: 2d91c5e8f4a7
+Revises: 7b2e4f9d1c36
+Create Date: 2026-10-18 22:03:17.904512
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "2d91c5e8f4a7"
+down_revision = "7b2e4f9d1c36"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Aucun utilisateur existant n'est modérateur
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("is_moderator", sa.Boolean(), nullable=False, server_default="0")
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_column("is_moderator")
@@ -0,0 +1,83 @@
+"""Ajout de l'index de recherche des ingrédients
+
+Revision ID: 3f9a62c1d8e7
+Revises: e41c8a7d05b9
+Create Date: 2026-10-18 13:05:29.760144
+
+La table est remplie à partir des ingrédients existants ; la commande
+``flask reindex-ingredients`` la reconstruit si besoin.
+
+"""
+
+import re
+import unicodedata
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f9a62c1d8e7"
+down_revision = "e41c8a7d05b9"
+branch_labels = None
+depends_on = None
+
+# Copie figée de services.search_service au moment de la migration
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 64
+
+# Nombre d'ingrédients indexés par insertion
+BATCH_SIZE = 1000
+
+
+def ingredient_tokens(name):
+    """Calcule les préfixes des mots normalisés d'un nom d'ingrédient."""
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    normalized = " ".join(re.split(r"[\W_]+", without_accents.casefold())).strip()
+
+    tokens = set()
+    for word in normalized.split():
+        longest = min(len(word), MAX_PREFIX_LENGTH)
+        for length in range(min(MIN_PREFIX_LENGTH, longest), longest + 1):
+            tokens.add(word[:length])
+    return tokens
+
+
+def upgrade():
+    ingredient_search_token = op.create_table(
+        "ingredient_search_token",
+        sa.Column("token", sa.String(length=64), nullable=False),
+        sa.Column("ingredient_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["ingredient_id"], ["ingredient.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("token", "ingredient_id"),
+    )
+    with op.batch_alter_table("ingredient_search_token", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_ingredient_search_token_ingredient_id"),
+            ["ingredient_id"],
+            unique=False,
+        )
+
+    # Indexe les ingrédients existants, par lots
+    ingredients = (
+        op.get_bind()
+        .execute(sa.text("SELECT id, name_ingredient FROM ingredient ORDER BY id"))
+        .fetchall()
+    )
+    for start in range(0, len(ingredients), BATCH_SIZE):
+        rows = [
+            {"token": token, "ingredient_id": ingredient_id}
+            for ingredient_id, name in ingredients[start : start + BATCH_SIZE]
+            for token in ingredient_tokens(name)
+        ]
+        if rows:
+            op.bulk_insert(ingredient_search_token, rows)
+
+
+def downgrade():
+    with op.batch_alter_table("ingredient_search_token", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_ingredient_search_token_ingredient_id"))
+
+    op.drop_table("ingredient_search_token")
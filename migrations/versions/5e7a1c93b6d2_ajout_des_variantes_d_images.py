@@ -0,0 +1,37 @@
+"""Ajout des variantes redimensionnées des images de recettes
+
+Revision ID: 5e7a1c93b6d2
+Revises: d2b8f61c4e07
+Create Date: 2026-10-18 18:36:47.902114
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5e7a1c93b6d2"
+down_revision = "d2b8f61c4e07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("recipe", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("image_thumb", sa.String(length=256), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column("image_card", sa.String(length=256), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column("image_full", sa.String(length=256), nullable=True)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("recipe", schema=None) as batch_op:
+        batch_op.drop_column("image_full")
+        batch_op.drop_column("image_card")
+        batch_op.drop_column("image_thumb")
@@ -0,0 +1,55 @@
+"""Journal des modifications de l'index des recettes en mémoire
+
+Revision ID: 7b2e4f9d1c36
+Revises: a83f0d2c7b15
+Create Date: 2026-10-18 21:12:40.518273
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7b2e4f9d1c36"
+down_revision = "a83f0d2c7b15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Les workers rejouent les modifications au lieu de recharger tout l'index
+    op.create_table(
+        "search_index_change",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("ingredient_id", sa.Integer(), nullable=True),
+        sa.Column("recipe_id", sa.Integer(), nullable=True),
+        sa.Column("removed", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sqlite_autoincrement=True,
+    )
+    with op.batch_alter_table("search_index_change", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_search_index_change_created_at"),
+            ["created_at"],
+            unique=False,
+        )
+
+    op.drop_table("search_index_version")
+
+
+def downgrade():
+    search_index_version = op.create_table(
+        "search_index_version",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # Une version différente force les workers à reconstruire leur index
+    op.bulk_insert(search_index_version, [{"id": 1, "version": 1}])
+
+    with op.batch_alter_table("search_index_change", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_search_index_change_created_at"))
+
+    op.drop_table("search_index_change")
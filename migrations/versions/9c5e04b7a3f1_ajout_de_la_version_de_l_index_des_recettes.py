@@ -0,0 +1,31 @@
+"""Ajout de la version de l'index des recettes en mémoire
+
+Revision ID: 9c5e04b7a3f1
+Revises: 3f9a62c1d8e7
+Create Date: 2026-10-18 15:21:52.334810
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9c5e04b7a3f1"
+down_revision = "3f9a62c1d8e7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    search_index_version = op.create_table(
+        "search_index_version",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.bulk_insert(search_index_version, [{"id": 1, "version": 0}])
+
+
+def downgrade():
+    op.drop_table("search_index_version")
@@ -0,0 +1,40 @@
+"""Ajout du compteur de références des images stockées par contenu
+
+Revision ID: a83f0d2c7b15
+Revises: 5e7a1c93b6d2
+Create Date: 2026-10-18 19:48:05.173640
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a83f0d2c7b15"
+down_revision = "5e7a1c93b6d2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "stored_image",
+        sa.Column("image", sa.String(length=256), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("image"),
+    )
+
+    # Compte les références des images déjà téléchargées
+    op.execute(
+        """
+        INSERT INTO stored_image (image, ref_count)
+        SELECT image, COUNT(*) FROM recipe
+        WHERE image IS NOT NULL
+        GROUP BY image
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("stored_image")
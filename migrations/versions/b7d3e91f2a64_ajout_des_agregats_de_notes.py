@@ -0,0 +1,47 @@
+"""Ajout des agrégats de notes à la table Recipe
+
+Revision ID: b7d3e91f2a64
+Revises: 6c0a1581c026
+Create Date: 2026-10-18 09:12:41.503218
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b7d3e91f2a64"
+down_revision = "6c0a1581c026"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("recipe", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("rating_count", sa.Integer(), nullable=False, server_default="0")
+        )
+        batch_op.add_column(
+            sa.Column("rating_sum", sa.Integer(), nullable=False, server_default="0")
+        )
+
+    # Initialise les agrégats à partir des notes existantes
+    op.execute(
+        """
+        UPDATE recipe SET
+            rating_count = (
+                SELECT COUNT(*) FROM rating WHERE rating.recipe_id = recipe.id
+            ),
+            rating_sum = (
+                SELECT COALESCE(SUM(stars), 0) FROM rating
+                WHERE rating.recipe_id = recipe.id
+            )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("recipe", schema=None) as batch_op:
+        batch_op.drop_column("rating_sum")
+        batch_op.drop_column("rating_count")
@@ -0,0 +1,44 @@
+"""Ajout des dates de modification pour les sauvegardes incrémentales
+
+Revision ID: d2b8f61c4e07
+Revises: 9c5e04b7a3f1
+Create Date: 2026-10-18 17:04:12.518263
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d2b8f61c4e07"
+down_revision = "9c5e04b7a3f1"
+branch_labels = None
+depends_on = None
+
+TABLES = ("user", "recipe", "ingredient", "recipe_ingredient", "rating")
+
+
+def upgrade():
+    # Les lignes existantes prennent la date de la migration : la prochaine
+    # sauvegarde complète les couvre
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column(
+                    "updated_at",
+                    sa.DateTime(),
+                    server_default=sa.text("CURRENT_TIMESTAMP"),
+                    nullable=False,
+                )
+            )
+            batch_op.create_index(
+                batch_op.f(f"ix_{table}_updated_at"), ["updated_at"], unique=False
+            )
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f"ix_{table}_updated_at"))
+            batch_op.drop_column("updated_at")
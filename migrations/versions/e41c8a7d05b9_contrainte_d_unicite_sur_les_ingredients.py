@@ -0,0 +1,62 @@
+"""Contrainte d'unicité sur le nom des ingrédients
+
+Revision ID: e41c8a7d05b9
+Revises: b7d3e91f2a64
+Create Date: 2026-10-18 10:47:05.918336
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e41c8a7d05b9"
+down_revision = "b7d3e91f2a64"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # Fusionne les ingrédients en double avant de poser la contrainte d'unicité.
+    # Les doublons sont comparés par la base, avec la collation de la colonne :
+    # sous MySQL, "creme", "Crème" et "creme " sont le même nom pour l'index unique.
+    duplicates = bind.execute(
+        sa.text(
+            "SELECT duplicate.id, MIN(kept.id) FROM ingredient AS duplicate "
+            "JOIN ingredient AS kept "
+            "ON kept.name_ingredient = duplicate.name_ingredient "
+            "GROUP BY duplicate.id HAVING MIN(kept.id) < duplicate.id"
+        )
+    ).fetchall()
+    for ingredient_id, kept_id in duplicates:
+        params = {"kept": kept_id, "duplicate": ingredient_id}
+        # Supprime les associations qui existent déjà avec l'ingrédient conservé
+        bind.execute(
+            sa.text(
+                "DELETE FROM recipe_ingredient WHERE ingredient_id = :duplicate "
+                "AND recipe_id IN (SELECT recipe_id FROM (SELECT recipe_id "
+                "FROM recipe_ingredient WHERE ingredient_id = :kept) AS kept)"
+            ),
+            params,
+        )
+        bind.execute(
+            sa.text(
+                "UPDATE recipe_ingredient SET ingredient_id = :kept "
+                "WHERE ingredient_id = :duplicate"
+            ),
+            params,
+        )
+        bind.execute(sa.text("DELETE FROM ingredient WHERE id = :duplicate"), params)
+
+    with op.batch_alter_table("ingredient", schema=None) as batch_op:
+        batch_op.create_unique_constraint(
+            "uq_ingredient_name_ingredient", ["name_ingredient"]
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("ingredient", schema=None) as batch_op:
+        batch_op.drop_constraint("uq_ingredient_name_ingredient", type_="unique")
@@ -1,6 +1,37 @@
 from extensions import mongo_db
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ASCENDING
+
+# Fields of a comment read by the templates (the _id is always returned)
+COMMENT_PROJECTION = {"recipe_id": 1, "user_id": 1, "text": 1, "date": 1}
+
+EPOCH = datetime(1970, 1, 1)  # MongoDB dates are naive UTC datetimes
+
+
+def encode_comment_cursor(comment):
+    """
+    Encode the position of a comment in the (date, _id) order as a cursor.
+
+    :param comment: The comment document.
+    :return: A cursor of the form "<milliseconds since epoch>-<ObjectId>".
+    """
+    milliseconds = (comment["date"] - EPOCH) // timedelta(milliseconds=1)
+    return f"{milliseconds}-{comment['_id']}"
+
+
+def decode_comment_cursor(cursor):
+    """
+    Decode a cursor built by encode_comment_cursor.
+
+    :param cursor: The cursor to decode.
+    :return: The (date, ObjectId) pair of the comment.
+    :raises ValueError: If the cursor is malformed.
+    """
+    milliseconds, _, object_id = cursor.partition("-")
+    if not ObjectId.is_valid(object_id):
+        raise ValueError("Invalid comment cursor")
+    return EPOCH + timedelta(milliseconds=int(milliseconds)), ObjectId(object_id)
 
 
 class CommentNoSQL:
@@ -39,10 +70,88 @@ class CommentNoSQL:
         Retrieve all comments for a specific recipe.
 
         :param recipe_id: The ID of the recipe for which comments are retrieved.
-        :return: A list of comments associated with the specified recipe ID.
+        :return: A list of comments associated with the specified recipe ID, sorted by date.
         """
-        # Return list of comments for a recipe from the MongoDB database
-        return list(mongo_db.comments.find({"recipe_id": recipe_id}))
+        # Return list of comments for a recipe from the MongoDB database, oldest first.
+        # The sort is served by the (recipe_id, date) index.
+        return list(
+            mongo_db.comments.find({"recipe_id": recipe_id}, COMMENT_PROJECTION).sort(
+                "date", ASCENDING
+            )
+        )
+
+    @staticmethod
+    def get_comments_page(recipe_id, after=None, limit=20):
+        """
+        Retrieve one page of the comments of a recipe using keyset pagination.
+
+        Comments are ordered by (date, _id), and the page starts after the
+        comment designated by the cursor, so loading a page never skips over
+        the previous ones with an offset.
+
+        :param recipe_id: The ID of the recipe for which comments are retrieved.
+        :param after: Cursor of the last comment already loaded (None for the first page).
+        :param limit: The maximum number of comments to return.
+        :return: The comments of the page and the cursor of the next page (None if last).
+        :raises ValueError: If the cursor is malformed.
+        """
+        query = {"recipe_id": recipe_id}
+        if after:
+            date, object_id = decode_comment_cursor(after)
+            query["$or"] = [
+                {"date": {"$gt": date}},
+                {"date": date, "_id": {"$gt": object_id}},
+            ]
+
+        # Fetch one extra comment to know whether there is a next page
+        comments = list(
+            mongo_db.comments.find(query, COMMENT_PROJECTION)
+            .sort([("date", ASCENDING), ("_id", ASCENDING)])
+            .limit(limit + 1)
+        )
+        if len(comments) > limit:
+            comments = comments[:limit]
+            return comments, encode_comment_cursor(comments[-1])
+        return comments, None
+
+    @staticmethod
+    def summarize_comments(recipe_ids):
+        """
+        Count the comments of each recipe and find the date of the latest one.
+
+        The summary of a recipe changes whenever one of its comments is added,
+        edited (its date is refreshed) or deleted, so it can validate a cached
+        page or fragment.
+
+        :param recipe_ids: The IDs of the recipes.
+        :return: Mapping of recipe ID to its number of comments and the date of
+            the latest one; recipes without comments are missing.
+        """
+        summary = mongo_db.comments.aggregate(
+            [
+                {"$match": {"recipe_id": {"$in": list(recipe_ids)}}},
+                {
+                    "$group": {
+                        "_id": "$recipe_id",
+                        "count": {"$sum": 1},
+                        "last": {"$max": "$date"},
+                    }
+                },
+            ]
+        )
+        return {row["_id"]: (row["count"], row["last"]) for row in summary}
+
+    @staticmethod
+    def delete_recipe_comments(recipe_ids):
+        """
+        Delete all the comments of several recipes.
+
+        :param recipe_ids: The IDs of the recipes.
+        :return: The number of comments deleted.
+        """
+        # A single statement, served by the (recipe_id, date) index
+        result = mongo_db.comments.delete_many({"recipe_id": {"$in": list(recipe_ids)}})
+        return result.deleted_count
 
     @staticmethod
     def delete_comment(comment_id):
@@ -50,10 +159,13 @@ class CommentNoSQL:
         Delete a specific comment by its MongoDB ObjectId.
 
         :param comment_id: The ID of the comment to be deleted.
-        :return: The result of the delete operation from MongoDB.
+        :return: The deleted comment (its _id and recipe_id), or None if not found.
         """
-        # Delete a comment by its MongoDB ObjectId
-        return mongo_db.comments.delete_one({"_id": ObjectId(comment_id)})
+        # Delete a comment by its MongoDB ObjectId, returning its recipe in the
+        # same round trip
+        return mongo_db.comments.find_one_and_delete(
+            {"_id": ObjectId(comment_id)}, projection={"recipe_id": 1}
+        )
 
     @staticmethod
     def update_comment(comment_id, new_text):
@@ -62,12 +174,13 @@ class CommentNoSQL:
 
         :param comment_id: The ID of the comment to be updated.
         :param new_text: The new text that will replace the current comment.
-        :return: The result of the update operation from MongoDB.
+        :return: The updated comment (its _id and recipe_id), or None if not found.
         """
         # Update the comment text and date
-        return mongo_db.comments.update_one(
+        return mongo_db.comments.find_one_and_update(
             {"_id": ObjectId(comment_id)},
             {
                 "$set": {"text": new_text, "date": datetime.utcnow()}
             },  # Update with new text and timestamp
+            projection={"recipe_id": 1},
         )
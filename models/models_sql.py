@@ -1,4 +1,6 @@
-from extensions import db, mongo_db
+from datetime import datetime
+from extensions import db
+from models.models_nosql import CommentNoSQL
 from flask_login import UserMixin
 
 
@@ -16,6 +18,15 @@ class RecipeIngredient(db.Model):
     )
     quantity = db.Column(db.Float)  # Quantity of the ingredient in the recipe
     unit = db.Column(db.String(20))  # Unit of measurement for the ingredient
+    # Last modification, read by the incremental backups
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=db.func.current_timestamp(),
+        index=True,
+    )
 
     # Relationships to Recipe and Ingredient models
     recipe = db.relationship(
@@ -37,27 +48,45 @@ class Recipe(db.Model):
         db.Integer, db.ForeignKey("user.id")
     )  # User who created the recipe
     image = db.Column(db.String(256))  # Image associated with the recipe
+    # Resized WebP/JPEG variants of the image, generated in the background
+    image_thumb = db.Column(db.String(256))
+    image_card = db.Column(db.String(256))  # Displayed by the recipe listing
+    image_full = db.Column(db.String(256))  # Displayed by the recipe page
+    # Rating aggregates maintained on write by services.recipe_service.rate_recipe
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Last modification, read by the incremental backups
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=db.func.current_timestamp(),
+        index=True,
+    )
 
     # Relationship with RecipeIngredient model
     ingredients = db.relationship("RecipeIngredient", back_populates="recipe")
 
     def get_comments(self):
         """Retrieve all comments associated with this recipe."""
-        recipe_comments = mongo_db.comments.find({"recipe_id": self.id})
-        comments_with_usernames = []
+        recipe_comments = CommentNoSQL.get_comments_by_recipe(self.id)
+
+        # Resolve the authors of every comment with a single query
+        user_ids = {comment.get("user_id") for comment in recipe_comments}
+        usernames = dict(
+            db.session.query(User.id, User.username).filter(User.id.in_(user_ids))
+        )
         for comment in recipe_comments:
-            user = User.query.get(comment["user_id"])
-            comment["username"] = user.username if user else "Unknown user"
-            comments_with_usernames.append(comment)
-        return comments_with_usernames
+            comment["username"] = usernames.get(comment.get("user_id"), "Unknown user")
+        return recipe_comments
 
     @property
     def average_rating(self):
-        """Calculate the average rating for this recipe."""
-        ratings = Rating.query.filter_by(recipe_id=self.id).all()
-        if not ratings:
+        """Calculate the average rating for this recipe from its stored aggregates."""
+        if not self.rating_count:
             return None  # No ratings yet
-        return sum(r.stars for r in ratings) / len(ratings)
+        return self.rating_sum / self.rating_count
 
 
 class Ingredient(db.Model):
@@ -66,13 +95,70 @@ class Ingredient(db.Model):
     __tablename__ = "ingredient"
     id = db.Column(db.Integer, primary_key=True)
     name_ingredient = db.Column(
-        db.String(128), nullable=False
+        db.String(128), nullable=False, unique=True
     )  # Name of the ingredient
+    # Last modification, read by the incremental backups
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=db.func.current_timestamp(),
+        index=True,
+    )
 
     # Relationship with RecipeIngredient model
     recipes = db.relationship("RecipeIngredient", back_populates="ingredient")
 
 
+class IngredientSearchToken(db.Model):
+    """Represents a normalized word prefix of an ingredient name, used by the search index."""
+
+    __tablename__ = "ingredient_search_token"
+
+    # Lookups by token are served by the primary key
+    token = db.Column(
+        db.String(64), primary_key=True
+    )  # Accent-folded, lower-cased prefix
+    ingredient_id = db.Column(
+        db.Integer,
+        db.ForeignKey("ingredient.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+
+
+class SearchIndexChange(db.Model):
+    """Logs the changes of recipe ingredients, replayed by the in-memory search indexes."""
+
+    __tablename__ = "search_index_change"
+    # AUTOINCREMENT: SQLite would otherwise reuse the IDs of pruned rows
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = db.Column(
+        db.Integer, primary_key=True, autoincrement=True
+    )  # Order of the changes
+    ingredient_id = db.Column(db.Integer, nullable=True)  # NULL: rebuild the index
+    recipe_id = db.Column(db.Integer, nullable=True)  # NULL: rebuild the index
+    removed = db.Column(
+        db.Boolean, nullable=False, default=False
+    )  # True if the pair was removed
+    created_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, index=True
+    )  # Used to prune the log and to skip rolled back IDs
+
+
+class StoredImage(db.Model):
+    """Represents an uploaded image file, stored once under the hash of its content."""
+
+    __tablename__ = "stored_image"
+    image = db.Column(
+        db.String(256), primary_key=True
+    )  # Static path, e.g. "uploads/images/<sha256>.jpg"
+    ref_count = db.Column(
+        db.Integer, nullable=False, default=0
+    )  # Number of recipes using the image
+
+
 class User(UserMixin, db.Model):
     """Represents a user of the application."""
 
@@ -81,6 +167,19 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), index=True, unique=True)  # Unique username
     email = db.Column(db.String(120), index=True, unique=True)  # Unique email address
     password = db.Column(db.String(255))  # Hashed password for the user
+    # Moderators can delete the recipes of other users
+    is_moderator = db.Column(
+        db.Boolean, nullable=False, default=False, server_default="0"
+    )
+    # Last modification, read by the incremental backups
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=db.func.current_timestamp(),
+        index=True,
+    )
     recipes = db.relationship(
         "Recipe", backref="user", lazy=True
     )  # Recipes created by the user
@@ -101,3 +200,12 @@ class Rating(db.Model):
     user_id = db.Column(
         db.Integer, db.ForeignKey("user.id"), nullable=False
     )  # User who gave the rating
+    # Last modification, read by the incremental backups
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=db.func.current_timestamp(),
+        index=True,
+    )
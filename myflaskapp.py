@@ -1,12 +1,37 @@
 import os
+import signal
 import subprocess  # nosec B404
-from flask import Flask, render_template
+import sys
+import time
+import click
+from flask import Flask, jsonify, render_template
 from flask_apscheduler import APScheduler
-from extensions import db, migrate, login_manager, configure_extensions
+from extensions import (
+    db,
+    login_manager,
+    configure_extensions,
+    ensure_mongo_indexes,
+    mongo,
+    metrics,
+)
 from dotenv import load_dotenv
-from models.models_sql import User
 from routes.recipes_bp import recipes
 from routes.users_bp import users
+from routes.api_bp import api
+from services.job_lock import job_lock
+from services.recipe_service import reconcile_rating_aggregates
+from services.sql_pool import sql_engine_options, sql_pool_metrics
+from services.search_service import rebuild_search_index
+from services.recipe_index import prune_index_changes
+from services.backup_service import (
+    apply_incremental_backup,
+    restore_full_backup,
+    run_backup,
+    run_incremental_backup,
+)
+from services.user_cache import load_cached_user
+from services.image_service import process_missing_variants
+from services.upload_service import reconcile_stored_images
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -23,11 +48,65 @@ class Config(object):
         SECRET_KEY (str): Secret key for session management.
         SQLALCHEMY_DATABASE_URI (str): Database URI for SQLAlchemy.
         SQLALCHEMY_TRACK_MODIFICATIONS (bool): Disable SQLAlchemy modification tracking.
+        SQLALCHEMY_ENGINE_OPTIONS (dict): Connection pool settings, read from the
+            SQLALCHEMY_POOL_SIZE, SQLALCHEMY_MAX_OVERFLOW, SQLALCHEMY_POOL_TIMEOUT,
+            SQLALCHEMY_POOL_RECYCLE, SQLALCHEMY_POOL_PRE_PING, SQLALCHEMY_CONNECT_TIMEOUT
+            and SQLALCHEMY_STATEMENT_TIMEOUT_MS environment variables.
         UPLOADED_PHOTOS_DEST (str): Directory where uploaded photos will be stored.
-        ALLOWED_EXTENSIONS (set): Set of allowed file extensions for uploads.
+        ALLOWED_EXTENSIONS (set): Set of allowed file extensions for uploads; the content
+            must also be a PNG, JPEG or GIF image (checked from its magic bytes).
         MONGO_URI (str): URI for MongoDB connection.
+        MONGO_DB_NAME (str): Name of the MongoDB database.
+        MONGO_MAX_POOL_SIZE (int): Maximum number of MongoDB connections per worker process.
+        MONGO_MIN_POOL_SIZE (int): Number of MongoDB connections kept open when idle.
+        MONGO_MAX_IDLE_TIME_MS (int): Delay before an idle MongoDB connection is closed.
+        MONGO_CONNECT_TIMEOUT_MS (int): Timeout to open a MongoDB connection.
+        MONGO_SERVER_SELECTION_TIMEOUT_MS (int): Timeout to find an available MongoDB server.
+        MONGO_SOCKET_TIMEOUT_MS (int): Timeout of a MongoDB operation on the network.
+        MONGO_TLS (bool): Connect to MongoDB with TLS.
+        MONGO_TLS_ALLOW_INVALID_CERTIFICATES (bool): Accept invalid MongoDB TLS certificates.
         MAX_CONTENT_LENGTH (int): Maximum size for file uploads (5 MB).
+        IMAGE_MAX_BYTES (int): Maximum size of an uploaded image, checked while it is stored.
+        IMAGE_MAX_DIMENSION (int): Maximum width and height of an uploaded image, in pixels.
+        IMAGE_MAX_PIXELS (int): Maximum number of pixels of an uploaded image.
+        STATIC_MAX_AGE (int): Cache lifetime of the static files requested with their fingerprint.
+        STATIC_ACCEL_REDIRECT (str): Internal nginx location serving the static folder through
+            X-Accel-Redirect (e.g. "/_static/"), unset to send the files from the workers.
+        IMAGE_WORKERS (int): Number of threads resizing uploaded images, per worker process.
+        PASSWORD_HASH_METHOD (str): werkzeug hashing method, with its cost (e.g.
+            "pbkdf2:sha256:600000"); older hashes are upgraded at the next login.
+        PASSWORD_SALT_LENGTH (int): Length of the salt of the password hashes.
+        PASSWORD_HASH_WORKERS (int): Processes hashing passwords, per worker process (0 to
+            hash in the request thread).
+        PASSWORD_HASH_MAX_PENDING (int): Password operations queued or running on the host,
+            across the worker processes, before the new ones are rejected with a 503; lower
+            than the number of gunicorn workers, so logins cannot tie up all of them.
+        PASSWORD_HASH_TIMEOUT (float): Seconds a request waits for its password operation.
+        IMAGE_QUALITY (int): WebP/JPEG quality of the resized image variants.
+        FRAGMENT_CACHE_URL (str): Redis URL shared by the workers for the rendered recipe
+            cards ("memory://" for an in-process stand-in); unset, each worker caches its own.
+        HTTP_CACHE_SHARED_MAX_AGE (int): Seconds a CDN or reverse proxy may keep the recipe
+            pages served to anonymous visitors (s-maxage).
+        QUERY_PROFILER_ENABLED (bool): Count and time the SQL and MongoDB queries of each request.
+        QUERY_PROFILER_SERVER_TIMING (bool): Send the query counts and times in a Server-Timing
+            header (always sent in debug mode).
+        SLOW_REQUEST_MAX_QUERIES (int): Number of queries above which a request is logged with
+            its statements.
+        SLOW_REQUEST_QUERY_MS (float): Time spent in queries above which a request is logged.
+        METRICS_ENABLED (bool): Export the Prometheus metrics on /metrics; with several
+            worker processes, PROMETHEUS_MULTIPROC_DIR must name a directory they share.
+        METRICS_TOKEN (str): Bearer token required by /metrics and /metrics/db-pool; both
+            answer 403 while it is not set.
+        RECIPES_PER_PAGE (int): Default number of recipes per listing page.
+        RECIPES_MAX_PER_PAGE (int): Maximum page size a client may request.
+        COMMENTS_PER_PAGE (int): Number of comments rendered with a recipe and per "load more".
+        COMMENTS_MAX_PER_PAGE (int): Maximum comment page size a client may request.
+        BACKUP_DIR (str): Directory where the backup archives are written.
+        BACKUP_RETENTION_DAYS (float): Number of days backup archives are kept.
+        BACKUP_COMPRESSION_LEVEL (int): Gzip compression level of the backups (1 to 9).
+        BACKUP_INCREMENTAL_OVERLAP (int): Seconds re-exported before the last checkpoint.
         SCHEDULER_API_ENABLED (bool): Enable APScheduler API.
+        SCHEDULER_JOB_DEFAULTS (dict): Run missed jobs once, never two runs of a job at a time.
         SERVER_NAME (str): Server name for URL generation.
         PREFERRED_URL_SCHEME (str): Preferred URL scheme (HTTP/HTTPS).
     """
@@ -35,13 +114,84 @@ class Config(object):
     SECRET_KEY = os.getenv("SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = os.getenv("SQLALCHEMY_DATABASE_URI")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = sql_engine_options(SQLALCHEMY_DATABASE_URI)
     UPLOADED_PHOTOS_DEST = os.path.join(basedir, "static", "uploads", "images")
     ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
     MONGO_URI = os.getenv("MONGO_URI")
+    MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+
+    # MongoDB client, created lazily by each worker process
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+        os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+    )
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+    MONGO_TLS = os.getenv("MONGO_TLS", "true").lower() == "true"
+    MONGO_TLS_ALLOW_INVALID_CERTIFICATES = (
+        os.getenv("MONGO_TLS_ALLOW_INVALID_CERTIFICATES", "true").lower() == "true"
+    )
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # Limit uploads to 5 MB
 
+    # Uploaded images, validated while they are streamed to disk
+    IMAGE_MAX_BYTES = MAX_CONTENT_LENGTH
+    IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "8000"))
+    IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "40000000"))
+
+    # Static files: fingerprinted URLs, cached for a year, optionally sent by nginx
+    STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+    STATIC_ACCEL_REDIRECT = os.getenv("STATIC_ACCEL_REDIRECT")
+
+    # Background generation of the resized image variants
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+
+    # Password hashing, in a process pool bounded per host
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+    PASSWORD_SALT_LENGTH = int(os.getenv("PASSWORD_SALT_LENGTH", "16"))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "1"))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "2"))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+    # Cache of the rendered recipe cards, optionally shared through Redis
+    FRAGMENT_CACHE_URL = os.getenv("FRAGMENT_CACHE_URL")
+
+    # Conditional GET of the recipe pages for anonymous visitors
+    HTTP_CACHE_SHARED_MAX_AGE = int(os.getenv("HTTP_CACHE_SHARED_MAX_AGE", "60"))
+
+    # Queries of each request: Server-Timing header and log of the slow requests
+    QUERY_PROFILER_ENABLED = (
+        os.getenv("QUERY_PROFILER_ENABLED", "true").lower() == "true"
+    )
+    QUERY_PROFILER_SERVER_TIMING = (
+        os.getenv("QUERY_PROFILER_SERVER_TIMING", "false").lower() == "true"
+    )
+    SLOW_REQUEST_MAX_QUERIES = int(os.getenv("SLOW_REQUEST_MAX_QUERIES", "30"))
+    SLOW_REQUEST_QUERY_MS = float(os.getenv("SLOW_REQUEST_QUERY_MS", "250"))
+
+    # Prometheus metrics (aggregated over the processes of PROMETHEUS_MULTIPROC_DIR)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+    # Keyset pagination of the recipe listing and search results
+    RECIPES_PER_PAGE = int(os.getenv("RECIPES_PER_PAGE", "24"))
+    RECIPES_MAX_PER_PAGE = int(os.getenv("RECIPES_MAX_PER_PAGE", "100"))
+
+    # Keyset pagination of the comments of a recipe
+    COMMENTS_PER_PAGE = int(os.getenv("COMMENTS_PER_PAGE", "20"))
+    COMMENTS_MAX_PER_PAGE = int(os.getenv("COMMENTS_MAX_PER_PAGE", "100"))
+
+    # Backups (run by the scheduler worker)
+    BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(basedir, "backups"))
+    BACKUP_RETENTION_DAYS = float(os.getenv("BACKUP_RETENTION_DAYS", "14"))
+    BACKUP_COMPRESSION_LEVEL = int(os.getenv("BACKUP_COMPRESSION_LEVEL", "6"))
+    BACKUP_INCREMENTAL_OVERLAP = int(os.getenv("BACKUP_INCREMENTAL_OVERLAP", "300"))
+
     # APScheduler configuration
-    SCHEDULER_API_ENABLED = True
+    SCHEDULER_API_ENABLED = False  # The scheduler does not run in the web workers
+    SCHEDULER_JOB_DEFAULTS = {"coalesce": True, "max_instances": 1}
 
     # Additional configurations
     PREFERRED_URL_SCHEME = "http"  # Change to "https" if your app uses HTTPS
@@ -50,17 +200,15 @@ class Config(object):
 # App Initialization
 app = Flask(__name__)  # Create the Flask app
 app.config.from_object(Config)  # Load configuration from the Config class
-migrate.init_app(app, db)  # Initialize database migrations
-login_manager.init_app(app)  # Initialize login manager
 
-# Configure extensions
-configure_extensions(app)  # Set up extensions like database, uploads, etc.
+# Configure extensions (database, migrations, login manager, uploads, etc.)
+configure_extensions(app)
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Load a user given their user_id."""
-    return User.query.get(int(user_id))
+    """Load a user given their user_id, from the user profile cache."""
+    return load_cached_user(int(user_id))
 
 
 # Blueprint Registration
@@ -68,6 +216,7 @@ def load_user(user_id):
 # Register blueprints for the routes (recipes and users)
 app.register_blueprint(recipes, url_prefix="/recipes")
 app.register_blueprint(users, url_prefix="/users")
+app.register_blueprint(api, url_prefix="/api/v1")
 
 
 # Routes
@@ -77,6 +226,24 @@ def home():
     return render_template("home.html")
 
 
+# Readiness probe: the process is ready once MongoDB answers
+@app.route("/ready")
+def ready():
+    """Report whether the application can reach MongoDB."""
+    reachable, error = mongo.ping()
+    if not reachable:
+        return jsonify({"status": "unavailable", "mongo": error}), 503
+    return jsonify({"status": "ok"})
+
+
+# Connection pool metrics of the current worker process
+@app.route("/metrics/db-pool")
+def db_pool_metrics():
+    """Report the usage of the SQL connection pool of this worker."""
+    metrics.check_access()
+    return jsonify({"pid": os.getpid(), **sql_pool_metrics(db.engine)})
+
+
 # Handle large file uploads gracefully
 @app.errorhandler(413)
 def request_entity_too_large(error):
@@ -84,81 +251,254 @@ def request_entity_too_large(error):
     return "The file is too large. The maximum size is 5 MB.", 413
 
 
-# Paths to backup tools (mysqldump and mongodump)
+# CLI Commands
+@app.cli.command("reconcile-ratings")
+def reconcile_ratings_command():
+    """Recompute the rating aggregates stored on recipes from the rating table."""
+    result = reconcile_rating_aggregates()
+    if result["error"]:
+        raise click.ClickException(result["message"])
+    click.echo(f"{result['message']} {result['updated']} recipe(s) fixed.")
+
+
+@app.cli.command("reindex-ingredients")
+def reindex_ingredients_command():
+    """Rebuild the ingredient search index from the ingredient table."""
+    result = rebuild_search_index()
+    if result["error"]:
+        raise click.ClickException(result["message"])
+    click.echo(f"{result['message']} {result['indexed']} ingredient(s) indexed.")
+
+
+@app.cli.command("mongo-indexes")
+def mongo_indexes_command():
+    """Create the MongoDB indexes used by the comment queries."""
+    for index_name in ensure_mongo_indexes():
+        click.echo(f"Index ensured: {index_name}")
+
+
+@app.cli.command("process-images")
+def process_images_command():
+    """Generate the resized variants of the recipe images that have none."""
+    result = process_missing_variants()
+    if result["error"]:
+        raise click.ClickException(result["message"])
+    click.echo(f"{result['message']} {result['processed']} image(s) processed.")
+
+
+@app.cli.command("gc-images")
+def gc_images_command():
+    """Recount the image references and delete the images no recipe uses."""
+    result = reconcile_stored_images()
+    if result["error"]:
+        raise click.ClickException(result["message"])
+    click.echo(f"{result['message']} {result['deleted']} image(s) deleted.")
+
+
+@app.cli.command("mongo-ping")
+def mongo_ping_command():
+    """Check that MongoDB is reachable with the configured settings."""
+    reachable, error = mongo.ping()
+    if not reachable:
+        raise click.ClickException(f"MongoDB is unreachable: {error}")
+    click.echo("MongoDB connection successful!")
+
+
+# Paths to backup tools (mysqldump and mongodump) and restore tools
 mysqldump_path = "/usr/bin/mysqldump"
 mongodump_path = "/usr/bin/mongodump"
+mysql_path = "/usr/bin/mysql"
+mongorestore_path = "/usr/bin/mongorestore"
 
 
 # Backup Functions
 def backup_mysql():
-    """Backup the MySQL database."""
+    """Backup the MySQL database into a compressed, timestamped archive."""
     db_name = os.getenv("MYSQL_DB_NAME")
     db_user = os.getenv("MYSQL_USER")
     db_password = os.getenv("MYSQL_PASSWORD")
-    backup_dir = os.path.join(basedir, "backups")
-    os.makedirs(
-        backup_dir, exist_ok=True
-    )  # Create the backup directory if it doesn't exist
-    output_file = os.path.join(backup_dir, f"mysql_backup_{db_name}.sql")
 
-    try:
-        # Using subprocess to run the backup command securely
-        with open(output_file, "w") as outfile:
-            subprocess.run(
-                [mysqldump_path, "-u", db_user, f"-p{db_password}", db_name],
-                stdout=outfile,
-                check=True,
-            )  # nosec B603 B607
-        print(f"MySQL backup saved to {output_file}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during MySQL backup: {e}")
+    # --single-transaction and --quick stream a consistent dump row by row
+    result = run_backup(
+        f"mysql_{db_name}",
+        [
+            mysqldump_path,
+            "--single-transaction",
+            "--quick",
+            "-u",
+            db_user,
+            f"-p{db_password}",
+            db_name,
+        ],
+        "sql",
+        checkpoint="sql",
+    )
+    print(result["message"])
+    return result
 
 
 def backup_mongo():
-    """Backup the MongoDB database."""
+    """Backup the MongoDB database into a compressed, timestamped archive."""
     mongo_uri = os.getenv("MONGO_URI")
     db_name = os.getenv("MONGO_DB_NAME")
-    backup_dir = os.path.join(basedir, "backups")
-    os.makedirs(
-        backup_dir, exist_ok=True
-    )  # Create the backup directory if it doesn't exist
-    output_dir = os.path.join(backup_dir, f"mongo_backup_{db_name}")
 
-    try:
-        # Using subprocess to run the backup command securely
-        subprocess.run(
-            [
-                mongodump_path,
-                f"--uri={mongo_uri}",
-                f"--db={db_name}",
-                f"--out={output_dir}",
-            ],
-            check=True,
-        )  # nosec B603 B607
-        print(f"MongoDB backup saved to {output_dir}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during MongoDB backup: {e}")
+    # --archive without a file name writes the dump to the standard output
+    result = run_backup(
+        f"mongo_{db_name}",
+        [mongodump_path, f"--uri={mongo_uri}", f"--db={db_name}", "--archive"],
+        "archive",
+        checkpoint="mongo",
+    )
+    print(result["message"])
+    return result
+
+
+def backup_incremental():
+    """Backup the SQL rows and comments modified since the last backup."""
+    result = run_incremental_backup(f"incremental_{os.getenv('MYSQL_DB_NAME')}")
+    print(result["message"])
+    return result
 
 
 # Configure APScheduler for scheduled tasks
+# The scheduler only runs in the dedicated worker process ("flask run-scheduler"),
+# never in the web workers.
 scheduler = APScheduler()
 
 
+def run_exclusive_job(name, job):
+    """
+    Run a scheduled job unless another instance of it is already running.
+
+    The duration and outcome of the run are recorded in the metrics.
+
+    Args:
+        name (str): The name of the job, used as the lock name.
+        job (callable): The function running the job.
+    """
+    with scheduler.app.app_context(), job_lock(name) as acquired:
+        if not acquired:
+            metrics.job_runs.labels(name, "skipped").inc()
+            print(f"Job {name} is already running, skipped.")
+            return
+        metrics.run_job(name, job)
+
+
 @scheduler.task("cron", id="backup_mysql_task", hour=2, minute=0)
 def scheduled_mysql_backup():
     """Schedule MySQL backup at 2:00 AM every day."""
-    backup_mysql()
+    run_exclusive_job("backup_mysql", backup_mysql)
 
 
 @scheduler.task("cron", id="backup_mongo_task", hour=3, minute=0)
 def scheduled_mongo_backup():
     """Schedule MongoDB backup at 3:00 AM every day."""
-    backup_mongo()
+    run_exclusive_job("backup_mongo", backup_mongo)
+
+
+@scheduler.task("cron", id="backup_incremental_task", minute=30)
+def scheduled_incremental_backup():
+    """Schedule an incremental backup every hour, at half past."""
+    run_exclusive_job("backup_incremental", backup_incremental)
+
+
+@scheduler.task("cron", id="prune_index_changes_task", minute=15)
+def scheduled_index_changes_pruning():
+    """Prune the search index change log every hour, at quarter past."""
+    run_exclusive_job("prune_index_changes", prune_index_changes)
 
 
-# Initialize and start the APScheduler
+# Initialize the APScheduler (started by the run-scheduler command only)
 scheduler.init_app(app)
-scheduler.start()
+
+
+@app.cli.command("run-scheduler")
+def run_scheduler_command():
+    """Run the scheduled jobs (backups, log pruning) until the process is stopped."""
+    scheduler.start()
+    click.echo(
+        "Scheduler started: " + ", ".join(job.id for job in scheduler.get_jobs())
+    )
+
+    # Stop cleanly on SIGTERM (sent by the process manager) as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            time.sleep(60)
+    except (KeyboardInterrupt, SystemExit):
+        scheduler.shutdown()
+        click.echo("Scheduler stopped.")
+
+
+@app.cli.command("restore-backup")
+@click.option(
+    "--sql", "sql_archive", type=click.Path(exists=True), help="Full MySQL archive."
+)
+@click.option(
+    "--mongo",
+    "mongo_archive",
+    type=click.Path(exists=True),
+    help="Full MongoDB archive.",
+)
+@click.argument("increments", nargs=-1, type=click.Path(exists=True))
+def restore_backup_command(sql_archive, mongo_archive, increments):
+    """Restore full backups, then replay the incremental backups in order."""
+    try:
+        if sql_archive:
+            restore_full_backup(
+                [
+                    mysql_path,
+                    "-u",
+                    os.getenv("MYSQL_USER"),
+                    f"-p{os.getenv('MYSQL_PASSWORD')}",
+                    os.getenv("MYSQL_DB_NAME"),
+                ],
+                sql_archive,
+            )
+            click.echo(f"MySQL restored from {sql_archive}.")
+        if mongo_archive:
+            restore_full_backup(
+                [
+                    mongorestore_path,
+                    f"--uri={os.getenv('MONGO_URI')}",
+                    "--archive",
+                    "--drop",
+                ],
+                mongo_archive,
+            )
+            click.echo(f"MongoDB restored from {mongo_archive}.")
+    except (ValueError, subprocess.CalledProcessError) as e:
+        raise click.ClickException(str(e))
+
+    # Archive names start with their UTC timestamp, so they sort chronologically
+    for archive in sorted(increments, key=os.path.basename):
+        result = apply_incremental_backup(archive)
+        if result["error"]:
+            raise click.ClickException(result["message"])
+        click.echo(
+            f"{result['message']} {result['restored']} restored, {result['deleted']} deleted."
+        )
+
+    # The ingredient search index and the image reference counts are derived
+    # data: rebuild them from the restored tables
+    for rebuild in (rebuild_search_index, reconcile_stored_images):
+        result = rebuild()
+        if result["error"]:
+            raise click.ClickException(result["message"])
+        click.echo(result["message"])
+
+
+@app.cli.command("backup")
+@click.argument("kind", type=click.Choice(["mysql", "mongo", "incremental"]))
+def backup_command(kind):
+    """Run a backup now (full MySQL, full MongoDB or incremental)."""
+    jobs = {
+        "mysql": backup_mysql,
+        "mongo": backup_mongo,
+        "incremental": backup_incremental,
+    }
+    # Same lock as the scheduled job, so both never run at the same time
+    run_exclusive_job(f"backup_{kind}", jobs[kind])
 
 
 # Main Entry Point
@@ -173,6 +513,8 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = (
         "sqlite:///:memory:"  # Exemple d'URL de base de données pour tests
     )
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # Pool par défaut de SQLite
+    PASSWORD_HASH_WORKERS = 0  # Hacher les mots de passe dans le thread du test
     SERVER_NAME = "localhost"  # Important pour la génération des URLs dans un test
     TESTING = True
     WTF_CSRF_ENABLED = False  # Désactiver CSRF pour les tests
@@ -199,4 +541,5 @@ def create_app(config_name="testing"):
 
     app.register_blueprint(recipes)  # Register the recipes blueprint
     app.register_blueprint(users)  # Register the users blueprint
+    app.register_blueprint(api, url_prefix="/api/v1")  # Register the JSON API
     return app
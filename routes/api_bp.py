@@ -0,0 +1,146 @@
+import orjson
+from flask import Blueprint, current_app, request
+from services.api_service import (
+    get_recipe_detail,
+    get_recipe_ingredients,
+    get_recipe_rating,
+    get_recipes_page,
+    recipe_exists,
+)
+from services.comment_service import get_comments_page, serialize_comment
+
+# Read-only JSON API, registered under /api/v1
+api = Blueprint("api", __name__)
+
+
+def _default(value):
+    """Serialize the values orjson does not know (e.g. ObjectId, Decimal)."""
+    return str(value)
+
+
+def json_response(data, status=200):
+    """
+    Build a JSON response with orjson, several times faster than the json module.
+
+    Args:
+        data: The JSON-serializable data (datetimes are written in ISO 8601).
+        status (int): The HTTP status of the response.
+
+    Returns:
+        Response: The JSON response.
+    """
+    return current_app.response_class(
+        orjson.dumps(data, default=_default),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+def _not_found():
+    """Answer a request for a recipe that does not exist."""
+    return json_response({"error": "Recipe not found."}, 404)
+
+
+@api.route("/recipes", methods=["GET"])
+def list_recipes():
+    """
+    List the recipes, with their ingredients and rating summary.
+
+    The page is selected with the ``after``/``before`` cursors and the
+    ``per_page`` query parameters, as on the HTML listing.
+
+    Returns:
+        JSON response with the recipes and the cursors of the neighbouring pages.
+    """
+    result = get_recipes_page(
+        after=request.args.get("after", type=int),
+        before=request.args.get("before", type=int),
+        page_size=request.args.get("per_page", type=int),
+    )
+    if result["error"]:
+        return json_response({"error": result["message"]}, 500)
+    del result["error"]
+    return json_response(result)
+
+
+@api.route("/recipes/<int:recipe_id>", methods=["GET"])
+def recipe_detail(recipe_id):
+    """
+    Retrieve a recipe with its ingredients, rating summary and first comments.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+
+    Returns:
+        JSON response with the recipe.
+    """
+    result = get_recipe_detail(recipe_id)
+    if result["error"]:
+        return json_response({"error": result["message"]}, 500)
+    if result["recipe"] is None:
+        return _not_found()
+    return json_response(result["recipe"])
+
+
+@api.route("/recipes/<int:recipe_id>/ingredients", methods=["GET"])
+def recipe_ingredients(recipe_id):
+    """
+    Retrieve the ingredients of a recipe.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+
+    Returns:
+        JSON response with the list of ingredients.
+    """
+    ingredients = get_recipe_ingredients(recipe_id)
+    if ingredients is None:
+        return _not_found()
+    return json_response(ingredients)
+
+
+@api.route("/recipes/<int:recipe_id>/comments", methods=["GET"])
+def recipe_comments(recipe_id):
+    """
+    Retrieve one page of the comments of a recipe.
+
+    The page is selected with the ``after`` cursor and ``per_page`` query parameters.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+
+    Returns:
+        JSON response with the comments and the cursor of the next page.
+    """
+    if not recipe_exists(recipe_id):
+        return _not_found()
+    result = get_comments_page(
+        recipe_id,
+        after=request.args.get("after"),
+        page_size=request.args.get("per_page", type=int),
+    )
+    if result["error"]:
+        return json_response({"error": result["message"]}, 400)
+    return json_response(
+        {
+            "comments": [serialize_comment(c) for c in result["comments"]],
+            "next_cursor": result["next_cursor"],
+        }
+    )
+
+
+@api.route("/recipes/<int:recipe_id>/rating", methods=["GET"])
+def recipe_rating(recipe_id):
+    """
+    Retrieve the rating summary of a recipe.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+
+    Returns:
+        JSON response with the average rating and the number of ratings.
+    """
+    rating = get_recipe_rating(recipe_id)
+    if rating is None:
+        return _not_found()
+    return json_response(rating)
@@ -1,4 +1,5 @@
 from flask import (
+    abort,
     render_template,
     request,
     redirect,
@@ -11,18 +12,35 @@ from flask_login import login_required, current_user
 from models.models_sql import Recipe, RecipeIngredient
 from services.recipe_service import (
     add_recipe,
+    get_recipe_validator,
     get_recipe_with_comments,
     delete_recipe,
+    delete_recipes,
     edit_recipe,
     rate_recipe,
-    search_recipes_by_ingredient,
 )
 from services.ingredient_service import (
     add_ingredient_to_recipe,
     delete_ingredient,
     update_ingredient,
 )
-from services.comment_service import add_comment, delete_comment
+from services.api_service import get_recipe_ingredients
+from services.comment_service import (
+    add_comment,
+    delete_comment,
+    get_comments_page,
+    serialize_comment,
+)
+from services.http_cache import conditional_response
+from services.listing_service import (
+    get_card_states,
+    get_listing_validator,
+    get_recipe_listing_page,
+    paginate_recipes,
+    render_recipe_cards,
+    search_recipe_listing_page,
+    serialize_listing_page,
+)
 
 # Create a blueprint for recipe-related routes
 recipes = Blueprint("recipes", __name__)
@@ -81,15 +99,23 @@ def view_recipe_route(id):
     Returns:
         Rendered HTML template or redirection if the recipe is not found.
     """
-    result = get_recipe_with_comments(id)
 
-    if result["error"]:
-        flash(result["message"], "danger")
-        return redirect(url_for("recipes.index"))
+    def render():
+        result = get_recipe_with_comments(id)
 
-    return render_template(
-        "recipes/view_recipe.html", recipe=result["recipe"], comments=result["comments"]
-    )
+        if result["error"]:
+            flash(result["message"], "danger")
+            return redirect(url_for("recipes.index"))
+
+        return render_template(
+            "recipes/view_recipe.html",
+            recipe=result["recipe"],
+            comments=result["comments"],
+            next_cursor=result["next_cursor"],
+        )
+
+    # Anonymous visitors get a 304 while the recipe and its comments are unchanged
+    return conditional_response(lambda: get_recipe_validator(id), render)
 
 
 @recipes.route("/delete/<int:id>", methods=["POST"])
@@ -114,6 +140,27 @@ def delete_recipe_route(id):
     return redirect(url_for("recipes.index"))
 
 
+@recipes.route("/delete", methods=["POST"])
+@login_required
+def delete_recipes_route():
+    """
+    Delete several recipes at once.
+
+    Expects a JSON body of the form ``{"ids": [1, 2, 3]}``. Only moderators
+    can delete the recipes of other users.
+
+    Returns:
+        JSON response with the number of deleted recipes or an error message.
+    """
+    data = request.get_json(silent=True) or {}
+    result = delete_recipes(data.get("ids"), current_user)
+
+    if result["error"]:
+        status = 403 if result.get("forbidden") else 400
+        return jsonify({"error": result["message"]}), status
+    return jsonify({"message": result["message"], "deleted": result["deleted"]}), 200
+
+
 @recipes.route(
     "/delete_ingredient/<int:recipe_id>/<int:ingredient_id>", methods=["POST"]
 )
@@ -248,43 +295,91 @@ def get_ingredients(recipe_id):
     Returns:
         JSON response with a list of ingredients.
     """
-    recipe = Recipe.query.get_or_404(recipe_id)
-    ingredients = [
-        {
-            "id": ri.ingredient.id,
-            "name": ri.ingredient.name_ingredient,
-            "quantity": ri.quantity,
-            "unit": ri.unit,
-        }
-        for ri in recipe.ingredients
-    ]
+    # The ingredients are loaded with the recipe, in two queries
+    ingredients = get_recipe_ingredients(recipe_id)
+    if ingredients is None:
+        abort(404)
 
     return jsonify(ingredients), 200
 
 
+def _pagination_args(cursor_type=int):
+    """
+    Read the keyset pagination parameters from the query string.
+
+    Args:
+        cursor_type (type): The type of the ``after``/``before`` cursors.
+
+    Returns:
+        dict: The ``after``, ``before`` and ``page_size`` arguments of the listing services.
+    """
+    return {
+        "after": request.args.get("after", type=cursor_type),
+        "before": request.args.get("before", type=cursor_type),
+        "page_size": request.args.get("per_page", type=int),
+    }
+
+
 @recipes.route("/")
 def index():
     """
-    Display the index page with a list of all recipes, including their average ratings and comments.
+    Display one page of the recipe list, including their average ratings and comments.
+
+    The page is selected with the ``after``/``before`` cursors and ``per_page``
+    query parameters. With ``format=json`` the page is returned as JSON.
 
     Returns:
-        Rendered HTML template with the list of recipes.
+        Rendered HTML template with the list of recipes, or a JSON response.
     """
-    all_recipes = Recipe.query.all()
+    if request.args.get("format") == "json":
+        page = get_recipe_listing_page(**_pagination_args())
+        return jsonify(serialize_listing_page(page)), 200
+
+    # Anonymous visitors revalidate the page with its ETag; the cards are
+    # rendered once per state of each recipe and cached. The ETag and the
+    # cards are derived from the same states.
+    page = paginate_recipes(Recipe.query, **_pagination_args())
+    states = get_card_states(page["recipes"])
+    return conditional_response(
+        lambda: get_listing_validator(page, states),
+        lambda: render_template(
+            "recipes/recipes.html",
+            cards=render_recipe_cards(page["recipes"], states),
+            next_cursor=page["next_cursor"],
+            prev_cursor=page["prev_cursor"],
+        ),
+    )
 
-    recipes_with_comments_and_ratings = [
-        {
-            "id": recipe.id,
-            "title": recipe.title,
-            "image": recipe.image,
-            "average_rating": recipe.average_rating,
-            "comments": recipe.get_comments(),
-        }
-        for recipe in all_recipes
-    ]
 
-    return render_template(
-        "recipes/recipes.html", recipes=recipes_with_comments_and_ratings
+@recipes.route("/<int:recipe_id>/comments", methods=["GET"])
+def comments_route(recipe_id):
+    """
+    Retrieve one page of the comments of a recipe, for the "load more" button.
+
+    The page is selected with the ``after`` cursor and ``per_page`` query parameters.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+
+    Returns:
+        JSON response with the comments and the cursor of the next page.
+    """
+    result = get_comments_page(
+        recipe_id,
+        after=request.args.get("after"),
+        page_size=request.args.get("per_page", type=int),
+    )
+
+    if result["error"]:
+        return jsonify({"error": result["message"]}), 400
+    return (
+        jsonify(
+            {
+                "comments": [serialize_comment(c) for c in result["comments"]],
+                "next_cursor": result["next_cursor"],
+            }
+        ),
+        200,
     )
 
 
@@ -366,20 +461,42 @@ def search_by_ingredient():
     calls the search service to find matching recipes, and renders the
     recipes template with the results.
 
+    Several ingredients can be separated by commas and combined with
+    ``mode=and`` (default) or ``mode=or``; results are ranked by the number
+    of requested ingredients each recipe contains. They are paginated with
+    the same ``after``/``before``/``per_page`` parameters as the index, and
+    returned as JSON with ``format=json``.
+
     Returns:
-        A rendered HTML template displaying the list of recipes that contain
-        the searched ingredient.
+        A rendered HTML template displaying one page of the recipes that contain
+        the searched ingredient, or a JSON response.
     """
     # Get the ingredient name from the request, stripping any leading/trailing spaces
     ingredient_name = request.args.get("ingredient", "").strip()
 
-    # Call the service function to search for recipes containing the ingredient
-    recipes, error = search_recipes_by_ingredient(ingredient_name)
+    # Several ingredients can be combined with commas, "mode" selects AND or OR
+    mode = request.args.get("mode", "and")
+
+    # Call the service function to fetch one page of the matching recipes
+    as_json = request.args.get("format") == "json"
+    page, error = search_recipe_listing_page(
+        ingredient_name,
+        mode,
+        **_pagination_args(cursor_type=str),
+        as_cards=not as_json,
+    )
+
+    if as_json:
+        payload = serialize_listing_page(page)
+        payload["error"] = error
+        return jsonify(payload), 200
 
     # Render the recipes template with the search results and any possible error message
     return render_template(
         "recipes/recipes.html",
-        recipes=recipes,
+        cards=page["cards"],
+        next_cursor=page["next_cursor"],
+        prev_cursor=page["prev_cursor"],
         search_term=ingredient_name,
         error=error,
     )
@@ -1,11 +1,18 @@
 from flask import render_template, request, redirect, url_for, Blueprint, flash
 from flask_login import login_required, current_user, logout_user
+from services.password_service import PasswordHasherBusy
 from services.user_service import UserService
 
 # Create a blueprint for user-related routes
 users = Blueprint("users", __name__)
 
 
+@users.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    """Answer at once when the password hashing pool is saturated."""
+    return str(error), 503, {"Retry-After": "5"}
+
+
 @users.route("/login")
 def login():
     """
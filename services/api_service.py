@@ -0,0 +1,182 @@
+from sqlalchemy import exists
+from sqlalchemy.orm import selectinload
+from models.models_sql import Recipe, RecipeIngredient
+from services.comment_service import get_comments_page, serialize_comment
+from services.listing_service import paginate_recipes
+from extensions import db, static_assets
+
+# Eager loading of the ingredients: one extra query for a whole page of
+# recipes, joined with the ingredient names.
+INGREDIENTS_LOADER = selectinload(Recipe.ingredients).joinedload(
+    RecipeIngredient.ingredient
+)
+
+
+def serialize_ingredients(recipe):
+    """
+    Convert the ingredients of a recipe into JSON-serializable data.
+
+    Args:
+        recipe (Recipe): A recipe loaded with ``INGREDIENTS_LOADER``.
+
+    Returns:
+        list[dict]: The ingredients with their quantity and unit.
+    """
+    return [
+        {
+            "id": row.ingredient_id,
+            "name": row.ingredient.name_ingredient,
+            "quantity": row.quantity,
+            "unit": row.unit,
+        }
+        for row in recipe.ingredients
+    ]
+
+
+def serialize_rating(recipe):
+    """Convert the rating aggregates of a recipe into JSON-serializable data."""
+    return {"average": recipe.average_rating, "count": recipe.rating_count}
+
+
+def serialize_images(recipe):
+    """Build the fingerprinted URLs of the image of a recipe and its variants."""
+    if not recipe.image:
+        return None
+    return {
+        name: static_assets.url_for(path, _external=True)
+        for name, path in (
+            ("original", recipe.image),
+            ("thumb", recipe.image_thumb),
+            ("card", recipe.image_card),
+            ("full", recipe.image_full),
+        )
+        if path
+    }
+
+
+def serialize_recipe(recipe):
+    """
+    Convert a recipe into JSON-serializable data.
+
+    Args:
+        recipe (Recipe): A recipe loaded with ``INGREDIENTS_LOADER``.
+
+    Returns:
+        dict: The recipe with its images, ingredients and rating summary.
+    """
+    return {
+        "id": recipe.id,
+        "title": recipe.title,
+        "description": recipe.description,
+        "user_id": recipe.user_id,
+        "images": serialize_images(recipe),
+        "ingredients": serialize_ingredients(recipe),
+        "rating": serialize_rating(recipe),
+        "updated_at": recipe.updated_at.isoformat() if recipe.updated_at else None,
+    }
+
+
+def _get_recipe(id):
+    """Load a recipe with its ingredients, or None if it does not exist."""
+    return db.session.get(Recipe, id, options=[INGREDIENTS_LOADER])
+
+
+def recipe_exists(id):
+    """
+    Tell whether a recipe exists, with a primary key lookup.
+
+    Args:
+        id (int): The ID of the recipe.
+
+    Returns:
+        bool: True if the recipe exists.
+    """
+    return db.session.query(exists().where(Recipe.id == id)).scalar()
+
+
+def get_recipes_page(after=None, before=None, page_size=None):
+    """
+    Retrieve one page of recipes for the API.
+
+    The page costs two SQL queries whatever its size: the recipes, then
+    their ingredients.
+
+    Args:
+        after (int | None): Return the recipes following this recipe ID.
+        before (int | None): Return the recipes preceding this recipe ID.
+        page_size (int | None): The number of recipes per page.
+
+    Returns:
+        dict: Result indicating success or failure, with the serialized
+        recipes and the next and previous cursors.
+    """
+    try:
+        query = Recipe.query.options(INGREDIENTS_LOADER)
+        page = paginate_recipes(query, after, before, page_size)
+        return {
+            "error": False,
+            "recipes": [serialize_recipe(recipe) for recipe in page["recipes"]],
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"],
+        }
+
+    except Exception as e:
+        return {"error": True, "message": str(e)}
+
+
+def get_recipe_detail(id):
+    """
+    Retrieve a recipe with its ingredients, rating summary and first comments.
+
+    Args:
+        id (int): The ID of the recipe.
+
+    Returns:
+        dict: Result indicating success or failure, with the serialized recipe
+        (None if it does not exist).
+    """
+    recipe = _get_recipe(id)
+    if recipe is None:
+        return {"error": False, "recipe": None}
+
+    page = get_comments_page(recipe.id)
+    if page["error"]:
+        return page
+    return {
+        "error": False,
+        "recipe": {
+            **serialize_recipe(recipe),
+            "comments": [serialize_comment(c) for c in page["comments"]],
+            "next_comments_cursor": page["next_cursor"],
+        },
+    }
+
+
+def get_recipe_ingredients(id):
+    """
+    Retrieve the ingredients of a recipe with two queries.
+
+    Args:
+        id (int): The ID of the recipe.
+
+    Returns:
+        list[dict] | None: The serialized ingredients, or None if the recipe
+        does not exist.
+    """
+    recipe = _get_recipe(id)
+    return serialize_ingredients(recipe) if recipe is not None else None
+
+
+def get_recipe_rating(id):
+    """
+    Retrieve the rating summary of a recipe from its stored aggregates.
+
+    Args:
+        id (int): The ID of the recipe.
+
+    Returns:
+        dict | None: The average and number of ratings, or None if the recipe
+        does not exist.
+    """
+    recipe = db.session.get(Recipe, id)
+    return serialize_rating(recipe) if recipe is not None else None
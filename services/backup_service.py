@@ -0,0 +1,538 @@
+import contextlib
+import glob
+import gzip
+import hashlib
+import json
+import os
+import subprocess  # nosec B404
+import time
+from datetime import datetime, timedelta, timezone
+from bson import json_util
+from flask import current_app
+from pymongo import ReplaceOne
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects import mysql
+from models.models_sql import User, Ingredient, Recipe, RecipeIngredient, Rating
+from extensions import db, mongo_db
+from services.sql_dialect import dialect_insert
+
+# Size of the chunks read from the dump tools and archives
+CHUNK_SIZE = 1024 * 1024
+
+# Number of keys per backup record, and of comments per restore bulk write
+BATCH_SIZE = 10000
+
+# Number of rows per restore statement, under the placeholder limits of the databases
+ROWS_PER_STATEMENT = 500
+
+# Tables saved by the incremental backups, parent tables first
+INCREMENTAL_MODELS = (User, Ingredient, Recipe, RecipeIngredient, Rating)
+
+
+class _ChecksumWriter:
+    """File wrapper computing the SHA-256 and size of the bytes written through it."""
+
+    def __init__(self, fileobj):
+        """Wrap a file opened in binary write mode."""
+        self._file = fileobj
+        self.sha256 = hashlib.sha256()
+        self.bytes_written = 0
+
+    def write(self, data):
+        """Write bytes to the file, updating the checksum and size."""
+        self.sha256.update(data)
+        self.bytes_written += len(data)
+        return self._file.write(data)
+
+    def flush(self):
+        """Flush the wrapped file."""
+        self._file.flush()
+
+
+def command_output(command):
+    """
+    Run a command and yield its standard output by chunks, as it is produced.
+
+    Args:
+        command (list[str]): The command to run.
+
+    Yields:
+        bytes: The chunks of the output.
+
+    Raises:
+        subprocess.CalledProcessError: If the command failed.
+    """
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:  # nosec B603
+        yield from iter(lambda: process.stdout.read(CHUNK_SIZE), b"")
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command[0])
+
+
+def write_archive(chunks, archive_path, compresslevel=6):
+    """
+    Compress a stream of bytes into a gzip archive as it is produced.
+
+    The data is never held in memory nor written uncompressed: it is
+    compressed and hashed on the fly. The archive is written under a
+    temporary name and only renamed once the whole stream was written.
+
+    Args:
+        chunks (iterable[bytes]): The data to archive, e.g. the output of a dump command.
+        archive_path (str): The path of the archive to create.
+        compresslevel (int): The gzip compression level (1 to 9).
+
+    Returns:
+        dict: The SHA-256 of the archive, and the number of bytes dumped and written.
+    """
+    partial_path = archive_path + ".part"
+    try:
+        with open(partial_path, "wb") as raw_file:
+            writer = _ChecksumWriter(raw_file)
+            inner_name = os.path.basename(archive_path)[: -len(".gz")]
+            bytes_dumped = 0
+            with gzip.GzipFile(
+                inner_name, "wb", compresslevel, fileobj=writer
+            ) as archive:
+                for chunk in chunks:
+                    archive.write(chunk)
+                    bytes_dumped += len(chunk)
+
+        os.replace(partial_path, archive_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    return {
+        "sha256": writer.sha256.hexdigest(),
+        "bytes_dumped": bytes_dumped,
+        "bytes_written": writer.bytes_written,
+    }
+
+
+def prune_backups(backup_dir, name, retention_days, now=None):
+    """
+    Delete the archives of a backup older than the retention window.
+
+    The most recent archive is always kept, even if it is older.
+
+    Args:
+        backup_dir (str): The directory containing the archives.
+        name (str): The name of the backup (prefix of its archives).
+        retention_days (float): The number of days archives are kept.
+        now (float | None): The current timestamp (``time.time()`` by default).
+
+    Returns:
+        list[str]: The paths of the deleted archives.
+    """
+    now = time.time() if now is None else now
+    archives = sorted(
+        glob.glob(os.path.join(backup_dir, f"{name}_*.gz")), key=os.path.getmtime
+    )
+    deadline = now - retention_days * 86400
+
+    removed = []
+    for path in archives[:-1]:
+        if os.path.getmtime(path) >= deadline:
+            continue
+        os.remove(path)
+        if os.path.exists(path + ".sha256"):
+            os.remove(path + ".sha256")
+        removed.append(path)
+    return removed
+
+
+def _save_backup(name, extension, chunks, started_at):
+    """
+    Write a backup archive with its checksum file and record it in the manifest.
+
+    Args:
+        name (str): The name of the backup.
+        extension (str): The extension of the uncompressed data.
+        chunks (iterable[bytes]): The data to archive.
+        started_at (datetime): The UTC time the backup started at.
+
+    Returns:
+        dict: Result indicating success or failure, with the archive path,
+        checksum, duration and bytes written.
+    """
+    backup_dir = current_app.config["BACKUP_DIR"]
+    os.makedirs(backup_dir, exist_ok=True)
+    archive_path = os.path.join(
+        backup_dir, f"{name}_{started_at:%Y%m%dT%H%M%SZ}.{extension}.gz"
+    )
+
+    start = time.monotonic()
+    try:
+        stats = write_archive(
+            chunks, archive_path, current_app.config["BACKUP_COMPRESSION_LEVEL"]
+        )
+    except Exception as e:
+        return {"error": True, "message": f"Error during backup {name}: {e}"}
+    duration = time.monotonic() - start
+
+    with open(archive_path + ".sha256", "w") as checksum_file:
+        checksum_file.write(f"{stats['sha256']}  {os.path.basename(archive_path)}\n")
+
+    record = {
+        "name": name,
+        "archive": os.path.basename(archive_path),
+        "started_at": started_at.isoformat(),
+        "duration": round(duration, 3),
+        **stats,
+    }
+    with open(os.path.join(backup_dir, "manifest.jsonl"), "a") as manifest:
+        manifest.write(json.dumps(record) + "\n")
+
+    pruned = prune_backups(
+        backup_dir, name, current_app.config["BACKUP_RETENTION_DAYS"]
+    )
+    return {
+        "error": False,
+        "message": (
+            f"Backup saved to {archive_path} ({stats['bytes_written']} bytes"
+            f" in {duration:.1f}s, {len(pruned)} old archive(s) deleted)."
+        ),
+        "path": archive_path,
+        "pruned": pruned,
+        **record,
+    }
+
+
+def run_backup(name, command, extension, checkpoint=None):
+    """
+    Back up a database into a timestamped, compressed and checksummed archive.
+
+    The archive ``<name>_<UTC timestamp>.<extension>.gz`` is written to
+    ``BACKUP_DIR`` with a ``.sha256`` file in the ``sha256sum`` format. The
+    run is recorded in ``manifest.jsonl`` and the archives older than
+    ``BACKUP_RETENTION_DAYS`` are deleted.
+
+    Args:
+        name (str): The name of the backup, e.g. "mysql_radiscool".
+        command (list[str]): The dump command, writing the dump to its standard output.
+        extension (str): The extension of the uncompressed dump, e.g. "sql".
+        checkpoint (str | None): The source ("sql" or "mongo") fully covered by
+            the dump: the following incremental backups start from it.
+
+    Returns:
+        dict: Result indicating success or failure, with the archive path,
+        checksum, duration and bytes written.
+    """
+    started_at = datetime.now(timezone.utc)
+    result = _save_backup(name, extension, command_output(command), started_at)
+    if checkpoint and not result["error"]:
+        save_checkpoint({checkpoint: started_at})
+    return result
+
+
+def load_checkpoint():
+    """
+    Read the dates covered by the last backups.
+
+    Returns:
+        dict: Mapping of source ("sql", "mongo") to the naive UTC datetime up
+        to which its changes are saved.
+    """
+    path = os.path.join(current_app.config["BACKUP_DIR"], "checkpoint.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as checkpoint_file:
+        return {
+            source: datetime.fromisoformat(moment)
+            for source, moment in json.load(checkpoint_file).items()
+        }
+
+
+def save_checkpoint(moments):
+    """
+    Update the dates covered by the last backups.
+
+    Args:
+        moments (dict): Mapping of source to the UTC datetime its backup started at.
+    """
+    checkpoint = load_checkpoint()
+    for source, moment in moments.items():
+        # Stored as naive UTC datetimes, like the updated_at columns and comment dates
+        checkpoint[source] = moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+    path = os.path.join(current_app.config["BACKUP_DIR"], "checkpoint.json")
+    with open(path + ".part", "w") as checkpoint_file:
+        json.dump(
+            {source: moment.isoformat() for source, moment in checkpoint.items()},
+            checkpoint_file,
+        )
+    os.replace(path + ".part", path)
+
+
+def incremental_records(sql_since, mongo_since):
+    """
+    Yield the records of an incremental backup.
+
+    For each table, the rows modified since ``sql_since`` are followed by the
+    primary keys of every row, so that a restore also replays the deletions.
+    The comments modified since ``mongo_since`` are followed by the IDs of
+    every comment. Keys and IDs are streamed by records of ``BATCH_SIZE``.
+
+    Args:
+        sql_since (datetime): Export the rows whose ``updated_at`` is later.
+        mongo_since (datetime): Export the comments whose ``date`` is later.
+
+    Yields:
+        dict: The records, in restore order (parent tables first).
+    """
+    for model in INCREMENTAL_MODELS:
+        table = model.__table__
+        rows = db.session.execute(
+            select(table)
+            .where(table.c.updated_at > sql_since)
+            .execution_options(yield_per=1000)
+        )
+        for row in rows:
+            yield {"table": table.name, "row": dict(row._mapping)}
+
+        keys = db.session.execute(
+            select(*table.primary_key.columns).execution_options(yield_per=BATCH_SIZE)
+        )
+        batch, batches = [], 0
+        for key in keys:
+            batch.append(list(key))
+            if len(batch) == BATCH_SIZE:
+                yield {"table": table.name, "keys": batch}
+                batch, batches = [], batches + 1
+        # An empty table still yields a record, so that its rows are deleted
+        if batch or not batches:
+            yield {"table": table.name, "keys": batch}
+
+    for document in mongo_db.comments.find({"date": {"$gt": mongo_since}}):
+        yield {"collection": "comments", "document": document}
+    ids, batches = [], 0
+    for document in mongo_db.comments.find({}, {"_id": 1}):
+        ids.append(document["_id"])
+        if len(ids) == BATCH_SIZE:
+            yield {"collection": "comments", "ids": ids}
+            ids, batches = [], batches + 1
+    if ids or not batches:
+        yield {"collection": "comments", "ids": ids}
+
+
+def run_incremental_backup(name):
+    """
+    Back up the changes made since the last full or incremental backup.
+
+    The archive contains JSON lines (see ``incremental_records``). Changes
+    are exported from the checkpoint minus ``BACKUP_INCREMENTAL_OVERLAP``
+    seconds, so a transaction committed while the previous backup ran is not
+    missed; replaying a change twice is harmless.
+
+    Args:
+        name (str): The name of the backup, e.g. "incremental_radiscool".
+
+    Returns:
+        dict: Result indicating success or failure, with the archive path,
+        checksum, duration and bytes written.
+    """
+    checkpoint = load_checkpoint()
+    if "sql" not in checkpoint or "mongo" not in checkpoint:
+        return {
+            "error": True,
+            "message": "No checkpoint: run a full MySQL and MongoDB backup first.",
+        }
+
+    started_at = datetime.now(timezone.utc)
+    overlap = timedelta(seconds=current_app.config["BACKUP_INCREMENTAL_OVERLAP"])
+    records = incremental_records(
+        checkpoint["sql"] - overlap, checkpoint["mongo"] - overlap
+    )
+    chunks = ((json_util.dumps(record) + "\n").encode() for record in records)
+
+    result = _save_backup(name, "jsonl", chunks, started_at)
+    if not result["error"]:
+        save_checkpoint({"sql": started_at, "mongo": started_at})
+    return result
+
+
+def verify_archive(archive_path):
+    """
+    Check an archive against its ``.sha256`` file.
+
+    Args:
+        archive_path (str): The path of the archive.
+
+    Raises:
+        ValueError: If the checksum file is missing or does not match.
+    """
+    if not os.path.exists(archive_path + ".sha256"):
+        raise ValueError(f"No checksum file for {archive_path}.")
+    with open(archive_path + ".sha256") as checksum_file:
+        expected = checksum_file.read().split()[0]
+
+    sha256 = hashlib.sha256()
+    with open(archive_path, "rb") as archive:
+        for chunk in iter(lambda: archive.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    if sha256.hexdigest() != expected:
+        raise ValueError(f"Checksum mismatch for {archive_path}.")
+
+
+def restore_full_backup(command, archive_path):
+    """
+    Restore a full dump by streaming the decompressed archive to a restore command.
+
+    Args:
+        command (list[str]): The restore command, reading the dump on its standard input.
+        archive_path (str): The path of the archive.
+
+    Raises:
+        ValueError: If the archive does not match its checksum.
+        subprocess.CalledProcessError: If the restore command failed or exited
+            before reading the whole dump.
+    """
+    verify_archive(archive_path)
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)  # nosec B603
+    truncated = False
+    with gzip.open(archive_path, "rb") as archive, process:
+        try:
+            for chunk in iter(lambda: archive.read(CHUNK_SIZE), b""):
+                process.stdin.write(chunk)
+            process.stdin.close()
+        except BrokenPipeError:
+            # The command exited before reading the whole dump
+            truncated = True
+            with contextlib.suppress(BrokenPipeError):
+                process.stdin.close()
+    if process.returncode != 0 or truncated:
+        raise subprocess.CalledProcessError(process.returncode, command[0])
+
+
+def _delete_missing(existing, kept, delete_batch):
+    """Delete, by batches, the keys of ``existing`` absent from ``kept``."""
+    missing = list(set(existing) - set(kept))
+    for position in range(0, len(missing), 1000):
+        end = position + 1000
+        delete_batch(missing[position:end])
+    return len(missing)
+
+
+def _upsert_rows(model, rows):
+    """Insert or replace, with a single statement, rows of a table."""
+    stmt = dialect_insert(model)
+    if stmt is None:
+        for row in rows:
+            db.session.merge(model(**row))
+        db.session.flush()
+        return
+
+    primary_key = [column.name for column in model.__table__.primary_key.columns]
+    stmt = stmt.values(rows)
+    if isinstance(stmt, mysql.Insert):
+        stmt = stmt.on_duplicate_key_update(
+            {name: stmt.inserted[name] for name in rows[0] if name not in primary_key}
+        )
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=primary_key,
+            set_={
+                name: stmt.excluded[name] for name in rows[0] if name not in primary_key
+            },
+        )
+    db.session.execute(stmt)
+
+
+def _replace_comments(documents):
+    """Insert or replace comments with a single bulk write."""
+    mongo_db.comments.bulk_write(
+        [
+            ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+            for document in documents
+        ],
+        ordered=False,
+    )
+
+
+def apply_incremental_backup(archive_path):
+    """
+    Replay an incremental backup on the databases.
+
+    Modified rows and comments are upserted by batches, then the rows and
+    comments absent from the backup are deleted.
+
+    Args:
+        archive_path (str): The path of the archive.
+
+    Returns:
+        dict: Result indicating success or failure, with the number of rows
+        and comments restored and deleted.
+    """
+    try:
+        verify_archive(archive_path)
+        models = {model.__tablename__: model for model in INCREMENTAL_MODELS}
+        keys_by_table, comment_ids = {}, None
+        restored = deleted = 0
+        rows, rows_table, documents = [], None, []
+
+        with gzip.open(archive_path, "rt") as archive:
+            for line in archive:
+                record = json_util.loads(line)
+                # Rows are upserted table by table, parent tables first
+                if rows and (
+                    record.get("table") != rows_table or len(rows) == ROWS_PER_STATEMENT
+                ):
+                    _upsert_rows(models[rows_table], rows)
+                    rows = []
+                if len(documents) == BATCH_SIZE:
+                    _replace_comments(documents)
+                    documents = []
+
+                if "row" in record:
+                    rows.append(record["row"])
+                    rows_table = record["table"]
+                    restored += 1
+                elif "keys" in record:
+                    keys_by_table.setdefault(record["table"], []).extend(
+                        tuple(k) for k in record["keys"]
+                    )
+                elif "document" in record:
+                    documents.append(record["document"])
+                    restored += 1
+                elif "ids" in record:
+                    if comment_ids is None:
+                        comment_ids = []
+                    comment_ids.extend(record["ids"])
+        if rows:
+            _upsert_rows(models[rows_table], rows)
+        if documents:
+            _replace_comments(documents)
+
+        # Deletions, child tables first
+        for model in reversed(INCREMENTAL_MODELS):
+            if model.__tablename__ not in keys_by_table:
+                continue
+            columns = model.__table__.primary_key.columns
+            primary_key = tuple_(*columns)
+            existing = [tuple(key) for key in db.session.execute(select(*columns))]
+            deleted += _delete_missing(
+                existing,
+                keys_by_table[model.__tablename__],
+                lambda keys: db.session.execute(
+                    delete(model).where(primary_key.in_(keys))
+                ),
+            )
+        if comment_ids is not None:
+            existing = [d["_id"] for d in mongo_db.comments.find({}, {"_id": 1})]
+            deleted += _delete_missing(
+                existing,
+                comment_ids,
+                lambda ids: mongo_db.comments.delete_many({"_id": {"$in": ids}}),
+            )
+
+        db.session.commit()
+        return {
+            "error": False,
+            "message": f"{os.path.basename(archive_path)} applied.",
+            "restored": restored,
+            "deleted": deleted,
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        return {"error": True, "message": str(e)}
@@ -1,4 +1,6 @@
+from flask import current_app
 from models.models_nosql import CommentNoSQL
+from services.user_cache import get_user_profiles
 
 
 def add_comment(recipe_id, user_id, text):
@@ -36,10 +38,9 @@ def delete_comment(comment_id):
     """
     try:
         # Attempt to delete the comment by its ID.
-        result = CommentNoSQL.delete_comment(comment_id)
+        comment = CommentNoSQL.delete_comment(comment_id)
 
-        if result.deleted_count == 1:
-            # Successful deletion if exactly one comment was deleted.
+        if comment is not None:
             return {"error": False, "message": "Comment deleted."}
         else:
             # Handle cases where no comment was found to delete.
@@ -63,10 +64,9 @@ def update_comment(comment_id, new_text):
     """
     try:
         # Attempt to update the comment's text using its ID.
-        result = CommentNoSQL.update_comment(comment_id, new_text)
+        comment = CommentNoSQL.update_comment(comment_id, new_text)
 
-        if result.modified_count == 1:
-            # Successful update if exactly one comment was modified.
+        if comment is not None:
             return {"error": False, "message": "Comment updated."}
         else:
             # Handle cases where no comment was found to update.
@@ -75,3 +75,76 @@ def update_comment(comment_id, new_text):
     except Exception as e:
         # Handle any exceptions that occur during the update operation.
         return {"error": True, "message": str(e)}
+
+
+def get_usernames(user_ids):
+    """
+    Resolve the usernames of several users.
+
+    Profiles are served by the user cache; the missing ones are loaded with a
+    single ``IN`` query.
+
+    Args:
+        user_ids (iterable[int]): The IDs of the users.
+
+    Returns:
+        dict: Mapping of user ID to username.
+    """
+    profiles = get_user_profiles(user_ids)
+    return {user_id: profile["username"] for user_id, profile in profiles.items()}
+
+
+def serialize_comment(comment):
+    """
+    Convert a comment into JSON-serializable data.
+
+    Args:
+        comment (dict): A comment document enriched with the ``username`` of its author.
+
+    Returns:
+        dict: The comment with its MongoDB identifier and date converted to strings.
+    """
+    return {
+        "id": str(comment["_id"]),
+        "user_id": comment.get("user_id"),
+        "username": comment["username"],
+        "text": comment.get("text"),
+        "date": comment["date"].isoformat() if comment.get("date") else None,
+    }
+
+
+def get_comments_page(recipe_id, after=None, page_size=None):
+    """
+    Retrieve one page of the comments of a recipe, oldest first.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+        after (str | None): Return the comments following this cursor.
+        page_size (int | None): The number of comments per page
+            (``COMMENTS_PER_PAGE`` by default, at most ``COMMENTS_MAX_PER_PAGE``).
+
+    Returns:
+        dict: A dictionary with error status, the comments of the page (with
+        the username of their author) and the ``next_cursor`` to load the
+        following page (None on the last page).
+    """
+    try:
+        default_size = current_app.config.get("COMMENTS_PER_PAGE", 20)
+        max_size = current_app.config.get("COMMENTS_MAX_PER_PAGE", 100)
+        page_size = (
+            min(page_size, max_size) if page_size and page_size > 0 else default_size
+        )
+
+        comments, next_cursor = CommentNoSQL.get_comments_page(
+            recipe_id, after=after, limit=page_size
+        )
+        usernames = get_usernames(comment.get("user_id") for comment in comments)
+        for comment in comments:
+            comment["username"] = usernames.get(comment.get("user_id"), "Unknown user")
+
+        return {"error": False, "comments": comments, "next_cursor": next_cursor}
+
+    except ValueError:
+        return {"error": True, "message": "Invalid comment cursor."}
+    except Exception as e:
+        return {"error": True, "message": str(e)}
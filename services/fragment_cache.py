@@ -0,0 +1,193 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+
+# Number of rendered fragments kept by each worker process, and how long they
+# are kept (outdated fragments are never read: their key changed).
+FRAGMENT_CACHE_SIZE = 2048
+FRAGMENT_CACHE_TTL = 300  # seconds
+
+
+class LocalBackend:
+    """
+    In-memory stand-in for the shared Redis backend.
+
+    It implements the subset of the redis-py API used by the fragment cache
+    (``mget`` and ``set`` with ``ex``), so the shared code path can be
+    tested without a Redis server. Select it with ``FRAGMENT_CACHE_URL=memory://``.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def mget(self, keys):
+        """Retrieve several values, None for the missing or expired ones."""
+        now = time.monotonic()
+        with self._lock:
+            entries = [self._values.get(key) for key in keys]
+        return [
+            entry[1] if entry and (entry[0] is None or entry[0] > now) else None
+            for entry in entries
+        ]
+
+    def set(self, name, value, ex=None):
+        """Store a value, expiring after ``ex`` seconds if given."""
+        expires_at = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._values[name] = (expires_at, value)
+
+    def flushdb(self):
+        """Remove every value."""
+        with self._lock:
+            self._values.clear()
+
+
+def get_backend():
+    """
+    Retrieve the shared backend of the current application.
+
+    The backend is created on first use from ``FRAGMENT_CACHE_URL``: a Redis
+    URL (requires the ``redis`` package), "memory://" for the in-process
+    stand-in, or nothing to keep the fragments in each worker only.
+
+    Returns:
+        Redis | LocalBackend | None: The backend, or None without shared backend.
+    """
+    if not has_app_context():
+        return None
+    extensions = current_app.extensions
+    if "fragment_cache" not in extensions:
+        url = current_app.config.get("FRAGMENT_CACHE_URL")
+        if not url:
+            backend = None
+        elif url == "memory://":
+            backend = LocalBackend()
+        else:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("FRAGMENT_CACHE_URL requires the redis package.")
+            backend = redis.Redis.from_url(url)
+        extensions["fragment_cache"] = backend
+    return extensions["fragment_cache"]
+
+
+def fragment_key(name, recipe_id, state):
+    """
+    Build the key of a fragment from the state it is rendered from.
+
+    Args:
+        name (str): The name of the fragment (e.g. "card").
+        recipe_id (int): The ID of the recipe.
+        state (tuple): The values the fragment is rendered from.
+
+    Returns:
+        str: The cache key.
+    """
+    digest = hashlib.sha256(repr(state).encode("utf-8")).hexdigest()[:16]
+    return f"fragment:{name}:{recipe_id}:{digest}"
+
+
+class FragmentCache:
+    """
+    Cache of rendered HTML fragments, keyed by recipe ID and database state.
+
+    A fragment is stored under a digest of the data it is rendered from (the
+    columns of the recipe it shows, the number of comments and the date of
+    the latest one), read from the database by every request. A change made
+    through any worker changes the key in every worker, so no invalidation
+    is needed and a stale fragment is never served: the outdated ones are
+    evicted by the LRU or expire. Fragments are kept in a bounded LRU of the
+    worker process and, when a shared backend is configured, in the backend
+    too, so a card is rendered once for all the workers.
+    """
+
+    def __init__(self, maxsize=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL):
+        """
+        Create an empty cache.
+
+        Args:
+            maxsize (int): The maximum number of fragments kept in the process.
+            ttl (float): The number of seconds a fragment stays cached.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, name, states):
+        """
+        Retrieve the cached fragments of several recipes.
+
+        Args:
+            name (str): The name of the fragment (e.g. "card").
+            states (dict): Mapping of recipe ID to the state of the recipe.
+
+        Returns:
+            dict: Mapping of recipe ID to HTML, for the fragments found.
+        """
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for recipe_id, state in states.items():
+                key = fragment_key(name, recipe_id, state)
+                entry = self._entries.get(key)
+                if entry is None or entry[0] <= now:
+                    self._entries.pop(key, None)
+                    missing.append((recipe_id, key))
+                    continue
+                self._entries.move_to_end(key)
+                found[recipe_id] = entry[1]
+
+        backend = get_backend()
+        if backend is not None and missing:
+            values = backend.mget([key for _, key in missing])
+            shared = {}
+            for (recipe_id, key), html in zip(missing, values):
+                if html is not None:
+                    if isinstance(html, bytes):
+                        html = html.decode("utf-8")
+                    found[recipe_id] = shared[key] = html
+            self._store(shared)
+        return found
+
+    def set_many(self, name, states, fragments):
+        """
+        Store rendered fragments under the state they were rendered from.
+
+        Args:
+            name (str): The name of the fragment.
+            states (dict): The states read before rendering the fragments.
+            fragments (dict): Mapping of recipe ID to HTML.
+        """
+        entries = {
+            fragment_key(name, recipe_id, states[recipe_id]): html
+            for recipe_id, html in fragments.items()
+        }
+        self._store(entries)
+        backend = get_backend()
+        if backend is not None:
+            for key, html in entries.items():
+                backend.set(key, html, ex=self.ttl)
+
+    def _store(self, entries):
+        """Store fragments in the process LRU, evicting the oldest ones."""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, html in entries.items():
+                self._entries[key] = (expires_at, html)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empty the cache of the process."""
+        with self._lock:
+            self._entries.clear()
+
+
+# Cache of the current worker process
+fragment_cache = FragmentCache()
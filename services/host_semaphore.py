@@ -0,0 +1,32 @@
+import fcntl
+import os
+import tempfile
+
+
+def acquire_host_slot(name, slots):
+    """
+    Take a slot of a semaphore shared by the processes of the current host.
+
+    Each slot is a lock file in the temporary directory. A slot is held as
+    long as its file stays open, and is freed by the system if the process
+    holding it dies, so a crashed worker cannot leak it. The slot is never
+    waited for.
+
+    Args:
+        name (str): The name of the semaphore.
+        slots (int): The number of slots of the semaphore.
+
+    Returns:
+        file | None: The open lock file holding the slot (close it to free
+        the slot), or None if every slot is taken.
+    """
+    for slot in range(slots):
+        lock_path = os.path.join(tempfile.gettempdir(), f"radiscool-{name}-{slot}.lock")
+        lock_file = open(lock_path, "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        return lock_file
+    return None
@@ -0,0 +1,81 @@
+import hashlib
+from datetime import timezone
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+
+def make_validator(parts, dates):
+    """
+    Build the validator of a page from the data it is rendered from.
+
+    Args:
+        parts (iterable): Values that change whenever the page changes
+            (IDs, versions, counts, dates).
+        dates (iterable[datetime | None]): Naive UTC modification dates; the
+            latest one is the Last-Modified date of the page.
+
+    Returns:
+        tuple: The ETag and the Last-Modified date (None if no date is known).
+    """
+    etag = hashlib.sha256(repr(tuple(parts)).encode("utf-8")).hexdigest()[:32]
+    dates = [date for date in dates if date is not None]
+    last_modified = max(dates).replace(tzinfo=timezone.utc) if dates else None
+    return etag, last_modified
+
+
+def conditional_response(get_validator, render):
+    """
+    Answer a GET for a public page, with a 304 when the client's copy is valid.
+
+    Anonymous visitors all get the same page: it is sent with its ETag and
+    Last-Modified date and may be kept by a shared cache (CDN, reverse proxy)
+    for HTTP_CACHE_SHARED_MAX_AGE seconds, while browsers revalidate it. A
+    matching ``If-None-Match`` (or ``If-Modified-Since``) is answered with a
+    304 without rendering the template. Logged-in users, and visitors with a
+    pending flash message, get the page as usual, marked private: it must
+    not be stored by a shared cache nor revalidated.
+
+    Args:
+        get_validator (callable): Returns the ``(etag, last_modified)`` of the
+            page, from ``make_validator``, or None to skip the validation.
+        render (callable): Renders the page.
+
+    Returns:
+        Response: The page or a 304 response.
+    """
+    if current_user.is_authenticated or "_flashes" in session:
+        response = make_response(render())
+        response.cache_control.private = True
+        return response
+    try:
+        validator = get_validator()
+    except Exception:
+        # Without validator the page is still served, only not cached
+        current_app.logger.exception("Could not compute the page validator")
+        validator = None
+    if validator is None:
+        return make_response(render())
+
+    etag, last_modified = validator
+    not_modified = _set_cache_headers(current_app.response_class(), etag, last_modified)
+    not_modified.make_conditional(request)
+    if not_modified.status_code == 304:
+        return not_modified
+
+    response = make_response(render())
+    if response.status_code == 200:
+        _set_cache_headers(response, etag, last_modified)
+    return response
+
+
+def _set_cache_headers(response, etag, last_modified):
+    """Add the validators and the shared cache headers to a public page."""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = 0
+    response.cache_control.s_maxage = current_app.config.get(
+        "HTTP_CACHE_SHARED_MAX_AGE", 60
+    )
+    response.vary.add("Cookie")  # Logged-in users get another page
+    return response
@@ -0,0 +1,208 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from PIL import Image, ImageOps, features
+from sqlalchemy import update
+from models.models_sql import Recipe
+from services.process_local import ProcessLocal
+from services.upload_service import STATIC_PREFIX, VARIANTS_DIR
+from extensions import db
+
+# Variants generated for each recipe image: (width, height) and resize mode.
+# "fit" crops to the exact size (cards of the listing), "contain" keeps the
+# whole image within the box.
+IMAGE_VARIANTS = {
+    "thumb": ((160, 160), "fit"),
+    "card": ((600, 400), "fit"),
+    "full": ((1600, 1600), "contain"),
+}
+
+# WebP is about 30% smaller than JPEG at the same quality; JPEG is only used
+# when Pillow is built without WebP support.
+IMAGE_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+IMAGE_EXTENSION = "webp" if IMAGE_FORMAT == "WEBP" else "jpg"
+
+
+def _create_executor():
+    """
+    Create the image processing pool of the current process.
+
+    Returns:
+        ThreadPoolExecutor: A pool of IMAGE_WORKERS threads.
+    """
+    return ThreadPoolExecutor(
+        max_workers=current_app.config.get("IMAGE_WORKERS", 2),
+        thread_name_prefix="image",
+    )
+
+
+_executor = ProcessLocal(_create_executor)
+
+
+def render_variant(image, size, mode):
+    """
+    Resize an image for one variant.
+
+    Args:
+        image (Image): The source image, in RGB mode.
+        size (tuple[int, int]): The width and height of the variant.
+        mode (str): "fit" to crop to the exact size, "contain" to keep the
+            whole image within the size.
+
+    Returns:
+        Image: The resized image (never upscaled in "contain" mode).
+    """
+    if mode == "fit":
+        return ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+    variant = image.copy()
+    variant.thumbnail(size, Image.Resampling.LANCZOS)
+    return variant
+
+
+def generate_variants(source_path, output_dir, basename):
+    """
+    Generate the compressed variants of an image.
+
+    Args:
+        source_path (str): The path of the uploaded image.
+        output_dir (str): The directory where the variants are written.
+        basename (str): The prefix of the variant file names.
+
+    Returns:
+        dict: Mapping of variant name to the file name of the variant. Variants
+        already present are kept as they are.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    quality = current_app.config.get("IMAGE_QUALITY", 80)
+    largest = max(size for size, _ in IMAGE_VARIANTS.values())
+
+    filenames = {
+        name: f"{basename}_{name}.{IMAGE_EXTENSION}" for name in IMAGE_VARIANTS
+    }
+    if all(os.path.exists(os.path.join(output_dir, f)) for f in filenames.values()):
+        return filenames  # Same image already processed
+
+    with Image.open(source_path) as source:
+        # Let the JPEG decoder downscale large photos while decoding
+        source.draft("RGB", largest)
+        image = ImageOps.exif_transpose(source).convert("RGB")
+
+    for name, (size, mode) in IMAGE_VARIANTS.items():
+        path = os.path.join(output_dir, filenames[name])
+        variant = render_variant(image, size, mode)
+        if IMAGE_FORMAT == "WEBP":
+            variant.save(path + ".part", IMAGE_FORMAT, quality=quality, method=4)
+        else:
+            variant.save(
+                path + ".part",
+                IMAGE_FORMAT,
+                quality=quality,
+                optimize=True,
+                progressive=True,
+            )
+        os.replace(path + ".part", path)
+    return filenames
+
+
+def process_recipe_image(recipe_id, source_path):
+    """
+    Generate the variants of the image of a recipe and store their paths.
+
+    Variants are named after the stored image (the hash of its content), so
+    an image used by several recipes is only resized once.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+        source_path (str): The path of the stored image.
+
+    Returns:
+        dict: Result indicating success or failure, with the static paths of
+        the variants.
+    """
+    try:
+        upload_folder = current_app.config["UPLOADED_PHOTOS_DEST"]
+        output_dir = os.path.join(upload_folder, VARIANTS_DIR)
+        filename = os.path.basename(source_path)
+        filenames = generate_variants(
+            source_path, output_dir, filename.rsplit(".", 1)[0]
+        )
+
+        paths = {
+            name: f"{STATIC_PREFIX}{VARIANTS_DIR}/{variant}"
+            for name, variant in filenames.items()
+        }
+        # Only if the recipe still uses this image (it may have changed meanwhile)
+        db.session.execute(
+            update(Recipe)
+            .where(Recipe.id == recipe_id, Recipe.image == STATIC_PREFIX + filename)
+            .values(
+                image_thumb=paths["thumb"],
+                image_card=paths["card"],
+                image_full=paths["full"],
+            )
+        )
+        db.session.commit()
+        return {"error": False, "variants": paths}
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Image processing failed for recipe %s", recipe_id)
+        return {"error": True, "message": str(e)}
+
+
+def _process_in_background(app, recipe_id, source_path):
+    """Run ``process_recipe_image`` in a pool thread, within an app context."""
+    with app.app_context():
+        return process_recipe_image(recipe_id, source_path)
+
+
+def submit_recipe_image(recipe_id, source_path):
+    """
+    Queue the processing of a recipe image in the background pool.
+
+    The request returns immediately; until the variants are ready, the pages
+    display the uploaded image. Call it once the recipe is committed.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+        source_path (str): The path of the uploaded image.
+
+    Returns:
+        Future: The future of the ``process_recipe_image`` result.
+    """
+    app = current_app._get_current_object()
+    return _executor.get().submit(_process_in_background, app, recipe_id, source_path)
+
+
+def process_missing_variants():
+    """
+    Generate the variants of the recipe images uploaded before the pipeline existed.
+
+    Images are processed one after the other, in the current process.
+
+    Returns:
+        dict: Result indicating success or failure, with the number of images
+        processed.
+    """
+    static_folder = current_app.static_folder
+    recipes = (
+        db.session.query(Recipe.id, Recipe.image)
+        .filter(Recipe.image.isnot(None), Recipe.image_card.is_(None))
+        .all()
+    )
+
+    processed, failures = 0, []
+    for recipe_id, image in recipes:
+        result = process_recipe_image(recipe_id, os.path.join(static_folder, image))
+        if result["error"]:
+            failures.append(f"{recipe_id}: {result['message']}")
+        else:
+            processed += 1
+
+    if failures:
+        return {"error": True, "message": "; ".join(failures)}
+    return {
+        "error": False,
+        "message": "Image variants generated.",
+        "processed": processed,
+    }
@@ -1,5 +1,11 @@
+from datetime import datetime
+from sqlalchemy import String, literal, select, union_all
+from sqlalchemy.dialects import mysql
 from models.models_sql import RecipeIngredient, Ingredient
+from services.search_service import index_ingredients
+from services.recipe_index import record_index_changes
 from extensions import db
+from services.sql_dialect import dialect_insert
 
 
 def validate_ingredient_data(name_ingredient, quantity, unit):
@@ -33,6 +39,139 @@ def validate_ingredient_data(name_ingredient, quantity, unit):
     return errors
 
 
+def _fetch_ingredient_ids(names):
+    """
+    Retrieve the ingredients matching the given names in one query.
+
+    Each name is compared with the stored names by the database, with the
+    collation of the column: on MySQL "creme", "Crème" and "creme " are the
+    same ingredient, so the stored name may differ from the given one.
+
+    Args:
+        names (list[str]): The ingredient names.
+
+    Returns:
+        dict: Mapping of each given name found to the ID and stored name of
+        its ingredient.
+    """
+    requested = union_all(
+        *(select(literal(name, String).label("name")) for name in names)
+    ).subquery()
+    rows = db.session.query(
+        requested.c.name, Ingredient.id, Ingredient.name_ingredient
+    ).join(Ingredient, Ingredient.name_ingredient == requested.c.name)
+    return {name: (ingredient_id, stored) for name, ingredient_id, stored in rows}
+
+
+def resolve_ingredients(names):
+    """
+    Resolve ingredient names to IDs, creating the missing ingredients in bulk.
+
+    The existing ingredients are fetched with one query and the missing ones
+    are created with one multi-row ``INSERT`` (``ON DUPLICATE KEY`` on MySQL,
+    ``ON CONFLICT`` on SQLite, so concurrent saves cannot create duplicates),
+    whatever the number of names. New ingredients are added to the search
+    index under their stored name.
+
+    Args:
+        names (iterable[str]): The ingredient names.
+
+    Returns:
+        dict: Mapping of each given name to its ingredient ID.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+
+    ingredients = _fetch_ingredient_ids(names)
+    missing = [name for name in names if name not in ingredients]
+
+    if missing:
+        stmt = dialect_insert(Ingredient)
+        if stmt is None:
+            # Fallback for databases without upsert support: one flush for all rows.
+            new_ingredients = [Ingredient(name_ingredient=name) for name in missing]
+            db.session.add_all(new_ingredients)
+            db.session.flush()
+            created = {
+                ingredient.name_ingredient: (ingredient.id, ingredient.name_ingredient)
+                for ingredient in new_ingredients
+            }
+        else:
+            stmt = stmt.values([{"name_ingredient": name} for name in missing])
+            if isinstance(stmt, mysql.Insert):
+                stmt = stmt.on_duplicate_key_update(
+                    name_ingredient=Ingredient.name_ingredient
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=["name_ingredient"])
+            db.session.execute(stmt)
+            # Names equal for the collation share the row inserted for the first one
+            created = _fetch_ingredient_ids(missing)
+        ingredients.update(created)
+
+        # Make the new ingredients searchable.
+        index_ingredients(dict(created.values()))
+
+    return {name: ingredients[name][0] for name in names}
+
+
+def upsert_recipe_ingredients(recipe_id, ingredients_data):
+    """
+    Add or update the ingredients of a recipe with a constant number of statements.
+
+    Args:
+        recipe_id (int): The ID of the recipe.
+        ingredients_data (list[dict]): The ingredients, each with a ``name``,
+            a ``quantity`` and a ``unit``.
+
+    Returns:
+        dict: Mapping of ingredient ID to the data stored for it.
+    """
+    ingredient_ids = resolve_ingredients(data["name"] for data in ingredients_data)
+
+    # An ingredient listed twice keeps its last quantity and unit.
+    rows = {}
+    now = datetime.utcnow()
+    for data in ingredients_data:
+        ingredient_id = ingredient_ids[data["name"]]
+        rows[ingredient_id] = {
+            "recipe_id": recipe_id,
+            "ingredient_id": ingredient_id,
+            "quantity": data["quantity"],
+            "unit": data["unit"],
+            "updated_at": now,
+        }
+    if not rows:
+        return rows
+
+    stmt = dialect_insert(RecipeIngredient)
+    if stmt is None:
+        for row in rows.values():
+            db.session.merge(RecipeIngredient(**row))
+        return rows
+
+    # Column.onupdate does not apply to upserts: updated_at is set explicitly.
+    stmt = stmt.values(list(rows.values()))
+    if isinstance(stmt, mysql.Insert):
+        stmt = stmt.on_duplicate_key_update(
+            quantity=stmt.inserted.quantity,
+            unit=stmt.inserted.unit,
+            updated_at=stmt.inserted.updated_at,
+        )
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["recipe_id", "ingredient_id"],
+            set_={
+                "quantity": stmt.excluded.quantity,
+                "unit": stmt.excluded.unit,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+    db.session.execute(stmt)
+    return rows
+
+
 def add_ingredient_to_recipe(recipe_id, name_ingredient, quantity, unit):
     """
     Add an ingredient to a recipe or update its quantity and unit if it already exists.
@@ -60,6 +199,7 @@ def add_ingredient_to_recipe(recipe_id, name_ingredient, quantity, unit):
             ingredient = Ingredient(name_ingredient=name_ingredient)
             db.session.add(ingredient)
             db.session.flush()  # Assure que l'ID de l'ingrédient est disponible
+            index_ingredients({ingredient.id: name_ingredient})
 
         # Récupérer l'ID de l'ingrédient (pour l'envoyer dans la réponse)
         ingredient_id = ingredient.id
@@ -82,6 +222,7 @@ def add_ingredient_to_recipe(recipe_id, name_ingredient, quantity, unit):
                 unit=unit,
             )
             db.session.add(new_relation)
+            record_index_changes(added=[(ingredient_id, recipe_id)])
 
         # Valider les changements dans la base de données
         db.session.commit()
@@ -116,6 +257,7 @@ def delete_ingredient(recipe_id, ingredient_id):
 
         # Delete the relationship from the database.
         db.session.delete(recipe_ingredient)
+        record_index_changes(removed=[(ingredient_id, recipe_id)])
         db.session.commit()
         return {"error": False, "message": "Ingredient removed from recipe."}
 
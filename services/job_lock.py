@@ -0,0 +1,53 @@
+import fcntl
+import os
+import tempfile
+from contextlib import contextmanager
+from sqlalchemy import text
+from extensions import db
+
+
+@contextmanager
+def job_lock(name):
+    """
+    Hold a lock ensuring that a single instance of a job runs at a time.
+
+    On MySQL the lock is a named lock (``GET_LOCK``) held by a dedicated
+    connection, shared by every host using the database; otherwise it is a
+    file lock, shared by the processes of the current host. The lock is never
+    waited for: if another instance holds it, the job should be skipped.
+
+    Args:
+        name (str): The name of the job.
+
+    Yields:
+        bool: True if the lock was acquired, False if another instance holds it.
+    """
+    engine = db.engine
+    if engine.dialect.name == "mysql":
+        with engine.connect() as connection:
+            acquired = (
+                connection.execute(
+                    text("SELECT GET_LOCK(:name, 0)"), {"name": name}
+                ).scalar()
+                == 1
+            )
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    connection.execute(
+                        text("SELECT RELEASE_LOCK(:name)"), {"name": name}
+                    )
+        return
+
+    lock_path = os.path.join(tempfile.gettempdir(), f"radiscool-{name}.lock")
+    with open(lock_path, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,372 @@
+from bisect import bisect_left, bisect_right
+from flask import current_app, render_template
+from markupsafe import Markup
+from pymongo import ASCENDING
+from models.models_nosql import COMMENT_PROJECTION, CommentNoSQL
+from models.models_sql import Recipe
+from services.comment_service import get_usernames, serialize_comment
+from services.fragment_cache import fragment_cache
+from services.http_cache import make_validator
+from services.search_service import search_recipes
+from extensions import mongo_db
+
+
+def get_comments_for_recipes(recipe_ids):
+    """
+    Retrieve the comments of several recipes with a single MongoDB query.
+
+    Each comment is enriched with the username of its author, resolved in bulk.
+
+    Args:
+        recipe_ids (list[int]): The IDs of the recipes.
+
+    Returns:
+        dict: Mapping of recipe ID to the list of its comments.
+    """
+    comments_by_recipe = {recipe_id: [] for recipe_id in recipe_ids}
+    if not recipe_ids:
+        return comments_by_recipe
+
+    comments = list(
+        mongo_db.comments.find(
+            {"recipe_id": {"$in": list(recipe_ids)}}, COMMENT_PROJECTION
+        ).sort("date", ASCENDING)
+    )
+    usernames = get_usernames(comment.get("user_id") for comment in comments)
+
+    for comment in comments:
+        comment["username"] = usernames.get(comment.get("user_id"), "Unknown user")
+        comments_by_recipe.setdefault(comment["recipe_id"], []).append(comment)
+
+    return comments_by_recipe
+
+
+def build_recipe_listing(recipes):
+    """
+    Build the data displayed by the recipe listing for a list of recipes.
+
+    The whole listing is built with a constant number of queries: the average
+    ratings are read from the aggregates stored on each recipe, and the comments
+    need one MongoDB ``$in`` query plus one bulk username lookup, whatever the
+    number of recipes.
+
+    Args:
+        recipes (list[Recipe]): The recipes to display.
+
+    Returns:
+        list[dict]: One dictionary per recipe, in the shape consumed by
+        ``recipes/recipes.html``.
+    """
+    recipe_ids = [recipe.id for recipe in recipes]
+    comments = get_comments_for_recipes(recipe_ids)
+
+    return [
+        {
+            "id": recipe.id,
+            "title": recipe.title,
+            # Card-sized variant, or the uploaded image until it is generated
+            "image": recipe.image_card or recipe.image,
+            "average_rating": recipe.average_rating,
+            "comments": comments.get(recipe.id, []),
+        }
+        for recipe in recipes
+    ]
+
+
+def get_card_states(recipes, comment_summary=None):
+    """
+    Read the state each recipe card is rendered from.
+
+    The state holds the columns of the recipe shown on its card and the
+    summary of its comments, so it changes with every write to the recipe,
+    its ratings or its comments, whichever worker made it.
+
+    Args:
+        recipes (list[Recipe]): The recipes to display.
+        comment_summary (dict | None): The result of
+            ``CommentNoSQL.summarize_comments`` for the recipes, if already read.
+
+    Returns:
+        dict: Mapping of recipe ID to the state of its card.
+    """
+    if comment_summary is None:
+        comment_summary = CommentNoSQL.summarize_comments(
+            [recipe.id for recipe in recipes]
+        )
+    return {
+        recipe.id: (
+            recipe.updated_at,
+            recipe.title,
+            recipe.image_card or recipe.image,
+            recipe.rating_sum,
+            recipe.rating_count,
+            *comment_summary.get(recipe.id, (0, None)),
+        )
+        for recipe in recipes
+    }
+
+
+def render_recipe_cards(recipes, states=None):
+    """
+    Render the cards of the recipe listing, reusing the cached fragments.
+
+    Only the recipes whose card is not cached for their current state have
+    their comments loaded and their card rendered. The cards hold no per-user
+    content: the comment buttons of their author are revealed by the page.
+
+    Args:
+        recipes (list[Recipe]): The recipes to display.
+        states (dict | None): The states of the cards, from ``get_card_states``,
+            if already read.
+
+    Returns:
+        list[Markup]: The HTML of the cards, in the order of the recipes.
+    """
+    if states is None:
+        states = get_card_states(recipes)
+    cards = fragment_cache.get_many("card", states)
+
+    missing = [recipe for recipe in recipes if recipe.id not in cards]
+    rendered = {
+        item["id"]: render_template("recipes/_recipe_card.html", recipe=item)
+        for item in build_recipe_listing(missing)
+    }
+    fragment_cache.set_many("card", states, rendered)
+    cards.update(rendered)
+
+    return [Markup(cards[recipe.id]) for recipe in recipes]
+
+
+def get_listing_validator(page, states):
+    """
+    Compute the validator of a listing page from the states of its cards.
+
+    The validator is derived from the same states as the cached cards, so
+    the ETag always describes the body sent with it. The cursors are part of
+    it too: a full last page gets a "next" link when a recipe is added.
+
+    Args:
+        page (dict): The page returned by ``paginate_recipes``.
+        states (dict): The states of its cards, from ``get_card_states``.
+
+    Returns:
+        tuple: The ETag and Last-Modified date of the page.
+    """
+    return make_validator(
+        [("listing", page["next_cursor"], page["prev_cursor"])]
+        + [(recipe.id, states[recipe.id]) for recipe in page["recipes"]],
+        # The states start with the recipe date and end with the last comment date
+        [
+            date
+            for recipe in page["recipes"]
+            for date in (states[recipe.id][0], states[recipe.id][-1])
+        ],
+    )
+
+
+def get_page_size(requested=None):
+    """
+    Compute the number of recipes displayed per page.
+
+    Args:
+        requested (int | None): The page size requested by the client, if any.
+
+    Returns:
+        int: The requested page size clamped between 1 and ``RECIPES_MAX_PER_PAGE``,
+        or ``RECIPES_PER_PAGE`` when no valid size was requested.
+    """
+    default_size = current_app.config.get("RECIPES_PER_PAGE", 24)
+    max_size = current_app.config.get("RECIPES_MAX_PER_PAGE", 100)
+    if not requested or requested < 1:
+        return default_size
+    return min(requested, max_size)
+
+
+def paginate_recipes(query, after=None, before=None, page_size=None):
+    """
+    Fetch one page of recipes using keyset pagination on ``Recipe.id``.
+
+    Instead of an ``OFFSET``, the page is located with a ``WHERE id > cursor``
+    (or ``id < cursor`` when going backwards) condition served by the primary
+    key, so fetching a page costs the same whatever its position.
+
+    Args:
+        query (Query): The query selecting the recipes to paginate.
+        after (int | None): Return the recipes following this recipe ID.
+        before (int | None): Return the recipes preceding this recipe ID.
+        page_size (int | None): The number of recipes per page.
+
+    Returns:
+        dict: The recipes of the page with the ``next_cursor`` and
+        ``prev_cursor`` to request the neighbouring pages (None at the edges).
+    """
+    page_size = get_page_size(page_size)
+
+    if before is not None:
+        # Walk backwards from the cursor, then restore the ascending order.
+        rows = (
+            query.filter(Recipe.id < before)
+            .order_by(Recipe.id.desc())
+            .limit(page_size + 1)
+            .all()
+        )
+        has_more = len(rows) > page_size
+        recipes = list(reversed(rows[:page_size]))
+        has_prev, has_next = has_more, True
+    else:
+        if after is not None:
+            query = query.filter(Recipe.id > after)
+        rows = query.order_by(Recipe.id).limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        recipes = rows[:page_size]
+        has_prev, has_next = after is not None, has_more
+
+    return {
+        "recipes": recipes,
+        "next_cursor": recipes[-1].id if recipes and has_next else None,
+        "prev_cursor": recipes[0].id if recipes and has_prev else None,
+    }
+
+
+def _build_page(page, as_cards):
+    """Replace the Recipe objects of a page by their listing data or cards."""
+    recipes = page.pop("recipes")
+    if as_cards:
+        page["cards"] = render_recipe_cards(recipes)
+    else:
+        page["recipes"] = build_recipe_listing(recipes)
+    return page
+
+
+def get_recipe_listing_page(after=None, before=None, page_size=None):
+    """
+    Retrieve one page of recipes with their average ratings and comments.
+
+    Args:
+        after (int | None): Return the recipes following this recipe ID.
+        before (int | None): Return the recipes preceding this recipe ID.
+        page_size (int | None): The number of recipes per page.
+
+    Returns:
+        dict: The recipes of the page, in the shape consumed by
+        ``serialize_listing_page``, with the next and previous cursors.
+    """
+    page = paginate_recipes(Recipe.query, after, before, page_size)
+    return _build_page(page, as_cards=False)
+
+
+def _encode_rank_cursor(score, recipe_id):
+    """Encode the position of a recipe in ranked search results as a cursor."""
+    return f"{score}-{recipe_id}"
+
+
+def _decode_rank_cursor(cursor):
+    """
+    Decode a ranked search cursor into its sort key.
+
+    Args:
+        cursor (str): A cursor built by ``_encode_rank_cursor``.
+
+    Returns:
+        tuple | None: The ``(-score, recipe_id)`` sort key, or None if the
+        cursor is invalid.
+    """
+    try:
+        score, recipe_id = (int(part) for part in cursor.split("-", 1))
+    except (AttributeError, ValueError):
+        return None
+    return -score, recipe_id
+
+
+def paginate_ranked_recipes(ranked, after=None, before=None, page_size=None):
+    """
+    Fetch one page of ranked search results using keyset pagination.
+
+    Results are ordered by descending score then ascending recipe ID, and the
+    cursors encode this ``(score, id)`` key, so pages stay stable when recipes
+    are added between two requests.
+
+    Args:
+        ranked (list[tuple[int, int]]): The ``(score, recipe_id)`` pairs.
+        after (str | None): Return the results following this cursor.
+        before (str | None): Return the results preceding this cursor.
+        page_size (int | None): The number of recipes per page.
+
+    Returns:
+        dict: The Recipe objects of the page with the ``next_cursor`` and
+        ``prev_cursor`` to request the neighbouring pages (None at the edges).
+    """
+    page_size = get_page_size(page_size)
+    keys = [(-score, recipe_id) for score, recipe_id in ranked]
+
+    before_key = _decode_rank_cursor(before) if before else None
+    after_key = _decode_rank_cursor(after) if after else None
+    if before_key is not None:
+        end = bisect_left(keys, before_key)
+        start = max(0, end - page_size)
+    else:
+        start = bisect_right(keys, after_key) if after_key is not None else 0
+        end = start + page_size
+
+    page = ranked[start:end]
+    recipe_ids = [recipe_id for _, recipe_id in page]
+    recipes = {r.id: r for r in Recipe.query.filter(Recipe.id.in_(recipe_ids))}
+
+    return {
+        "recipes": [recipes[i] for i in recipe_ids if i in recipes],
+        "next_cursor": (
+            _encode_rank_cursor(*page[-1]) if page and end < len(ranked) else None
+        ),
+        "prev_cursor": _encode_rank_cursor(*page[0]) if page and start > 0 else None,
+    }
+
+
+def search_recipe_listing_page(
+    ingredient_name, mode="and", after=None, before=None, page_size=None, as_cards=False
+):
+    """
+    Retrieve one page of the recipes containing one or several ingredients.
+
+    Args:
+        ingredient_name (str): Comma-separated names of the ingredients to search for.
+        mode (str): "and" to require every ingredient, "or" for any of them.
+        after (str | None): Return the results following this cursor.
+        before (str | None): Return the results preceding this cursor.
+        page_size (int | None): The number of recipes per page.
+        as_cards (bool): Return the rendered ``cards`` of the recipes instead
+            of their data.
+
+    Returns:
+        tuple: The page (same shape as ``get_recipe_listing_page``) and an
+        error message (None if no error).
+    """
+    ranked, error = search_recipes(ingredient_name, mode)
+    if error:
+        page = {"recipes": [], "next_cursor": None, "prev_cursor": None}
+        return _build_page(page, as_cards), error
+
+    page = paginate_ranked_recipes(ranked, after, before, page_size)
+    return _build_page(page, as_cards), None
+
+
+def serialize_listing_page(page):
+    """
+    Convert a listing page into JSON-serializable data.
+
+    Args:
+        page (dict): A page returned by ``get_recipe_listing_page``.
+
+    Returns:
+        dict: The page with MongoDB identifiers and dates converted to strings.
+    """
+    return {
+        "recipes": [
+            {
+                **recipe,
+                "comments": [serialize_comment(c) for c in recipe["comments"]],
+            }
+            for recipe in page["recipes"]
+        ],
+        "next_cursor": page["next_cursor"],
+        "prev_cursor": page["prev_cursor"],
+    }
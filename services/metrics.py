@@ -0,0 +1,258 @@
+import hmac
+import os
+import time
+from flask import current_app, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+from werkzeug.exceptions import Forbidden
+from services.sql_pool import TimedQueuePool, sql_pool_metrics
+
+
+class _MongoMetricsListener(monitoring.CommandListener):
+    """Time the MongoDB commands of the process for the metrics."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        """Nothing to record before the command completes."""
+
+    def succeeded(self, event):
+        """Record the duration of the command."""
+        self.metrics.mongo_duration.labels(event.command_name).observe(
+            event.duration_micros / 1e6
+        )
+
+    def failed(self, event):
+        """Record the duration and the failure of the command."""
+        self.metrics.mongo_duration.labels(event.command_name).observe(
+            event.duration_micros / 1e6
+        )
+        self.metrics.mongo_failures.labels(event.command_name).inc()
+
+
+class Metrics:
+    """
+    Prometheus metrics of the application, exported on ``/metrics``.
+
+    - latency histogram, request and error (5xx) counters per endpoint;
+    - state of the SQL connection pool, read when the metrics are scraped,
+      and time waited for a connection;
+    - duration and failures of the MongoDB commands;
+    - duration and outcome of the scheduled jobs.
+
+    With several gunicorn workers, each worker keeps its own values: set
+    ``PROMETHEUS_MULTIPROC_DIR`` to an empty directory shared by the workers
+    (and the scheduler process) before they start, and ``/metrics`` returns
+    the values aggregated over every process. ``gunicorn.conf.py`` removes
+    the files of the processes no longer running, at startup and when a
+    worker exits.
+
+    ``/metrics`` requires ``METRICS_TOKEN`` as a bearer token, and answers
+    403 to every request while no token is configured.
+    """
+
+    def __init__(self):
+        self.mongo_listener = _MongoMetricsListener(self)
+        self.request_duration = Histogram(
+            "http_request_duration_seconds",
+            "Duration of the HTTP requests.",
+            ["endpoint", "method"],
+        )
+        self.requests = Counter(
+            "http_requests",
+            "HTTP requests served.",
+            ["endpoint", "method", "status"],
+        )
+        self.request_errors = Counter(
+            "http_request_errors",
+            "HTTP requests answered with a server error (5xx).",
+            ["endpoint", "method"],
+        )
+        # Gauges of the pools of the live workers are summed
+        self.sql_pool_size = Gauge(
+            "sql_pool_size",
+            "Connections kept open by the SQL pools.",
+            multiprocess_mode="livesum",
+        )
+        self.sql_pool_checked_out = Gauge(
+            "sql_pool_checked_out",
+            "SQL connections in use.",
+            multiprocess_mode="livesum",
+        )
+        self.sql_pool_overflow = Gauge(
+            "sql_pool_overflow",
+            "SQL connections opened beyond the pool size.",
+            multiprocess_mode="livesum",
+        )
+        self.sql_pool_wait = Histogram(
+            "sql_pool_wait_seconds",
+            "Time waited for a SQL connection.",
+            buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+        )
+        self.sql_pool_timeouts = Counter(
+            "sql_pool_timeouts", "Requests that got no SQL connection in time."
+        )
+        self.mongo_duration = Histogram(
+            "mongo_command_duration_seconds",
+            "Duration of the MongoDB commands.",
+            ["command"],
+        )
+        self.mongo_failures = Counter(
+            "mongo_command_failures", "MongoDB commands that failed.", ["command"]
+        )
+        self.job_duration = Histogram(
+            "scheduler_job_duration_seconds",
+            "Duration of the scheduled jobs.",
+            ["job"],
+            buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+        )
+        self.job_runs = Counter(
+            "scheduler_job_runs",
+            "Runs of the scheduled jobs, by outcome (success, failure, skipped).",
+            ["job", "outcome"],
+        )
+        TimedQueuePool.observers.append(self._observe_sql_pool_wait)
+
+    def init_app(self, app):
+        """
+        Time the requests of a Flask application and register ``/metrics``.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        app.config.setdefault("METRICS_ENABLED", True)
+        app.config.setdefault("METRICS_TOKEN", None)
+        if not app.config["METRICS_ENABLED"]:
+            return
+        # Registering the hooks twice would count every request twice
+        if "metrics" in app.extensions:
+            return
+        app.extensions["metrics"] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule("/metrics", "metrics", self.export)
+
+    @staticmethod
+    def is_authorized():
+        """
+        Tell whether the current request may read the metrics.
+
+        The client address is not trusted: behind a reverse proxy or the
+        platform router, every client arrives from a private address.
+
+        Returns:
+            bool: True if ``METRICS_TOKEN`` is configured and the request
+            carries it as a bearer token.
+        """
+        token = current_app.config["METRICS_TOKEN"]
+        if not token:
+            return False
+        scheme, _, given = request.headers.get("Authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(
+            given.encode(), token.encode()
+        )
+
+    @classmethod
+    def check_access(cls):
+        """
+        Reject the current request unless it may read the metrics.
+
+        Raises:
+            Forbidden: If the request is not authorized.
+        """
+        if not cls.is_authorized():
+            raise Forbidden()
+
+    @staticmethod
+    def _start_request():
+        """Note the start of the request."""
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        """Record the duration and the status of the request."""
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        # Unknown URLs share one label, so scanners cannot add series
+        endpoint = request.endpoint or "unmatched"
+        method = request.method
+        self.request_duration.labels(endpoint, method).observe(
+            time.perf_counter() - started
+        )
+        self.requests.labels(endpoint, method, str(response.status_code)).inc()
+        if response.status_code >= 500:
+            self.request_errors.labels(endpoint, method).inc()
+        return response
+
+    def _observe_sql_pool_wait(self, seconds, timed_out):
+        """Record the time waited for a SQL connection."""
+        self.sql_pool_wait.observe(seconds)
+        if timed_out:
+            self.sql_pool_timeouts.inc()
+
+    def update_sql_pool(self, engine):
+        """
+        Copy the state of the SQL connection pool of this process to the gauges.
+
+        Args:
+            engine (Engine): The SQLAlchemy engine.
+        """
+        pool = sql_pool_metrics(engine)
+        self.sql_pool_size.set(pool.get("size", 0))
+        self.sql_pool_checked_out.set(pool.get("checked_out", 0))
+        self.sql_pool_overflow.set(pool.get("overflow", 0))
+
+    def run_job(self, name, job):
+        """
+        Run a scheduled job, recording its duration and outcome.
+
+        A job fails if it raises an exception or returns a result with an
+        error.
+
+        Args:
+            name (str): The name of the job.
+            job (callable): The function running the job.
+
+        Returns:
+            The result of the job.
+        """
+        outcome = "failure"
+        started = time.perf_counter()
+        try:
+            result = job()
+            if not (isinstance(result, dict) and result.get("error")):
+                outcome = "success"
+            return result
+        finally:
+            self.job_duration.labels(name).observe(time.perf_counter() - started)
+            self.job_runs.labels(name, outcome).inc()
+
+    def export(self):
+        """
+        Export the metrics in the Prometheus text format.
+
+        Returns:
+            Response: The metrics of this process, or of every process in
+            multiprocess mode.
+        """
+        self.check_access()
+        # The pool state is read at scrape time, not on every request
+        self.update_sql_pool(current_app.extensions["sqlalchemy"].engine)
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return current_app.response_class(
+            generate_latest(registry), mimetype=CONTENT_TYPE_LATEST
+        )
@@ -0,0 +1,134 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+from services.host_semaphore import acquire_host_slot
+from services.process_local import ProcessLocal
+
+# Cost policy used when the application does not configure one. The method is
+# written in full (with the iterations), as werkzeug stores it in the hash.
+DEFAULT_HASH_METHOD = "pbkdf2:sha256:600000"
+DEFAULT_SALT_LENGTH = 16
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when too many password operations are already waiting."""
+
+
+def _create_executor():
+    """
+    Create the hashing pool of the current process.
+
+    The processes are started with "spawn": they do not inherit the database
+    connections and threads of the worker.
+
+    Returns:
+        ProcessPoolExecutor: A pool of PASSWORD_HASH_WORKERS processes.
+    """
+    return ProcessPoolExecutor(
+        max_workers=current_app.config["PASSWORD_HASH_WORKERS"],
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+_executor = ProcessLocal(_create_executor)
+
+
+def _run(function, *args):
+    """
+    Run a hashing function in the pool, or inline when the pool is disabled.
+
+    The operations queued or running are bounded per host, across the worker
+    processes: each takes a slot of the "password" host semaphore until it
+    ends, so logins cannot tie up every worker of the host.
+
+    Args:
+        function (callable): ``generate_password_hash`` or ``check_password_hash``.
+        *args: The arguments of the function.
+
+    Returns:
+        The result of the function.
+
+    Raises:
+        PasswordHasherBusy: If PASSWORD_HASH_MAX_PENDING operations are already
+            queued or running on the host, or the operation did not complete
+            within PASSWORD_HASH_TIMEOUT seconds.
+    """
+    if not current_app.config.get("PASSWORD_HASH_WORKERS"):
+        return function(*args)
+
+    executor = _executor.get()
+    # Reject at once rather than queueing requests that would time out anyway
+    slot = acquire_host_slot(
+        "password", current_app.config.get("PASSWORD_HASH_MAX_PENDING", 2)
+    )
+    if slot is None:
+        raise PasswordHasherBusy("Too many login attempts, please retry shortly.")
+    try:
+        future = executor.submit(function, *args)
+        result = future.result(
+            timeout=current_app.config.get("PASSWORD_HASH_TIMEOUT", 10)
+        )
+    except FutureTimeoutError:
+        future.cancel()  # Only dequeues it: a running hash cannot be stopped
+        # The slot is freed when the operation ends, not when the request stops
+        # waiting: a hash still running after the timeout keeps counting.
+        future.add_done_callback(lambda _: slot.close())
+        raise PasswordHasherBusy("Too many login attempts, please retry shortly.")
+    except BaseException:
+        slot.close()
+        raise
+    slot.close()
+    return result
+
+
+def hash_password(password):
+    """
+    Hash a password with the configured cost policy.
+
+    Args:
+        password (str): The password to hash.
+
+    Returns:
+        str: The hash, in the werkzeug format ``method$salt$hash``.
+    """
+    config = current_app.config
+    return _run(
+        generate_password_hash,
+        password,
+        config.get("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD),
+        config.get("PASSWORD_SALT_LENGTH", DEFAULT_SALT_LENGTH),
+    )
+
+
+def verify_password(password_hash, password):
+    """
+    Check a password against its hash.
+
+    Args:
+        password_hash (str): The stored hash.
+        password (str): The password provided by the user.
+
+    Returns:
+        bool: True if the password matches the hash.
+    """
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """
+    Check whether a hash was made with another cost policy than the current one.
+
+    Args:
+        password_hash (str): The stored hash.
+
+    Returns:
+        bool: True if the password should be hashed again at the next login.
+    """
+    config = current_app.config
+    method, _, rest = password_hash.partition("$")
+    salt = rest.partition("$")[0]
+    policy = config.get("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD)
+    salt_length = config.get("PASSWORD_SALT_LENGTH", DEFAULT_SALT_LENGTH)
+    return method != policy or len(salt) != salt_length
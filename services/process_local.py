@@ -0,0 +1,62 @@
+import os
+import threading
+
+
+class ProcessLocal:
+    """
+    Object created on first use, once per process.
+
+    gunicorn forks its workers from a parent process: an object created
+    before the fork (a pool of threads or processes, a client holding
+    sockets) would be shared with the parent, or carry threads that do not
+    exist in the child. The object is therefore created lazily, and created
+    again when it is used from another process than the one that created it.
+    The object of the parent is not closed: its resources belong to the parent.
+    """
+
+    def __init__(self, factory):
+        """
+        Args:
+            factory (callable): Creates the object, called without arguments.
+        """
+        self._factory = factory
+        self._value = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Retrieve the object of the current process, creating it if needed.
+
+        Returns:
+            The object returned by the factory in this process.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._value = self._factory()
+                    self._pid = pid
+        return self._value
+
+    def peek(self):
+        """
+        Retrieve the object of the current process without creating it.
+
+        Returns:
+            The object, or None if it was not created in this process.
+        """
+        return self._value if self._pid == os.getpid() else None
+
+    def reset(self):
+        """
+        Forget the object, so the next ``get()`` creates a new one.
+
+        Returns:
+            The forgotten object, or None: the caller closes it if needed.
+        """
+        with self._lock:
+            value = self.peek()
+            self._value = None
+            self._pid = None
+        return value
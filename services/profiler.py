@@ -0,0 +1,238 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request
+from pymongo import monitoring
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryStats:
+    """
+    Queries made while serving one request.
+
+    Counts and times the SQL statements and MongoDB commands, and keeps the
+    first statements (``QUERY_PROFILER_MAX_STATEMENTS``) to explain a slow
+    request.
+    """
+
+    def __init__(self, max_statements=100):
+        """
+        Create empty statistics.
+
+        Args:
+            max_statements (int): The number of statements kept for the logs.
+        """
+        self.max_statements = max_statements
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.mongo_count = 0
+        self.mongo_seconds = 0.0
+        self.statements = []
+        self.pending_commands = {}
+
+    def add(self, kind, seconds, statement):
+        """
+        Record a query.
+
+        Args:
+            kind (str): "sql" or "mongo".
+            seconds (float): The duration of the query.
+            statement (str): The SQL statement, or the MongoDB command and collection.
+        """
+        if kind == "sql":
+            self.sql_count += 1
+            self.sql_seconds += seconds
+        else:
+            self.mongo_count += 1
+            self.mongo_seconds += seconds
+        if len(self.statements) < self.max_statements:
+            self.statements.append((kind, seconds, statement))
+
+    def summary(self):
+        """
+        Group the recorded statements, the most expensive first.
+
+        Repeated statements (the same SQL with other parameters) are the mark
+        of an N+1 pattern: they are grouped with their number of runs.
+
+        Returns:
+            list[tuple]: The kind, statement, number of runs and total seconds.
+        """
+        groups = {}
+        for kind, seconds, statement in self.statements:
+            count, total = groups.get((kind, statement), (0, 0.0))
+            groups[(kind, statement)] = (count + 1, total + seconds)
+        return sorted(
+            (
+                (kind, statement, count, total)
+                for (kind, statement), (count, total) in groups.items()
+            ),
+            key=lambda group: group[3],
+            reverse=True,
+        )
+
+
+class _MongoCommandListener(monitoring.CommandListener):
+    """Record the MongoDB commands in the statistics of the current request."""
+
+    def started(self, event):
+        """Remember the command until it completes."""
+        stats = QueryProfiler.current_stats()
+        if stats is not None:
+            collection = event.command.get(event.command_name)
+            target = (
+                f"{event.database_name}.{collection}"
+                if isinstance(collection, str)
+                else event.database_name
+            )
+            stats.pending_commands[event.request_id] = f"{event.command_name} {target}"
+
+    def succeeded(self, event):
+        """Record the completed command."""
+        self._record(event)
+
+    def failed(self, event):
+        """Record the failed command, which counts as a query too."""
+        self._record(event)
+
+    @staticmethod
+    def _record(event):
+        stats = QueryProfiler.current_stats()
+        if stats is not None:
+            command = stats.pending_commands.pop(event.request_id, event.command_name)
+            stats.add("mongo", event.duration_micros / 1e6, command)
+
+
+class QueryProfiler:
+    """
+    Count and time the SQL statements and MongoDB commands of each request.
+
+    SQL statements are seen through the SQLAlchemy engine events, MongoDB
+    commands through a PyMongo ``CommandListener`` installed on the client.
+    A request making more than ``SLOW_REQUEST_MAX_QUERIES`` queries, or
+    spending more than ``SLOW_REQUEST_QUERY_MS`` in them, is logged with its
+    statements grouped by text, so N+1 patterns stand out. In debug mode (or
+    with ``QUERY_PROFILER_SERVER_TIMING``) the counts and times are sent in a
+    ``Server-Timing`` header, shown by the browser developer tools.
+    """
+
+    def __init__(self):
+        self.mongo_listener = _MongoCommandListener()
+        self._recorders = []
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Register the profiler on a Flask application.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        app.config.setdefault("QUERY_PROFILER_ENABLED", True)
+        app.config.setdefault("QUERY_PROFILER_SERVER_TIMING", False)
+        app.config.setdefault("QUERY_PROFILER_MAX_STATEMENTS", 100)
+        app.config.setdefault("SLOW_REQUEST_MAX_QUERIES", 30)
+        app.config.setdefault("SLOW_REQUEST_QUERY_MS", 250)
+        if not app.config["QUERY_PROFILER_ENABLED"]:
+            return
+        # Registering the hooks twice would count every query twice
+        if "query_profiler" in app.extensions:
+            return
+        app.extensions["query_profiler"] = self
+
+        # The engines are created lazily: listen to all of them
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    @staticmethod
+    def current_stats():
+        """
+        Retrieve the statistics of the current request.
+
+        Returns:
+            QueryStats | None: The statistics, or None outside a profiled request.
+        """
+        return g.get("query_stats") if has_app_context() else None
+
+    @staticmethod
+    def _start_request():
+        """Start counting the queries of the request."""
+        g.query_stats = QueryStats(current_app.config["QUERY_PROFILER_MAX_STATEMENTS"])
+
+    def _finish_request(self, response):
+        """Log a slow request and add the Server-Timing header."""
+        stats = g.pop("query_stats", None)
+        if stats is None:
+            return response
+
+        config = current_app.config
+        query_ms = (stats.sql_seconds + stats.mongo_seconds) * 1000
+        if (
+            stats.sql_count + stats.mongo_count > config["SLOW_REQUEST_MAX_QUERIES"]
+            or query_ms > config["SLOW_REQUEST_QUERY_MS"]
+        ):
+            current_app.logger.warning(
+                "Slow request %s %s: %d SQL statement(s) in %.1f ms, %d MongoDB command(s) in %.1f ms\n%s",
+                request.method,
+                request.full_path.rstrip("?"),
+                stats.sql_count,
+                stats.sql_seconds * 1000,
+                stats.mongo_count,
+                stats.mongo_seconds * 1000,
+                "\n".join(
+                    f"  {count} x {kind} ({total * 1000:.1f} ms): {statement}"
+                    for kind, statement, count, total in stats.summary()
+                ),
+            )
+
+        if current_app.debug or config["QUERY_PROFILER_SERVER_TIMING"]:
+            response.headers.add(
+                "Server-Timing",
+                f'sql;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} statement(s)"',
+            )
+            response.headers.add(
+                "Server-Timing",
+                f'mongo;dur={stats.mongo_seconds * 1000:.1f};desc="{stats.mongo_count} command(s)"',
+            )
+
+        with self._lock:
+            for recorded in self._recorders:
+                recorded.append(stats)
+        return response
+
+    @contextmanager
+    def recording(self):
+        """
+        Collect the statistics of the requests completed within the block.
+
+        Used by the tests to assert the number of queries of a route.
+
+        Yields:
+            list[QueryStats]: The statistics of each request, in order.
+        """
+        recorded = []
+        with self._lock:
+            self._recorders.append(recorded)
+        try:
+            yield recorded
+        finally:
+            with self._lock:
+                self._recorders.remove(recorded)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Note the start of a SQL statement run during a profiled request."""
+    if context is not None and QueryProfiler.current_stats() is not None:
+        context._profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Record a SQL statement run during a profiled request."""
+    started = getattr(context, "_profiler_started", None)
+    stats = QueryProfiler.current_stats()
+    if started is not None and stats is not None:
+        stats.add("sql", time.perf_counter() - started, " ".join(statement.split()))
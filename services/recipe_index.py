@@ -0,0 +1,337 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from heapq import merge
+from sqlalchemy import delete, func, insert, select
+from models.models_sql import RecipeIngredient, SearchIndexChange
+from extensions import db
+
+# Delay after which a missing change ID is considered rolled back. Changes are
+# logged in the transaction making them, so an ID can be committed after a
+# greater one; a gap is only skipped once no transaction can still be open.
+INDEX_CHANGE_GRACE = timedelta(minutes=5)
+
+# Delay after which logged changes are pruned. An index that did not read the
+# log for half this delay is rebuilt, as it could miss pruned changes.
+INDEX_CHANGE_RETENTION = timedelta(days=1)
+
+
+def intersect_sorted(left, right):
+    """
+    Intersect two sorted arrays of recipe IDs.
+
+    The shortest array is walked and each of its values is located in the
+    longest one by binary search, starting from the previous match.
+
+    Args:
+        left (array): A sorted array of recipe IDs.
+        right (array): Another sorted array of recipe IDs.
+
+    Returns:
+        array: The sorted recipe IDs present in both arrays.
+    """
+    if len(left) > len(right):
+        left, right = right, left
+
+    result = array("i")
+    position = 0
+    for value in left:
+        position = bisect_left(right, value, position)
+        if position == len(right):
+            break
+        if right[position] == value:
+            result.append(value)
+    return result
+
+
+def union_sorted(arrays):
+    """
+    Merge several sorted arrays of recipe IDs, dropping duplicates.
+
+    Args:
+        arrays (list[array]): Sorted arrays of recipe IDs.
+
+    Returns:
+        array: The sorted recipe IDs present in at least one array.
+    """
+    if len(arrays) == 1:
+        return arrays[0]
+
+    result = array("i")
+    for value in merge(*arrays):
+        if not result or result[-1] != value:
+            result.append(value)
+    return result
+
+
+class RecipeIndex:
+    """
+    In-memory inverted index of ingredient ID -> sorted array of recipe IDs.
+
+    Each worker process holds its own copy and keeps it up to date by
+    replaying the ``search_index_change`` log. ``version`` is the ID of the
+    last change reflected with all the previous ones; the changes committed
+    out of order after it are remembered in ``_applied`` until the gap is
+    filled or skipped.
+    """
+
+    def __init__(self):
+        """Create an empty index, considered stale until it is built."""
+        self._postings = {}
+        self._lock = threading.Lock()
+        self._applied = {}
+        self.version = None
+        self.synced_at = None
+
+    def build(self, pairs, version, applied=None):
+        """
+        Replace the content of the index.
+
+        Args:
+            pairs (iterable[tuple[int, int]]): ``(ingredient_id, recipe_id)``
+                pairs sorted by ingredient then recipe.
+            version (int): The ID of the last change reflected by the pairs
+                with all the previous ones.
+            applied (dict, optional): The IDs of the changes after ``version``
+                reflected by the pairs, mapped to their creation date.
+        """
+        postings = {}
+        for ingredient_id, recipe_id in pairs:
+            postings.setdefault(ingredient_id, array("i")).append(recipe_id)
+        with self._lock:
+            self._postings = postings
+            self._applied = dict(applied or {})
+            self.version = version
+            self.synced_at = time.monotonic()
+
+    def reset(self):
+        """Empty the index and mark it as stale."""
+        with self._lock:
+            self._postings = {}
+            self._applied = {}
+            self.version = None
+            self.synced_at = None
+
+    def is_stale(self):
+        """
+        Tell whether the index must be rebuilt rather than updated from the log.
+
+        Returns:
+            bool: True if the index was never built or could miss pruned changes.
+        """
+        if self.version is None:
+            return True
+        max_age = INDEX_CHANGE_RETENTION.total_seconds() / 2
+        return time.monotonic() - self.synced_at > max_age
+
+    def apply(self, changes, now=None):
+        """
+        Apply logged changes to the index.
+
+        Changes already applied are ignored, so concurrent readers of the log
+        can apply the same rows.
+
+        Args:
+            changes (iterable): ``search_index_change`` rows with an ``id``, an
+                ``ingredient_id``, a ``recipe_id``, a ``removed`` flag and a
+                ``created_at`` date, sorted by ID.
+            now (datetime, optional): The current UTC date, to skip the gaps
+                older than ``INDEX_CHANGE_GRACE``.
+
+        Returns:
+            bool: False if a change requires a rebuild; the index is then stale.
+        """
+        with self._lock:
+            if self.version is None:
+                return False
+
+            for change in changes:
+                if change.id <= self.version or change.id in self._applied:
+                    continue
+                if change.ingredient_id is None:
+                    self._postings = {}
+                    self._applied = {}
+                    self.version = None
+                    return False
+
+                if change.removed:
+                    self._remove(change.ingredient_id, change.recipe_id)
+                else:
+                    self._add(change.ingredient_id, change.recipe_id)
+                self._applied[change.id] = change.created_at
+
+            self._advance((now or datetime.utcnow()) - INDEX_CHANGE_GRACE)
+            self.synced_at = time.monotonic()
+            return True
+
+    def _add(self, ingredient_id, recipe_id):
+        recipe_ids = self._postings.setdefault(ingredient_id, array("i"))
+        position = bisect_left(recipe_ids, recipe_id)
+        if position == len(recipe_ids) or recipe_ids[position] != recipe_id:
+            recipe_ids.insert(position, recipe_id)
+
+    def _remove(self, ingredient_id, recipe_id):
+        recipe_ids = self._postings.get(ingredient_id)
+        if recipe_ids is None:
+            return
+        position = bisect_left(recipe_ids, recipe_id)
+        if position < len(recipe_ids) and recipe_ids[position] == recipe_id:
+            del recipe_ids[position]
+        if not recipe_ids:
+            del self._postings[ingredient_id]
+
+    def _advance(self, cutoff):
+        # Move the version over the applied IDs following it. A missing ID is
+        # skipped once the change after it is older than the cutoff: the
+        # transaction that allocated it was rolled back.
+        while self._applied:
+            following = self.version + 1
+            if following in self._applied:
+                del self._applied[following]
+                self.version = following
+                continue
+            next_id = min(self._applied)
+            if self._applied[next_id] >= cutoff:
+                break
+            del self._applied[next_id]
+            self.version = next_id
+
+    def recipes_for(self, ingredient_ids):
+        """
+        Retrieve the recipes containing at least one of the given ingredients.
+
+        Args:
+            ingredient_ids (iterable[int]): The IDs of the ingredients.
+
+        Returns:
+            array: A sorted array of recipe IDs.
+        """
+        with self._lock:
+            arrays = [
+                self._postings[ingredient_id]
+                for ingredient_id in ingredient_ids
+                if ingredient_id in self._postings
+            ]
+        if not arrays:
+            return array("i")
+        return union_sorted(arrays)
+
+
+# Index of the current worker process
+recipe_index = RecipeIndex()
+
+
+def _rebuild_recipe_index(now):
+    # The log and the pairs are read in the same transaction, so the changes
+    # found committed in the log are reflected by the pairs.
+    cutoff = now - INDEX_CHANGE_GRACE
+    version = db.session.execute(
+        select(func.max(SearchIndexChange.id)).where(
+            SearchIndexChange.created_at < cutoff
+        )
+    ).scalar()
+    version = version or 0
+    applied = dict(
+        db.session.execute(
+            select(SearchIndexChange.id, SearchIndexChange.created_at).where(
+                SearchIndexChange.id > version
+            )
+        ).all()
+    )
+    pairs = (
+        db.session.query(RecipeIngredient.ingredient_id, RecipeIngredient.recipe_id)
+        .order_by(RecipeIngredient.ingredient_id, RecipeIngredient.recipe_id)
+        .yield_per(10000)
+    )
+    recipe_index.build(pairs, version, applied)
+
+
+def get_recipe_index():
+    """
+    Retrieve the index of the current worker, updated with the logged changes.
+
+    The changes committed since the last call are replayed; the index is only
+    rebuilt when it is stale, a rebuild was requested or the log went back
+    (e.g. restored from a backup).
+
+    Returns:
+        RecipeIndex: An index reflecting the latest committed changes.
+    """
+    now = datetime.utcnow()
+    if not recipe_index.is_stale():
+        latest = db.session.execute(select(func.max(SearchIndexChange.id))).scalar()
+        # A log ending before the version was restored from a backup: rebuild
+        if latest is None or latest >= recipe_index.version:
+            changes = ()
+            if latest is not None and latest > recipe_index.version:
+                changes = db.session.execute(
+                    select(SearchIndexChange)
+                    .where(SearchIndexChange.id > recipe_index.version)
+                    .order_by(SearchIndexChange.id)
+                ).scalars()
+            if recipe_index.apply(changes, now):
+                return recipe_index
+
+    _rebuild_recipe_index(now)
+    return recipe_index
+
+
+def record_index_changes(added=(), removed=(), reset=False):
+    """
+    Log recipe-ingredient changes in the current transaction.
+
+    Every worker, including the current one, replays the changes on its next
+    search once the transaction commits. Nothing is logged without changes.
+
+    Args:
+        added (iterable[tuple[int, int]]): ``(ingredient_id, recipe_id)`` pairs added.
+        removed (iterable[tuple[int, int]]): ``(ingredient_id, recipe_id)`` pairs removed.
+        reset (bool): Whether every worker must rebuild its index instead.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "ingredient_id": ingredient_id,
+            "recipe_id": recipe_id,
+            "removed": True,
+            "created_at": now,
+        }
+        for ingredient_id, recipe_id in removed
+    ]
+    rows += [
+        {
+            "ingredient_id": ingredient_id,
+            "recipe_id": recipe_id,
+            "removed": False,
+            "created_at": now,
+        }
+        for ingredient_id, recipe_id in added
+    ]
+    if reset:
+        rows.append(
+            {
+                "ingredient_id": None,
+                "recipe_id": None,
+                "removed": False,
+                "created_at": now,
+            }
+        )
+    if rows:
+        db.session.execute(insert(SearchIndexChange), rows)
+
+
+def prune_index_changes():
+    """
+    Delete the logged changes older than ``INDEX_CHANGE_RETENTION``.
+
+    Returns:
+        int: The number of changes deleted.
+    """
+    cutoff = datetime.utcnow() - INDEX_CHANGE_RETENTION
+    result = db.session.execute(
+        delete(SearchIndexChange).where(SearchIndexChange.created_at < cutoff)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -1,67 +1,23 @@
-from flask import current_app
 from models.models_sql import Recipe, RecipeIngredient, Ingredient, Rating
+from models.models_nosql import CommentNoSQL
+from services.comment_service import get_comments_page
+from services.ingredient_service import upsert_recipe_ingredients
+from services.search_service import search_recipes
+from services.recipe_index import record_index_changes
+from services.http_cache import make_validator
+from services.image_service import submit_recipe_image
+from services.upload_service import (
+    acquire_images,
+    allowed_file,
+    collect_images,
+    ensure_image_file,
+    release_images,
+    store_upload,
+)
 from extensions import db
+from flask import current_app
+from sqlalchemy import exists, func, select, update
 import json
-import imghdr
-import os
-import re
-
-
-def secure_filename(filename):
-    """
-    Securely sanitizes a given filename by removing unwanted characters
-    and ensuring it does not contain potentially dangerous extensions.
-
-    This function replaces any non-alphanumeric characters (except for hyphens,
-    underscores, and periods) with underscores, and ensures the returned filename
-    is safe to use in file systems.
-
-    Args:
-        filename (str): The original filename to be sanitized.
-
-    Returns:
-        str: The sanitized and secure filename.
-    """
-    # Replace non-alphanumeric characters (except hyphens, underscores, and periods)
-    # with underscores.
-    filename = re.sub(r"[^a-zA-Z0-9_.-]", "_", filename)
-
-    # Return the basename of the filename to avoid directory traversal risks
-    # and to extract the filename without any path.
-    return os.path.basename(filename)
-
-
-def allowed_file(filename):
-    """
-    Check if a file has an allowed extension.
-
-    Args:
-        filename (str): The name of the file.
-
-    Returns:
-        bool: True if the file has an allowed extension, False otherwise.
-    """
-    return (
-        "." in filename
-        and filename.rsplit(".", 1)[1].lower()
-        in current_app.config["ALLOWED_EXTENSIONS"]
-    )
-
-
-def validate_image(file):
-    """
-    Validate whether the provided file is a valid image.
-
-    Args:
-        file (FileStorage): The file to validate.
-
-    Returns:
-        bool: True if the file is a valid image, False otherwise.
-    """
-    if not file:
-        return False
-    file_type = imghdr.what(file)
-    return file_type in current_app.config["ALLOWED_EXTENSIONS"]
 
 
 def validate_recipe_data(title, description, ingredients_json):
@@ -107,41 +63,31 @@ def add_recipe(title, description, ingredients_json, user_id, image_file):
         # Load ingredients from JSON.
         ingredients = json.loads(ingredients_json)
         new_recipe = Recipe(title=title, description=description, user_id=user_id)
+        file_path = None
 
         # Handle image upload.
         if image_file:
             if not allowed_file(image_file.filename):
                 return {"error": True, "message": "File type not allowed"}
 
-            filename = secure_filename(image_file.filename)
-            upload_folder = current_app.config["UPLOADED_PHOTOS_DEST"]
-            file_path = os.path.join(upload_folder, filename)
-            image_file.save(file_path)
-            new_recipe.image = "uploads/images/" + filename
+            new_recipe.image, file_path = store_upload(image_file)
+            acquire_images([new_recipe.image])
 
         db.session.add(new_recipe)
         db.session.flush()  # Make the recipe ID available.
 
-        # Add ingredients and their relationships.
-        for ingredient_data in ingredients:
-            ingredient_name = ingredient_data["name"]
-            ingredient = Ingredient.query.filter_by(
-                name_ingredient=ingredient_name
-            ).first()
-            if not ingredient:
-                ingredient = Ingredient(name_ingredient=ingredient_name)
-                db.session.add(ingredient)
-                db.session.flush()
-
-            new_recipe_ingredient = RecipeIngredient(
-                recipe_id=new_recipe.id,
-                ingredient_id=ingredient.id,
-                quantity=ingredient_data["quantity"],
-                unit=ingredient_data["unit"],
-            )
-            db.session.add(new_recipe_ingredient)
+        # Add ingredients and their relationships in bulk.
+        rows = upsert_recipe_ingredients(new_recipe.id, ingredients)
+        record_index_changes(
+            added=[(ingredient_id, new_recipe.id) for ingredient_id in rows]
+        )
 
         db.session.commit()
+
+        # Resize the image in the background, the request returns now.
+        if file_path:
+            ensure_image_file(new_recipe.image, image_file)
+            submit_recipe_image(new_recipe.id, file_path)
         return {"error": False, "recipe_id": new_recipe.id}
 
     except Exception as e:
@@ -151,23 +97,72 @@ def add_recipe(title, description, ingredients_json, user_id, image_file):
 
 def get_recipe_with_comments(id):
     """
-    Retrieve a recipe along with its comments.
+    Retrieve a recipe along with the first page of its comments.
 
     Args:
         id (int): The ID of the recipe.
 
     Returns:
-        dict: A dictionary containing the recipe and its comments.
+        dict: A dictionary containing the recipe, its first comments and the
+        cursor to load the following ones.
     """
     try:
         recipe = Recipe.query.get_or_404(id)
-        comments = recipe.get_comments()
-        return {"error": False, "recipe": recipe, "comments": comments}
+        page = get_comments_page(recipe.id)
+        if page["error"]:
+            return page
+        return {
+            "error": False,
+            "recipe": recipe,
+            "comments": page["comments"],
+            "next_cursor": page["next_cursor"],
+        }
 
     except Exception as e:
         return {"error": True, "message": str(e)}
 
 
+def get_recipe_validator(id):
+    """
+    Compute the validator of the page of a recipe, without loading it.
+
+    The validator covers the recipe (its ``updated_at`` is refreshed by edits
+    and ratings), its ingredients and its comments.
+
+    Args:
+        id (int): The ID of the recipe.
+
+    Returns:
+        tuple | None: The ETag and Last-Modified date of the page, or None if
+        the recipe does not exist.
+    """
+    row = (
+        db.session.query(
+            Recipe.updated_at,
+            func.count(RecipeIngredient.ingredient_id),
+            func.max(RecipeIngredient.updated_at),
+            func.max(Ingredient.updated_at),
+        )
+        .outerjoin(RecipeIngredient, RecipeIngredient.recipe_id == Recipe.id)
+        .outerjoin(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .filter(Recipe.id == id)
+        .group_by(Recipe.id)
+        .first()
+    )
+    if row is None:
+        return None
+
+    comment_count, last_comment = CommentNoSQL.summarize_comments([id]).get(
+        id, (0, None)
+    )
+    recipe_updated, ingredient_count, *ingredient_dates = row
+    return make_validator(
+        ("recipe", id, recipe_updated, ingredient_count, *ingredient_dates)
+        + (comment_count, last_comment),
+        (recipe_updated, *ingredient_dates, last_comment),
+    )
+
+
 def validate_id(id_value, id_name="ID"):
     """
     Validate if a provided ID is a positive integer.
@@ -184,6 +179,77 @@ def validate_id(id_value, id_name="ID"):
     return None
 
 
+def _delete_recipes_by_ids(recipe_ids):
+    """
+    Delete recipes with their relationships and the ingredients left unused.
+
+    Every step is a set-based statement, so the cost does not depend on the
+    number of recipes or ingredients. The caller commits the transaction.
+
+    Args:
+        recipe_ids (list[int]): The IDs of the recipes to delete.
+
+    Returns:
+        tuple: The number of recipes deleted and the images to garbage-collect
+        once the transaction is committed.
+    """
+    # Release the images of the recipes.
+    images = (
+        db.session.query(Recipe.image)
+        .filter(Recipe.id.in_(recipe_ids), Recipe.image.isnot(None))
+        .all()
+    )
+    released = release_images(image for image, in images)
+
+    # Retrieve the relationships of the recipes before deleting them.
+    pairs = (
+        db.session.query(RecipeIngredient.ingredient_id, RecipeIngredient.recipe_id)
+        .filter(RecipeIngredient.recipe_id.in_(recipe_ids))
+        .all()
+    )
+    ingredient_ids = list({ingredient_id for ingredient_id, _ in pairs})
+
+    # Delete RecipeIngredient relationships and ratings.
+    RecipeIngredient.query.filter(RecipeIngredient.recipe_id.in_(recipe_ids)).delete(
+        synchronize_session=False
+    )
+    Rating.query.filter(Rating.recipe_id.in_(recipe_ids)).delete(
+        synchronize_session=False
+    )
+
+    # Delete the recipes.
+    deleted = Recipe.query.filter(Recipe.id.in_(recipe_ids)).delete(
+        synchronize_session=False
+    )
+
+    # Delete, in one anti-join, the affected ingredients no recipe uses anymore.
+    if ingredient_ids:
+        still_used = exists().where(RecipeIngredient.ingredient_id == Ingredient.id)
+        Ingredient.query.filter(Ingredient.id.in_(ingredient_ids), ~still_used).delete(
+            synchronize_session=False
+        )
+
+    record_index_changes(removed=pairs)
+    return deleted, released
+
+
+def _delete_recipe_comments(recipe_ids):
+    """
+    Delete the comments of recipes deleted by a committed transaction.
+
+    MongoDB is not part of the SQL transaction: a failure leaves comments of
+    recipes that no longer exist, which are never displayed, so it is logged
+    rather than reported.
+
+    Args:
+        recipe_ids (list[int]): The IDs of the deleted recipes.
+    """
+    try:
+        CommentNoSQL.delete_recipe_comments(recipe_ids)
+    except Exception:
+        current_app.logger.exception("Could not delete the comments of %s", recipe_ids)
+
+
 def delete_recipe(id):
     """
     Delete a recipe and its unused ingredients.
@@ -202,26 +268,67 @@ def delete_recipe(id):
         # Retrieve the recipe to delete.
         recipe = Recipe.query.get_or_404(id)
 
-        # Retrieve ingredients related to the recipe.
-        recipe_ingredients = RecipeIngredient.query.filter_by(recipe_id=recipe.id).all()
+        recipe_ids = [recipe.id]
+        _, released = _delete_recipes_by_ids(recipe_ids)
+        db.session.commit()
+        _delete_recipe_comments(recipe_ids)
+        collect_images(released)
+
+        return {"error": False, "message": "Recipe and unused ingredients deleted."}
+
+    except Exception as e:
+        db.session.rollback()
+        return {"error": True, "message": str(e)}
+
 
-        # Delete RecipeIngredient relationships.
-        RecipeIngredient.query.filter_by(recipe_id=recipe.id).delete()
+def delete_recipes(ids, user):
+    """
+    Delete several recipes and their unused ingredients in one transaction.
 
-        # Check and delete unused ingredients.
-        for relation in recipe_ingredients:
-            ingredient_id = relation.ingredient_id
-            other_relations = RecipeIngredient.query.filter_by(
-                ingredient_id=ingredient_id
-            ).count()
-            if other_relations == 0:
-                Ingredient.query.filter_by(id=ingredient_id).delete()
+    The comments of the recipes are deleted once the transaction is committed.
 
-        # Delete the recipe.
-        db.session.delete(recipe)
+    Args:
+        ids (list[int]): The IDs of the recipes to delete.
+        user (User): The user deleting the recipes: unless a moderator, they
+            must own every recipe.
+
+    Returns:
+        dict: Result indicating success or failure, with a message and the
+        number of recipes deleted. ``forbidden`` is True when the user does
+        not own every recipe.
+    """
+    try:
+        if not isinstance(ids, list) or not ids:
+            return {"error": True, "message": "Recipe IDs must be a non-empty list."}
+        for id_value in ids:
+            error = validate_id(id_value, "Recipe ID")
+            if error:
+                return {"error": True, "message": error}
+        ids = list(set(ids))
+
+        if not user.is_moderator:
+            others = db.session.query(
+                exists().where(
+                    Recipe.id.in_(ids), Recipe.user_id.is_distinct_from(user.id)
+                )
+            ).scalar()
+            if others:
+                return {
+                    "error": True,
+                    "forbidden": True,
+                    "message": "You can only delete your own recipes.",
+                }
+
+        deleted, released = _delete_recipes_by_ids(ids)
         db.session.commit()
+        _delete_recipe_comments(ids)
+        collect_images(released)
 
-        return {"error": False, "message": "Recipe and unused ingredients deleted."}
+        return {
+            "error": False,
+            "message": "Recipes and unused ingredients deleted.",
+            "deleted": deleted,
+        }
 
     except Exception as e:
         db.session.rollback()
@@ -232,57 +339,53 @@ def edit_recipe(id, title, description, ingredients_json, image_file=None):
     try:
         recipe = Recipe.query.get_or_404(id)
 
+        # Lire les ingrédients avant d'écrire l'image, pour rejeter une
+        # saisie invalide sans rien stocker.
+        ingredients = json.loads(ingredients_json)
+
         # Mettre à jour les détails de la recette.
         recipe.title = title
         recipe.description = description
 
         # Gérer le téléchargement de l'image.
+        file_path, released = None, []
         if image_file and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            upload_folder = current_app.config["UPLOADED_PHOTOS_DEST"]
-            file_path = os.path.join(upload_folder, filename)
-            image_file.save(file_path)
-            recipe.image = "uploads/images/" + filename
-
-        # Mettre à jour les ingrédients.
-        ingredients = json.loads(ingredients_json)
-
-        # Gérer l'ajout de nouveaux ingrédients ou la mise à jour des existants.
-        for ingredient_data in ingredients:
-            ingredient_name = ingredient_data["name"]
-            ingredient = Ingredient.query.filter_by(
-                name_ingredient=ingredient_name
-            ).first()
-
-            if not ingredient:
-                # Si l'ingrédient n'existe pas, on le crée.
-                ingredient = Ingredient(name_ingredient=ingredient_name)
-                db.session.add(ingredient)
-                db.session.flush()
-
-            # Vérifier si cet ingrédient est déjà associé à cette recette.
-            recipe_ingredient = RecipeIngredient.query.filter_by(
-                recipe_id=recipe.id, ingredient_id=ingredient.id
-            ).first()
-
-            if recipe_ingredient:
-                # Si l'ingrédient existe déjà dans la recette, on met à jour les quantités et l'unité.
-                recipe_ingredient.quantity = ingredient_data["quantity"]
-                recipe_ingredient.unit = ingredient_data["unit"]
-            else:
-                # Si l'ingrédient n'est pas associé à cette recette, on crée une nouvelle association.
-                new_recipe_ingredient = RecipeIngredient(
-                    recipe_id=recipe.id,
-                    ingredient_id=ingredient.id,
-                    quantity=ingredient_data["quantity"],
-                    unit=ingredient_data["unit"],
-                )
-                db.session.add(new_recipe_ingredient)
+            image, file_path = store_upload(image_file)
+            if image != recipe.image:
+                # L'ancienne image est supprimée si plus aucune recette ne l'utilise.
+                acquire_images([image])
+                released = release_images([recipe.image])
+                recipe.image = image
+                recipe.image_thumb = recipe.image_card = recipe.image_full = None
+
+        # Gérer l'ajout de nouveaux ingrédients ou la mise à jour des existants
+        # en un nombre constant de requêtes.
+        existing = {
+            ingredient_id
+            for (ingredient_id,) in db.session.query(
+                RecipeIngredient.ingredient_id
+            ).filter(RecipeIngredient.recipe_id == recipe.id)
+        }
+        rows = upsert_recipe_ingredients(recipe.id, ingredients)
+
+        # Seuls les ingrédients ajoutés modifient l'index de recherche.
+        record_index_changes(
+            added=[
+                (ingredient_id, recipe.id) for ingredient_id in rows.keys() - existing
+            ]
+        )
 
         db.session.commit()
+
+        # Redimensionner la nouvelle image en arrière-plan.
+        collect_images(released)
+        if file_path:
+            ensure_image_file(recipe.image, image_file)
+            submit_recipe_image(recipe.id, file_path)
         return {"error": False, "message": "Recipe updated successfully."}
 
     except Exception as e:
+        db.session.rollback()
         return {"error": True, "message": str(e)}
 
 
@@ -307,13 +410,25 @@ def rate_recipe(recipe_id, user_id, stars):
             recipe_id=recipe_id, user_id=user_id
         ).first()
         if existing_rating:
+            sum_delta, count_delta = stars - existing_rating.stars, 0
             existing_rating.stars = stars
             message = "Your rating has been updated."
         else:
+            sum_delta, count_delta = stars, 1
             new_rating = Rating(stars=stars, recipe_id=recipe_id, user_id=user_id)
             db.session.add(new_rating)
             message = "Your rating has been added."
 
+        # Update the stored aggregates in the same transaction. The increment is
+        # computed by the database so concurrent ratings cannot overwrite each other.
+        Recipe.query.filter_by(id=recipe_id).update(
+            {
+                Recipe.rating_sum: Recipe.rating_sum + sum_delta,
+                Recipe.rating_count: Recipe.rating_count + count_delta,
+            },
+            synchronize_session=False,
+        )
+
         db.session.commit()
         return {"error": False, "message": message}
 
@@ -322,40 +437,69 @@ def rate_recipe(recipe_id, user_id, stars):
         return {"error": True, "message": str(e)}
 
 
-def search_recipes_by_ingredient(ingredient_name):
-    """Search recipes containing a given ingredient.
+def reconcile_rating_aggregates():
+    """
+    Recompute the rating aggregates of every recipe from the ``rating`` table.
 
-    This function queries the database for an ingredient matching the given name
-    and retrieves all recipes that include it.
+    The aggregates are recomputed in bulk with a single ``UPDATE`` statement,
+    which only touches the recipes whose stored aggregates have drifted.
+
+    Returns:
+        dict: Result indicating success or failure, with the number of recipes fixed.
+    """
+    try:
+        rating_count = (
+            select(func.count(Rating.id))
+            .where(Rating.recipe_id == Recipe.id)
+            .scalar_subquery()
+        )
+        rating_sum = (
+            select(func.coalesce(func.sum(Rating.stars), 0))
+            .where(Rating.recipe_id == Recipe.id)
+            .scalar_subquery()
+        )
+        result = db.session.execute(
+            update(Recipe)
+            .where(
+                (Recipe.rating_count != rating_count)
+                | (Recipe.rating_sum != rating_sum)
+            )
+            .values(rating_count=rating_count, rating_sum=rating_sum)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return {
+            "error": False,
+            "message": "Rating aggregates reconciled.",
+            "updated": result.rowcount,
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        return {"error": True, "message": str(e)}
+
+
+def search_recipes_by_ingredient(ingredient_name, mode="and"):
+    """Search recipes containing one or several ingredients.
+
+    This function looks the ingredients up in the search index and retrieves
+    the recipes that include them, ranked by the number of requested
+    ingredients they contain.
 
     Args:
-        ingredient_name (str): The name of the ingredient to search for.
+        ingredient_name (str): Comma-separated names of the ingredients to search for.
+        mode (str): "and" to require every ingredient, "or" for any of them.
 
     Returns:
         tuple: A list of matching Recipe objects and an error message (None if no error).
     """
-    # Check if an ingredient name was provided
-    if not ingredient_name:
-        return (
-            [],
-            "Veuillez fournir un nom d'ingrédient.",
-        )  # Return an empty list with an error message
-
-    # Search for the ingredient in the database (case-insensitive match)
-    ingredient = Ingredient.query.filter(
-        Ingredient.name_ingredient.ilike(f"%{ingredient_name}%")
-    ).first()
-
-    # If no ingredient is found, return an empty list with an error message
-    if not ingredient:
-        return [], "Aucun ingrédient trouvé avec ce nom."
-
-    # Retrieve all recipes that contain the found ingredient
-    recipes = (
-        Recipe.query.join(RecipeIngredient)
-        .filter(RecipeIngredient.ingredient_id == ingredient.id)
-        .all()
-    )
+    ranked, error = search_recipes(ingredient_name, mode)
+
+    # Return an empty list with the error message if the search failed
+    if error:
+        return [], error
 
-    # Return the list of found recipes and None (indicating no error)
-    return recipes, None
+    # Return the found recipes, in ranking order, and None (indicating no error)
+    recipe_ids = [recipe_id for _, recipe_id in ranked]
+    recipes = {r.id: r for r in Recipe.query.filter(Recipe.id.in_(recipe_ids))}
+    return [recipes[i] for i in recipe_ids if i in recipes], None
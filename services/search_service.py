@@ -0,0 +1,227 @@
+import re
+import unicodedata
+from functools import reduce
+from sqlalchemy import insert
+from models.models_sql import Ingredient, IngredientSearchToken
+from services.recipe_index import (
+    get_recipe_index,
+    intersect_sorted,
+    record_index_changes,
+)
+from extensions import db
+
+# Shortest and longest word prefixes stored in the search index.
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 64
+
+SEARCH_MODES = ("and", "or")
+
+
+def normalize_text(text):
+    """
+    Normalize a text for the search index.
+
+    The text is accent-folded, lower-cased and every non-alphanumeric
+    character is turned into a separator.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized words separated by single spaces.
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.split(r"[\W_]+", without_accents.casefold())).strip()
+
+
+def ingredient_tokens(name):
+    """
+    Compute the search tokens of an ingredient name.
+
+    Every prefix (from ``MIN_PREFIX_LENGTH`` characters) of every word of the
+    normalized name is a token, so that searching "tom" finds both "tomate"
+    and "concentré de tomate" with an exact, indexed lookup.
+
+    Args:
+        name (str): The ingredient name.
+
+    Returns:
+        set[str]: The tokens of the name.
+    """
+    tokens = set()
+    for word in normalize_text(name).split():
+        longest = min(len(word), MAX_PREFIX_LENGTH)
+        for length in range(min(MIN_PREFIX_LENGTH, longest), longest + 1):
+            tokens.add(word[:length])
+    return tokens
+
+
+def parse_search_terms(query_text):
+    """
+    Split a search query into ingredient terms.
+
+    Ingredients are separated by commas, each term being a list of normalized
+    words (e.g. "tomate, huile d'olive" gives two terms).
+
+    Args:
+        query_text (str): The raw search query.
+
+    Returns:
+        list[list[str]]: The words of each distinct term.
+    """
+    terms = []
+    for raw_term in (query_text or "").split(","):
+        words = [w[:MAX_PREFIX_LENGTH] for w in normalize_text(raw_term).split()]
+        if words and words not in terms:
+            terms.append(words)
+    return terms
+
+
+def index_ingredients(ingredients):
+    """
+    Add ingredients to the search index, replacing their previous tokens.
+
+    The caller commits the transaction.
+
+    Args:
+        ingredients (dict): Mapping of ingredient ID to ingredient name.
+    """
+    if not ingredients:
+        return
+
+    IngredientSearchToken.query.filter(
+        IngredientSearchToken.ingredient_id.in_(list(ingredients))
+    ).delete(synchronize_session=False)
+
+    rows = [
+        {"token": token, "ingredient_id": ingredient_id}
+        for ingredient_id, name in ingredients.items()
+        for token in ingredient_tokens(name)
+    ]
+    if rows:
+        db.session.execute(insert(IngredientSearchToken), rows)
+
+
+def find_ingredient_ids(terms):
+    """
+    Find the ingredients matching each search term with one indexed query.
+
+    An ingredient matches a term when each word of the term is a prefix of
+    one of the words of its name.
+
+    Args:
+        terms (list[list[str]]): The terms returned by ``parse_search_terms``.
+
+    Returns:
+        list[set[int]]: The IDs of the matching ingredients, for each term.
+    """
+    words = {word for term in terms for word in term}
+    if not words:
+        return [set() for _ in terms]
+
+    ingredients_by_token = {}
+    rows = db.session.query(
+        IngredientSearchToken.token, IngredientSearchToken.ingredient_id
+    ).filter(IngredientSearchToken.token.in_(words))
+    for token, ingredient_id in rows:
+        ingredients_by_token.setdefault(token, set()).add(ingredient_id)
+
+    return [
+        set.intersection(*(ingredients_by_token.get(word, set()) for word in term))
+        for term in terms
+    ]
+
+
+def rank_recipes(ingredient_ids_per_term, mode="and"):
+    """
+    Rank the recipes by the number of requested ingredients they contain.
+
+    The recipes of each term are read from the in-memory inverted index, so
+    combining ingredients only costs sorted array intersections.
+
+    Args:
+        ingredient_ids_per_term (list[set[int]]): The ingredients matching each term.
+        mode (str): "and" to keep only the recipes matching every term, "or"
+            to keep the recipes matching at least one term.
+
+    Returns:
+        list[tuple[int, int]]: ``(score, recipe_id)`` pairs, best score first
+        then by ascending recipe ID.
+    """
+    recipe_index = get_recipe_index()
+    recipes_per_term = [
+        recipe_index.recipes_for(ingredient_ids)
+        for ingredient_ids in ingredient_ids_per_term
+    ]
+
+    if mode == "and":
+        # Intersect the smallest arrays first to keep intermediate results small.
+        recipes_per_term.sort(key=len)
+        common = reduce(intersect_sorted, recipes_per_term)
+        return [(len(recipes_per_term), recipe_id) for recipe_id in common]
+
+    scores = {}
+    for recipe_ids in recipes_per_term:
+        for recipe_id in recipe_ids:
+            scores[recipe_id] = scores.get(recipe_id, 0) + 1
+    ranked = [(score, recipe_id) for recipe_id, score in scores.items()]
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return ranked
+
+
+def search_recipes(query_text, mode="and"):
+    """
+    Search the recipes containing one or several ingredients.
+
+    Args:
+        query_text (str): Comma-separated ingredient names (prefixes accepted).
+        mode (str): "and" to require every ingredient, "or" for any of them.
+
+    Returns:
+        tuple: The ranked ``(score, recipe_id)`` pairs and an error message
+        (None if no error).
+    """
+    terms = parse_search_terms(query_text)
+    if not terms:
+        return [], "Veuillez fournir un nom d'ingrédient."
+    if mode not in SEARCH_MODES:
+        return [], "Le mode de recherche doit être 'and' ou 'or'."
+
+    ingredient_ids_per_term = find_ingredient_ids(terms)
+    if not any(ingredient_ids_per_term):
+        return [], "Aucun ingrédient trouvé avec ce nom."
+
+    ranked = rank_recipes(ingredient_ids_per_term, mode)
+    if not ranked:
+        return [], "Aucune recette ne contient tous ces ingrédients."
+    return ranked, None
+
+
+def rebuild_search_index():
+    """
+    Rebuild the ingredient search index from the ``ingredient`` table.
+
+    A reset is logged for the in-memory recipe index too, so every worker
+    rebuilds it (e.g. after a restore).
+
+    Returns:
+        dict: Result indicating success or failure, with the number of
+        ingredients indexed.
+    """
+    try:
+        IngredientSearchToken.query.delete(synchronize_session=False)
+        ingredients = dict(db.session.query(Ingredient.id, Ingredient.name_ingredient))
+        index_ingredients(ingredients)
+        # The in-memory recipe indexes of the workers are rebuilt as well
+        record_index_changes(reset=True)
+        db.session.commit()
+        return {
+            "error": False,
+            "message": "Ingredient search index rebuilt.",
+            "indexed": len(ingredients),
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        return {"error": True, "message": str(e)}
@@ -0,0 +1,21 @@
+from sqlalchemy.dialects import mysql, sqlite
+from extensions import db
+
+
+def dialect_insert(model):
+    """
+    Build an ``INSERT`` statement supporting upserts for the current database.
+
+    Args:
+        model (db.Model): The model to insert into.
+
+    Returns:
+        Insert | None: A MySQL or SQLite insert statement, or None when the
+        database has no supported upsert syntax.
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == "mysql":
+        return mysql.insert(model)
+    if dialect_name == "sqlite":
+        return sqlite.insert(model)
+    return None
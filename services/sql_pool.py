@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool recording how long requests wait for a connection.
+
+    A wait happens when every connection of the pool (overflow included) is
+    checked out; the statistics show whether the pool is undersized.
+    """
+
+    # Callables notified of every checkout, with the seconds waited and
+    # whether the checkout timed out (the Prometheus metrics register one).
+    observers = []
+
+    def __init__(self, *args, **kwargs):
+        """Create the pool with empty wait statistics."""
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        """Check out a connection, timing the wait."""
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            for observer in self.observers:
+                observer(waited, timed_out)
+
+
+def sql_engine_options(database_uri, environ=os.environ):
+    """
+    Build the SQLAlchemy engine options from the environment.
+
+    SQLite databases keep the default SQLAlchemy pool, which the pool options
+    do not apply to.
+
+    Args:
+        database_uri (str): The URI of the SQL database.
+        environ (Mapping): The variables to read the settings from.
+
+    Returns:
+        dict: The options passed to ``create_engine`` by Flask-SQLAlchemy.
+    """
+    if not database_uri or database_uri.startswith("sqlite"):
+        return {}
+
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(environ.get("SQLALCHEMY_POOL_SIZE", "5")),
+        "max_overflow": int(environ.get("SQLALCHEMY_MAX_OVERFLOW", "5")),
+        "pool_timeout": float(environ.get("SQLALCHEMY_POOL_TIMEOUT", "10")),
+        # Renew connections before MySQL closes them (wait_timeout)
+        "pool_recycle": int(environ.get("SQLALCHEMY_POOL_RECYCLE", "280")),
+        # Test connections on checkout, so a connection dropped while idle is replaced
+        "pool_pre_ping": environ.get("SQLALCHEMY_POOL_PRE_PING", "true").lower()
+        == "true",
+        # Return connections in LIFO order, so idle ones expire instead of all staying warm
+        "pool_use_lifo": True,
+    }
+
+    connect_args = {
+        "connect_timeout": int(environ.get("SQLALCHEMY_CONNECT_TIMEOUT", "10"))
+    }
+    statement_timeout = int(environ.get("SQLALCHEMY_STATEMENT_TIMEOUT_MS", "0"))
+    if statement_timeout and database_uri.startswith("mysql"):
+        # Server-side limit of the duration of SELECT statements
+        connect_args["init_command"] = (
+            f"SET SESSION max_execution_time={statement_timeout}"
+        )
+    options["connect_args"] = connect_args
+    return options
+
+
+def sql_pool_metrics(engine):
+    """
+    Read the state of the connection pool of an engine.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine.
+
+    Returns:
+        dict: The pool size and usage, plus the wait statistics when the pool
+        is a ``TimedQueuePool``.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+
+    metrics = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            metrics.update(
+                checkouts=pool.checkouts,
+                wait_seconds_total=round(pool.wait_seconds_total, 6),
+                wait_seconds_max=round(pool.wait_seconds_max, 6),
+                timeouts=pool.timeouts,
+            )
+    return metrics
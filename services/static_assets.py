@@ -0,0 +1,130 @@
+import hashlib
+import mimetypes
+import os
+import threading
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+
+class StaticAssets:
+    """
+    Serve the static files under content-hashed URLs.
+
+    ``asset_url(filename)`` (available in the templates) adds the fingerprint
+    of the file to its URL: ``/static/css/main.css?v=<hash>``. A request
+    carrying the current fingerprint can be cached forever by the browsers,
+    since a modified file gets a new URL; other requests are revalidated
+    with the ETag and answered with 304 when the file did not change.
+
+    When ``STATIC_ACCEL_REDIRECT`` is set (e.g. "/_static/"), the file is
+    sent by nginx through ``X-Accel-Redirect`` instead of the worker;
+    ``USE_X_SENDFILE`` does the same for Apache and lighttpd.
+    """
+
+    def __init__(self):
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Replace the static view of the application and register ``asset_url``.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        app.config.setdefault("STATIC_MAX_AGE", 365 * 24 * 3600)
+        app.config.setdefault("STATIC_ACCEL_REDIRECT", None)
+        app.view_functions["static"] = self.send_static_file
+        app.jinja_env.globals["asset_url"] = self.url_for
+
+    def fingerprint(self, filename):
+        """
+        Compute the fingerprint of a static file.
+
+        The hash is cached per worker process, and recomputed when the size
+        or the modification time of the file changes.
+
+        Args:
+            filename (str): The path of the file, relative to the static folder.
+
+        Returns:
+            str: The first 16 hexadecimal digits of the SHA-256 of the file.
+
+        Raises:
+            NotFound: If the file does not exist.
+        """
+        path = safe_join(current_app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._fingerprints.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(64 * 1024), b""):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()[:16]
+        with self._lock:
+            self._fingerprints[path] = (key, digest)
+        return digest
+
+    def url_for(self, filename, **values):
+        """
+        Build the fingerprinted URL of a static file.
+
+        Args:
+            filename (str): The path of the file, relative to the static folder.
+            **values: Other arguments of ``url_for`` (e.g. ``_external``).
+
+        Returns:
+            str: The URL of the file, without fingerprint if it does not exist.
+        """
+        if filename:
+            try:
+                values["v"] = self.fingerprint(filename)
+            except NotFound:
+                pass
+        return url_for("static", filename=filename, **values)
+
+    def send_static_file(self, filename):
+        """
+        Send a static file with its ETag and long-lived cache headers.
+
+        Args:
+            filename (str): The path of the file, relative to the static folder.
+
+        Returns:
+            Response: The file, a 304 response or an X-Accel-Redirect response.
+        """
+        config = current_app.config
+        etag = self.fingerprint(filename)
+        # The URL only changes with the content: the response never goes stale
+        immutable = request.args.get("v") == etag
+        max_age = config["STATIC_MAX_AGE"] if immutable else 0
+
+        accel_prefix = config["STATIC_ACCEL_REDIRECT"]
+        if accel_prefix:
+            mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            response = current_app.response_class(mimetype=mimetype)
+            response.headers["X-Accel-Redirect"] = (
+                accel_prefix.rstrip("/") + "/" + filename
+            )
+            response.set_etag(etag)
+            response.cache_control.max_age = max_age
+            if not immutable:
+                response.cache_control.no_cache = True
+            response.make_conditional(request)
+        else:
+            response = send_from_directory(
+                current_app.static_folder, filename, etag=etag, max_age=max_age
+            )
+
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
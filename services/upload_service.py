@@ -0,0 +1,355 @@
+import glob
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from flask import current_app
+from PIL import Image, ImageFile
+from sqlalchemy import delete, insert, update
+from sqlalchemy.dialects import mysql
+from models.models_sql import Recipe, StoredImage
+from extensions import db
+from services.sql_dialect import dialect_insert
+
+# Size of the chunks read from the uploaded files
+CHUNK_SIZE = 64 * 1024
+
+# Prefix of the static paths of the uploaded images
+STATIC_PREFIX = "uploads/images/"
+
+# Directory of the resized variants, relative to the upload directory
+VARIANTS_DIR = "variants"
+
+# Magic bytes of the accepted image formats: (signature, Pillow format, extension).
+# The extension must also be listed in the ALLOWED_EXTENSIONS setting.
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "PNG", "png"),
+    (b"\xff\xd8\xff", "JPEG", "jpg"),
+    (b"GIF87a", "GIF", "gif"),
+    (b"GIF89a", "GIF", "gif"),
+)
+
+# Bytes read at most to find the dimensions of an image (JPEG metadata come first)
+HEADER_MAX_BYTES = 256 * 1024
+
+
+def allowed_file(filename):
+    """
+    Check if a file has an allowed extension.
+
+    Args:
+        filename (str): The name of the file.
+
+    Returns:
+        bool: True if the file has an allowed extension, False otherwise.
+    """
+    return (
+        "." in filename
+        and filename.rsplit(".", 1)[1].lower()
+        in current_app.config["ALLOWED_EXTENSIONS"]
+    )
+
+
+def sniff_image_format(head):
+    """
+    Identify an image from the magic bytes at the start of the file.
+
+    Args:
+        head (bytes): The first bytes of the file.
+
+    Returns:
+        tuple: The Pillow format and the extension of the stored file.
+
+    Raises:
+        ValueError: If the file is not an image of an allowed type.
+    """
+    for signature, image_format, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            if extension in current_app.config["ALLOWED_EXTENSIONS"]:
+                return image_format, extension
+            break
+    raise ValueError("File type not allowed")
+
+
+def _check_dimensions(image):
+    """Reject the images whose decoded size would be too large."""
+    config = current_app.config
+    width, height = image.size
+    max_dimension = config.get("IMAGE_MAX_DIMENSION", 8000)
+    if width > max_dimension or height > max_dimension:
+        raise ValueError(
+            f"The image is too large ({width}x{height}), "
+            f"the maximum is {max_dimension} pixels per side."
+        )
+    if width * height > config.get("IMAGE_MAX_PIXELS", 40_000_000):
+        raise ValueError(f"The image is too large ({width}x{height}).")
+
+
+def store_upload(file_storage):
+    """
+    Validate an uploaded image and store it under the SHA-256 of its content.
+
+    The upload is read once, chunk by chunk: the format is sniffed from the
+    magic bytes of the first chunk, the dimensions are read from the image
+    header as soon as it is received, and each chunk is hashed while it is
+    written to a temporary file. The file is rejected as soon as a check
+    fails, so a fake or oversized image is not written to disk entirely.
+
+    The temporary file is then renamed to ``<sha256>.<extension>``. An
+    identical file already stored is kept and the copy discarded, so the same
+    picture uploaded twice (by any user) is stored once.
+
+    Args:
+        file_storage (FileStorage): The uploaded file.
+
+    Returns:
+        tuple: The static path of the stored image (e.g.
+        "uploads/images/<sha256>.jpg") and its path on disk.
+
+    Raises:
+        ValueError: If the file is not a valid image within the limits.
+    """
+    upload_folder = current_app.config["UPLOADED_PHOTOS_DEST"]
+    max_bytes = current_app.config.get("IMAGE_MAX_BYTES", 5 * 1024 * 1024)
+    os.makedirs(upload_folder, exist_ok=True)
+
+    sha256 = hashlib.sha256()
+    parser = ImageFile.Parser()
+    image_format = extension = None
+    size = 0
+    # Temporary file in the upload folder, so the rename below is atomic
+    temporary_file = tempfile.NamedTemporaryFile(
+        dir=upload_folder, prefix=".upload-", delete=False
+    )
+    try:
+        with temporary_file:
+            for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b""):
+                if image_format is None:
+                    image_format, extension = sniff_image_format(chunk)
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError("The file is too large.")
+
+                # Feed the parser until the header (and the dimensions) is known
+                if parser is not None:
+                    try:
+                        parser.feed(chunk)
+                    except (OSError, SyntaxError, Image.DecompressionBombError):
+                        raise ValueError("The image is malformed.")
+                    if parser.image is not None:
+                        if parser.image.format != image_format:
+                            raise ValueError("The image is malformed.")
+                        _check_dimensions(parser.image)
+                        parser = None
+                    elif size > HEADER_MAX_BYTES:
+                        raise ValueError("The image is malformed.")
+
+                sha256.update(chunk)
+                temporary_file.write(chunk)
+
+        if image_format is None:
+            raise ValueError("The file is empty.")
+        if parser is not None:
+            raise ValueError("The image is malformed.")
+
+        filename = f"{sha256.hexdigest()}.{extension}"
+        file_path = os.path.join(upload_folder, filename)
+        if os.path.exists(file_path):
+            os.remove(temporary_file.name)
+        else:
+            os.replace(temporary_file.name, file_path)
+        return STATIC_PREFIX + filename, file_path
+
+    except BaseException:
+        os.remove(temporary_file.name)
+        raise
+
+
+def acquire_images(images):
+    """
+    Add references to stored images in the current transaction.
+
+    The reference is added with an upsert, so two requests storing the same
+    new image at the same time do not both insert its row. Once the
+    transaction is committed, call ``ensure_image_file`` for a new upload:
+    the file may have been collected between ``store_upload`` and the commit.
+
+    Args:
+        images (iterable[str]): The static paths of the images, once per reference.
+    """
+    for image, count in Counter(image for image in images if image).items():
+        stmt = dialect_insert(StoredImage)
+        if stmt is None:
+            result = db.session.execute(
+                update(StoredImage)
+                .where(StoredImage.image == image)
+                .values(ref_count=StoredImage.ref_count + count)
+            )
+            if result.rowcount == 0:
+                db.session.execute(
+                    insert(StoredImage).values(image=image, ref_count=count)
+                )
+            continue
+
+        stmt = stmt.values(image=image, ref_count=count)
+        if isinstance(stmt, mysql.Insert):
+            stmt = stmt.on_duplicate_key_update(ref_count=StoredImage.ref_count + count)
+        else:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["image"],
+                set_={"ref_count": StoredImage.ref_count + count},
+            )
+        db.session.execute(stmt)
+
+
+def ensure_image_file(image, file_storage):
+    """
+    Store an uploaded image again if it was collected before its reference
+    was committed.
+
+    ``store_upload`` keeps an identical file already on disk; if that file
+    was garbage-collected before the new reference was committed, the upload
+    is written again under the same name.
+
+    Args:
+        image (str): The static path returned by ``store_upload``.
+        file_storage (FileStorage): The uploaded file.
+
+    Returns:
+        str: The path of the image on disk.
+    """
+    file_path = os.path.join(
+        current_app.config["UPLOADED_PHOTOS_DEST"], os.path.basename(image)
+    )
+    if not os.path.exists(file_path):
+        file_storage.stream.seek(0)
+        store_upload(file_storage)
+    return file_path
+
+
+def release_images(images):
+    """
+    Remove references to stored images in the current transaction.
+
+    Call ``collect_images`` with the result once the transaction is committed.
+
+    Args:
+        images (iterable[str]): The static paths of the images, once per reference.
+
+    Returns:
+        list[str]: The images released, to garbage-collect after the commit.
+    """
+    counts = Counter(image for image in images if image)
+    for image, count in counts.items():
+        db.session.execute(
+            update(StoredImage)
+            .where(StoredImage.image == image)
+            .values(ref_count=StoredImage.ref_count - count)
+        )
+    return list(counts)
+
+
+def delete_image_files(image):
+    """
+    Delete the file of a stored image and its resized variants.
+
+    Only the variants named after this image are deleted: another image may
+    share the same prefix (e.g. "photo.png" and "photo_1.png").
+
+    Args:
+        image (str): The static path of the image.
+    """
+    # Imported here: the image service depends on this module
+    from services.image_service import IMAGE_EXTENSION, IMAGE_VARIANTS
+
+    upload_folder = current_app.config["UPLOADED_PHOTOS_DEST"]
+    filename = os.path.basename(image)
+    stem = filename.rsplit(".", 1)[0]
+    paths = [os.path.join(upload_folder, filename)]
+    paths += [
+        os.path.join(upload_folder, VARIANTS_DIR, f"{stem}_{name}.{IMAGE_EXTENSION}")
+        for name in IMAGE_VARIANTS
+    ]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def collect_images(images):
+    """
+    Delete the released images that are no longer referenced.
+
+    The files are deleted before the deletion of their rows is committed:
+    a request adding a reference to the same image meanwhile waits for the
+    row, then finds the file missing in ``ensure_image_file`` and stores it
+    again.
+
+    Args:
+        images (iterable[str]): The images returned by ``release_images``.
+
+    Returns:
+        list[str]: The images deleted.
+    """
+    deleted = []
+    for image in images:
+        # The row is only deleted if no reference was added in the meantime
+        result = db.session.execute(
+            delete(StoredImage).where(
+                StoredImage.image == image, StoredImage.ref_count <= 0
+            )
+        )
+        if result.rowcount:
+            delete_image_files(image)
+            deleted.append(image)
+    db.session.commit()
+    return deleted
+
+
+def reconcile_stored_images():
+    """
+    Recompute the image reference counts from the recipes and delete the
+    unreferenced files.
+
+    The counts can drift after a database restore or an interrupted request;
+    files left by them are collected too.
+
+    Returns:
+        dict: Result indicating success or failure, with the number of files deleted.
+    """
+    try:
+        counts = dict(
+            db.session.query(Recipe.image, db.func.count())
+            .filter(Recipe.image.isnot(None))
+            .group_by(Recipe.image)
+        )
+        StoredImage.query.delete(synchronize_session=False)
+        if counts:
+            db.session.execute(
+                insert(StoredImage),
+                [{"image": image, "ref_count": n} for image, n in counts.items()],
+            )
+        db.session.commit()
+
+        # Files (and variants) of images no recipe references anymore
+        upload_folder = current_app.config["UPLOADED_PHOTOS_DEST"]
+        referenced = {os.path.basename(image).rsplit(".", 1)[0] for image in counts}
+        deleted = 0
+        for path in glob.glob(os.path.join(upload_folder, "*.*")):
+            stem = os.path.basename(path).rsplit(".", 1)[0]
+            if stem not in referenced:
+                delete_image_files(STATIC_PREFIX + os.path.basename(path))
+                deleted += 1
+        for path in glob.glob(os.path.join(upload_folder, VARIANTS_DIR, "*_*")):
+            stem = os.path.basename(path).rsplit("_", 1)[0]
+            if stem not in referenced:
+                os.remove(path)
+
+        return {
+            "error": False,
+            "message": "Image references reconciled.",
+            "deleted": deleted,
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        return {"error": True, "message": str(e)}
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from models.models_sql import User
+from extensions import db
+
+# Number of user profiles kept by each worker process, and their lifetime.
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 300  # seconds
+
+# Columns of the user table kept in the cache (never the password hash)
+PROFILE_FIELDS = ("id", "username", "email")
+
+
+class UserProfileCache:
+    """
+    Bounded LRU cache of user ID -> profile, with a time-to-live per entry.
+
+    Each worker process holds its own cache. Entries are invalidated when the
+    user is updated or deleted through the ORM in this process; the TTL bounds
+    how long another process may serve a stale profile.
+    """
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        """
+        Create an empty cache.
+
+        Args:
+            maxsize (int): The maximum number of profiles kept.
+            ttl (float): The number of seconds a profile stays valid.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, user_ids):
+        """
+        Retrieve the cached profiles of several users.
+
+        Args:
+            user_ids (iterable[int]): The IDs of the users.
+
+        Returns:
+            tuple: The mapping of user ID to profile for the users found, and
+            the set of IDs missing from the cache (or expired).
+        """
+        now = time.monotonic()
+        found, missing = {}, set()
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry is None or entry[0] <= now:
+                    self._entries.pop(user_id, None)
+                    missing.add(user_id)
+                    continue
+                self._entries.move_to_end(user_id)
+                found[user_id] = entry[1]
+        return found, missing
+
+    def set_many(self, profiles):
+        """
+        Store profiles, evicting the least recently used ones beyond the size limit.
+
+        Args:
+            profiles (dict): Mapping of user ID to profile.
+        """
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for user_id, profile in profiles.items():
+                self._entries[user_id] = (expires_at, profile)
+                self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Remove the profile of a user from the cache."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        """Empty the cache."""
+        with self._lock:
+            self._entries.clear()
+
+
+# Cache of the current worker process
+user_cache = UserProfileCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    """Drop the cached profile of a user modified or deleted through the ORM."""
+    user_cache.invalidate(target.id)
+
+
+def get_user_profiles(user_ids):
+    """
+    Resolve the profiles of several users.
+
+    Profiles are read from the cache; the missing ones are loaded with a
+    single ``IN`` query and cached.
+
+    Args:
+        user_ids (iterable[int]): The IDs of the users.
+
+    Returns:
+        dict: Mapping of user ID to a ``{"id", "username", "email"}`` profile,
+        for the users that exist.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+
+    profiles, missing = user_cache.get_many(user_ids)
+    if missing:
+        columns = [getattr(User, field) for field in PROFILE_FIELDS]
+        rows = db.session.query(*columns).filter(User.id.in_(missing)).all()
+        loaded = {row.id: dict(zip(PROFILE_FIELDS, row)) for row in rows}
+        user_cache.set_many(loaded)
+        profiles.update(loaded)
+    return profiles
+
+
+def load_cached_user(user_id):
+    """
+    Load a user for Flask-Login from its cached profile.
+
+    The User is attached to the session without a SELECT: its other columns
+    (e.g. the password hash) are loaded on first access, and changes to it are
+    saved as usual.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        User | None: The user, or None if it does not exist.
+    """
+    profile = get_user_profiles([user_id]).get(user_id)
+    if profile is None:
+        return None
+
+    user = User(**profile)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
@@ -1,5 +1,5 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from models.models_sql import User
+from services.password_service import hash_password, needs_rehash, verify_password
 from extensions import db
 from flask_login import login_user
 
@@ -25,6 +25,7 @@ class UserService:
 
         Raises:
             ValueError: If the password is too weak or the email already exists.
+            PasswordHasherBusy: If too many passwords are being hashed.
         """
         # Check the strength of the password.
         if len(password) < 6:
@@ -34,10 +35,8 @@ class UserService:
         if User.query.filter_by(email=email).first():
             raise ValueError("Email address already exists")
 
-        # Hash the password for secure storage.
-        hashed_password = generate_password_hash(
-            password, method="pbkdf2:sha256", salt_length=16
-        )
+        # Hash the password for secure storage, outside of the request thread.
+        hashed_password = hash_password(password)
 
         # Create a new User instance.
         new_user = User(email=email, username=username, password=hashed_password)
@@ -60,6 +59,7 @@ class UserService:
 
         Raises:
             ValueError: If the email is not found or the password is incorrect.
+            PasswordHasherBusy: If too many passwords are being checked.
         """
         # Retrieve the user by email.
         user = User.query.filter_by(email=email).first()
@@ -68,9 +68,14 @@ class UserService:
             raise ValueError("Email not found")
 
         # Verify the password against the stored hash.
-        if not check_password_hash(user.password, password):
+        if not verify_password(user.password, password):
             raise ValueError("Password incorrect")
 
+        # Upgrade the hash when the cost policy changed since it was made.
+        if needs_rehash(user.password):
+            user.password = hash_password(password)
+            db.session.commit()
+
         return user
 
     @staticmethod
@@ -1,7 +1,11 @@
 import pytest
+from contextlib import contextmanager
 from myflaskapp import create_app
-from extensions import configure_extensions, db
+from extensions import configure_extensions, db, query_profiler
 from models.models_sql import User
+from services.fragment_cache import fragment_cache
+from services.recipe_index import recipe_index
+from services.user_cache import user_cache
 
 
 @pytest.fixture
@@ -21,6 +25,11 @@ def test_app():
         )  # Ensure login_manager and other extensions are initialized
         db.create_all()  # Create all tables before starting the tests
 
+    # Each test starts with a fresh database, so the in-memory index is stale
+    recipe_index.reset()
+    user_cache.clear()
+    fragment_cache.clear()
+
     yield app  # Provide the app instance for tests
 
     # Cleanup after tests (remove session, drop database, etc.)
@@ -55,3 +64,27 @@ def user(test_app):
             user
         )  # Ensure the user is properly associated with the session
     return user
+
+
+@pytest.fixture
+def max_queries(test_app):
+    """
+    Fixture asserting the number of queries made by each request of a block.
+
+    Usage: ``with max_queries(sql=2, mongo=0): test_client.get(url)``; the
+    block yields the statistics of the recorded requests.
+    """
+
+    @contextmanager
+    def check(sql=None, mongo=None):
+        with query_profiler.recording() as recorded:
+            yield recorded
+        assert recorded, "No request was made in the block."
+        for stats in recorded:
+            statements = "\n".join(statement for _, _, statement in stats.statements)
+            if sql is not None:
+                assert stats.sql_count <= sql, statements
+            if mongo is not None:
+                assert stats.mongo_count <= mongo, statements
+
+    return check
@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+from bson import ObjectId
+from pymongo import ReplaceOne
+from extensions import db
+from models.models_nosql import EPOCH
+from models.models_sql import Recipe
+from services.backup_service import (
+    apply_incremental_backup,
+    load_checkpoint,
+    prune_backups,
+    restore_full_backup,
+    run_backup,
+    run_incremental_backup,
+    save_checkpoint,
+)
+
+
+def test_run_backup_streams_a_compressed_archive(test_app, tmp_path):
+    test_app.config["BACKUP_DIR"] = str(tmp_path)
+    command = [sys.executable, "-c", "print('INSERT INTO recipe;' * 5000)"]
+
+    with test_app.app_context():
+        result = run_backup("mysql_test", command, "sql")
+        assert result["error"] is False
+
+        with gzip.open(result["path"]) as archive:
+            assert archive.read().startswith(b"INSERT INTO recipe;")
+        with open(result["path"], "rb") as archive:
+            data = archive.read()
+        assert result["bytes_written"] == len(data) < result["bytes_dumped"]
+        assert result["sha256"] == hashlib.sha256(data).hexdigest()
+        with open(result["path"] + ".sha256") as checksum:
+            assert checksum.read().split() == [
+                result["sha256"],
+                os.path.basename(result["path"]),
+            ]
+        with open(tmp_path / "manifest.jsonl") as manifest:
+            assert json.loads(manifest.readline())["archive"] == result["archive"]
+
+        failed = run_backup("mysql_test", [sys.executable, "-c", "exit(2)"], "sql")
+        assert failed["error"] is True
+        # The failed run leaves no partial archive behind
+        assert sorted(p.name for p in tmp_path.glob("*.gz*")) == [
+            result["archive"],
+            result["archive"] + ".sha256",
+        ]
+
+
+def test_restore_full_backup_fails_when_the_command_exits_early(test_app, tmp_path):
+    test_app.config["BACKUP_DIR"] = str(tmp_path)
+    command = [sys.executable, "-c", "import os; print(os.urandom(1 << 20).hex())"]
+
+    with test_app.app_context():
+        archive = run_backup("mysql_test", command, "sql")["path"]
+
+    # The restore command exits without reading the dump
+    with pytest.raises(subprocess.CalledProcessError):
+        restore_full_backup([sys.executable, "-c", "pass"], archive)
+
+
+def test_prune_backups_keeps_the_retention_window(tmp_path):
+    for day in range(5):
+        archive = tmp_path / f"mysql_test_2024010{day}T000000Z.sql.gz"
+        archive.write_bytes(b"")
+        os.utime(archive, (day * 86400, day * 86400))
+
+    removed = prune_backups(str(tmp_path), "mysql_test", 2, now=5 * 86400)
+    assert len(removed) == 3
+    assert sorted(p.name for p in tmp_path.iterdir())[0].startswith(
+        "mysql_test_20240103"
+    )
+
+    # The last archive is kept even when it is too old
+    assert len(prune_backups(str(tmp_path), "mysql_test", 0, now=100 * 86400)) == 1
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+@patch("services.backup_service.BATCH_SIZE", 1)
+@patch("services.backup_service.mongo_db")
+def test_incremental_backup_round_trip(mock_mongo, test_app, tmp_path):
+    test_app.config["BACKUP_DIR"] = str(tmp_path)
+    comment = {"_id": ObjectId(), "recipe_id": 1, "date": datetime(2024, 5, 1)}
+    deleted_comment_id = ObjectId()
+
+    with test_app.app_context():
+        assert run_incremental_backup("incremental_test")["error"] is True
+
+        kept = Recipe(title="Ratatouille")
+        db.session.add_all([kept, Recipe(title="Soupe")])
+        db.session.commit()
+        kept_id = kept.id
+        save_checkpoint({"sql": datetime.now() - timedelta(days=1), "mongo": EPOCH})
+
+        mock_mongo.comments.find.side_effect = lambda query, *args: (
+            [comment] if "date" in query else [{"_id": comment["_id"]}]
+        )
+        result = run_incremental_backup("incremental_test")
+        assert result["error"] is False
+        assert load_checkpoint()["sql"] > datetime.utcnow() - timedelta(minutes=1)
+
+        # The keys are streamed by batches, not as a single record
+        with gzip.open(result["path"], "rt") as archive:
+            records = [json.loads(line) for line in archive]
+        assert [
+            r["keys"] for r in records if r.get("table") == "recipe" and "keys" in r
+        ] == [[[r.id]] for r in Recipe.query.order_by(Recipe.id)]
+
+        # Changes made after the backup are undone by the restore
+        Recipe.query.get(kept_id).title = "Ratatouille niçoise"
+        db.session.add(Recipe(title="Tarte"))
+        db.session.commit()
+        mock_mongo.comments.find.side_effect = lambda query, *args: [
+            {"_id": comment["_id"]},
+            {"_id": deleted_comment_id},
+        ]
+
+        restore = apply_incremental_backup(result["path"])
+        assert restore["error"] is False, restore["message"]
+        assert sorted(r.title for r in Recipe.query) == ["Ratatouille", "Soupe"]
+        mock_mongo.comments.bulk_write.assert_called_once_with(
+            [ReplaceOne({"_id": comment["_id"]}, comment, upsert=True)],
+            ordered=False,
+        )
+        mock_mongo.comments.delete_many.assert_called_once_with(
+            {"_id": {"$in": [deleted_comment_id]}}
+        )
@@ -0,0 +1,189 @@
+import hashlib
+import io
+import os
+from unittest.mock import patch
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from extensions import db
+from models.models_sql import Recipe, StoredImage
+from services.image_service import (
+    IMAGE_EXTENSION,
+    process_recipe_image,
+    submit_recipe_image,
+)
+from services.recipe_service import add_recipe, delete_recipe, edit_recipe
+from services.upload_service import (
+    CHUNK_SIZE,
+    acquire_images,
+    collect_images,
+    ensure_image_file,
+    release_images,
+    store_upload,
+)
+
+
+def test_process_recipe_image_generates_variants(test_app, tmp_path):
+    test_app.config["UPLOADED_PHOTOS_DEST"] = str(tmp_path)
+    source = tmp_path / "photo.png"
+    Image.new("RGB", (3000, 2000), "orange").save(source)
+
+    with test_app.app_context():
+        recipe = Recipe(title="Tarte", image="uploads/images/photo.png")
+        db.session.add(recipe)
+        db.session.commit()
+
+        first = submit_recipe_image(recipe.id, str(source)).result()
+        assert first["error"] is False
+        db.session.expire_all()
+        recipe = db.session.get(Recipe, recipe.id)
+        assert recipe.image_card == first["variants"]["card"]
+
+        sizes = {}
+        for name, path in first["variants"].items():
+            with Image.open(tmp_path / "variants" / os.path.basename(path)) as variant:
+                sizes[name] = variant.size
+        assert sizes == {"thumb": (160, 160), "card": (600, 400), "full": (1600, 1067)}
+
+        # The variants of an image are only generated once
+        mtimes = [p.stat().st_mtime_ns for p in (tmp_path / "variants").iterdir()]
+        second = process_recipe_image(recipe.id, str(source))
+        assert second["variants"] == first["variants"]
+        assert [
+            p.stat().st_mtime_ns for p in (tmp_path / "variants").iterdir()
+        ] == mtimes
+
+
+def test_uploads_are_deduplicated_and_collected(test_app, tmp_path):
+    test_app.config["UPLOADED_PHOTOS_DEST"] = str(tmp_path)
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), "green").save(buffer, "PNG")
+    content = buffer.getvalue()
+
+    with test_app.app_context(), patch(
+        "services.recipe_service.submit_recipe_image"
+    ) as mock_submit, patch("models.models_nosql.mongo_db"):
+        ids = [
+            add_recipe(
+                title,
+                "Description",
+                "[]",
+                1,
+                FileStorage(io.BytesIO(content), filename=f"{title}.png"),
+            )["recipe_id"]
+            for title in ["Crêpes", "Gaufres"]
+        ]
+        assert mock_submit.call_count == 2
+
+        image = "uploads/images/" + hashlib.sha256(content).hexdigest() + ".png"
+        assert {recipe.image for recipe in Recipe.query.all()} == {image}
+        assert [p.name for p in tmp_path.iterdir()] == [os.path.basename(image)]
+        assert db.session.get(StoredImage, image).ref_count == 2
+
+        # The file is kept while a recipe still uses it
+        delete_recipe(ids[0])
+        assert db.session.get(StoredImage, image).ref_count == 1
+        assert (tmp_path / os.path.basename(image)).exists()
+
+        delete_recipe(ids[1])
+        assert db.session.get(StoredImage, image) is None
+        assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_edit_recipe_rolls_back_the_image_references(test_app, tmp_path):
+    test_app.config["UPLOADED_PHOTOS_DEST"] = str(tmp_path)
+
+    def upload(color):
+        buffer = io.BytesIO()
+        Image.new("RGB", (40, 30), color).save(buffer, "PNG")
+        return FileStorage(io.BytesIO(buffer.getvalue()), filename=f"{color}.png")
+
+    with test_app.app_context(), patch("services.recipe_service.submit_recipe_image"):
+        recipe_id = add_recipe("Crêpes", "Description", "[]", 1, upload("green"))[
+            "recipe_id"
+        ]
+        image = Recipe.query.get(recipe_id).image
+
+        # Invalid JSON is rejected before the new image is stored
+        result = edit_recipe(recipe_id, "Gaufres", "", "not json", upload("red"))
+        assert result["error"] is True
+        assert [p.name for p in tmp_path.iterdir()] == [os.path.basename(image)]
+
+        # A failure after the reference counts changed rolls them back
+        result = edit_recipe(
+            recipe_id, "Gaufres", "", '[{"name": "Sel"}]', upload("red")
+        )
+        assert result["error"] is True
+        assert Recipe.query.get(recipe_id).title == "Crêpes"
+        assert {(i.image, i.ref_count) for i in StoredImage.query} == {(image, 1)}
+
+
+def test_collect_images_keeps_other_images_variants(test_app, tmp_path):
+    test_app.config["UPLOADED_PHOTOS_DEST"] = str(tmp_path)
+    variants = tmp_path / "variants"
+    variants.mkdir()
+    for name in ["photo.png", "photo_1.png"]:
+        (tmp_path / name).write_bytes(b"image")
+        stem = name.rsplit(".", 1)[0]
+        for variant in ["thumb", "card", "full"]:
+            (variants / f"{stem}_{variant}.{IMAGE_EXTENSION}").write_bytes(b"v")
+
+    with test_app.app_context():
+        # Upserts: adding references to a new image twice does not conflict
+        acquire_images(["uploads/images/photo.png"])
+        acquire_images(["uploads/images/photo.png", "uploads/images/photo_1.png"])
+        db.session.commit()
+        assert db.session.get(StoredImage, "uploads/images/photo.png").ref_count == 2
+
+        released = release_images(["uploads/images/photo.png"] * 2)
+        db.session.commit()
+        assert collect_images(released) == ["uploads/images/photo.png"]
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["photo_1.png", "variants"]
+    assert sorted(p.name for p in variants.iterdir()) == sorted(
+        f"photo_1_{variant}.{IMAGE_EXTENSION}" for variant in ["card", "full", "thumb"]
+    )
+
+
+def test_ensure_image_file_restores_a_collected_upload(test_app, tmp_path):
+    test_app.config["UPLOADED_PHOTOS_DEST"] = str(tmp_path)
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), "blue").save(buffer, "PNG")
+    upload = FileStorage(io.BytesIO(buffer.getvalue()), filename="photo.png")
+
+    with test_app.app_context():
+        image, file_path = store_upload(upload)
+        os.remove(file_path)  # Collected before the reference was committed
+        assert ensure_image_file(image, upload) == file_path
+        assert open(file_path, "rb").read() == buffer.getvalue()
+
+
+def test_store_upload_rejects_invalid_images_early(test_app, tmp_path):
+    test_app.config["UPLOADED_PHOTOS_DEST"] = str(tmp_path)
+
+    def upload(content, filename="photo.png"):
+        stream = io.BytesIO(content)
+        with pytest.raises(ValueError) as error:
+            store_upload(FileStorage(stream, filename=filename))
+        return str(error.value), stream.tell()
+
+    with test_app.app_context():
+        # A fake image is rejected from its first chunk
+        assert upload(b"MZ" + b"\0" * (5 * 1024 * 1024)) == (
+            "File type not allowed",
+            CHUNK_SIZE,
+        )
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (9000, 10), "green").save(buffer, "PNG")
+        message, _ = upload(buffer.getvalue())
+        assert message.startswith("The image is too large (9000x10)")
+
+        assert upload(b"\x89PNG\r\n\x1a\n" + b"\0" * (512 * 1024))[0] == (
+            "The image is malformed."
+        )
+
+        test_app.config["IMAGE_MAX_BYTES"] = 100
+        assert upload(buffer.getvalue())[0] == "The file is too large."
+
+    assert list(tmp_path.iterdir()) == []  # No temporary file left
@@ -1,7 +1,15 @@
-from flask import url_for
+from flask import session, url_for
 from flask_login import login_user
 from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import patch
 import json
+from extensions import configure_extensions, db, metrics, query_profiler
+from models.models_sql import Recipe
+from prometheus_client import REGISTRY
+from services.ingredient_service import upsert_recipe_ingredients
+from services.recipe_service import rate_recipe
+from sqlalchemy import event
 
 
 # Tests
@@ -133,3 +141,253 @@ def test_rate_recipe_route(test_client, user):
         )
         assert response.status_code == 200
         assert b"Rating submitted successfully" in response.data
+
+
+def test_static_assets_are_fingerprinted(test_app, test_client):
+    with test_app.test_request_context():
+        url = test_app.jinja_env.globals["asset_url"]("css/main.css")
+    assert "?v=" in url
+
+    response = test_client.get(url)
+    assert response.status_code == 200
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 3600
+    etag = response.headers["ETag"]
+
+    # Without the fingerprint the file is revalidated with its ETag
+    response = test_client.get("/static/css/main.css", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.cache_control.no_cache
+
+    test_app.config["STATIC_ACCEL_REDIRECT"] = "/_static/"
+    response = test_client.get(url)
+    assert response.headers["X-Accel-Redirect"] == "/_static/css/main.css"
+    assert response.data == b""
+    assert response.mimetype == "text/css"
+
+
+@patch("models.models_nosql.mongo_db")
+def test_view_recipe_conditional_get(mock_mongo, test_app, test_client):
+    mock_mongo.comments.aggregate.return_value = []
+    mock_mongo.comments.find.return_value.sort.return_value.limit.return_value = []
+    with test_app.app_context():
+        recipe = Recipe(title="Tarte")
+        db.session.add(recipe)
+        db.session.commit()
+        recipe_id = recipe.id
+
+    response = test_client.get(f"/recipes/{recipe_id}")
+    assert response.status_code == 200
+    assert response.cache_control.public and response.cache_control.s_maxage == 60
+    assert "Cookie" in response.vary
+    etag = response.headers["ETag"]
+
+    response = test_client.get(f"/recipes/{recipe_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    mock_mongo.comments.find.assert_called_once()  # The page was not rendered again
+
+    # A rating refreshes the recipe, so the page changes
+    with test_app.app_context():
+        rate_recipe(recipe_id=recipe_id, user_id=1, stars=5)
+    response = test_client.get(f"/recipes/{recipe_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_api_recipes_bounded_queries(test_app, test_client):
+    def count_queries(url):
+        statements = []
+        with test_app.app_context():
+            listener = lambda *args: statements.append(args)  # noqa: E731
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                response = test_client.get(url)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+        return response, len(statements)
+
+    def add_recipes(count):
+        with test_app.app_context():
+            for _ in range(count):
+                recipe = Recipe(title="Crêpes")
+                db.session.add(recipe)
+                db.session.commit()
+                upsert_recipe_ingredients(
+                    recipe.id,
+                    [
+                        {"name": "Farine", "quantity": 250, "unit": "g"},
+                        {"name": "Lait", "quantity": 0.5, "unit": "l"},
+                    ],
+                )
+
+    add_recipes(2)
+    response, small = count_queries("/api/v1/recipes")
+    assert response.status_code == 200
+    recipes = response.get_json()["recipes"]
+    assert len(recipes) == 2
+    assert {i["name"] for i in recipes[0]["ingredients"]} == {"Farine", "Lait"}
+    assert recipes[0]["rating"] == {"average": None, "count": 0}
+
+    add_recipes(8)
+    response, large = count_queries("/api/v1/recipes")
+    assert len(response.get_json()["recipes"]) == 10
+    assert large == small  # Independent of the number of recipes
+
+    response, queries = count_queries(f"/api/v1/recipes/{recipes[0]['id']}/ingredients")
+    assert len(response.get_json()) == 2 and queries <= 2
+    assert test_client.get("/api/v1/recipes/999/rating").status_code == 404
+
+
+def test_query_profiler(test_app, test_client, max_queries, caplog):
+    with test_app.app_context():
+        recipe = Recipe(title="Crêpes")
+        db.session.add(recipe)
+        db.session.commit()
+        recipe_id = recipe.id
+
+    # The ingredients route must not run one query per ingredient
+    with max_queries(sql=2, mongo=0) as recorded:
+        test_client.get(f"/api/v1/recipes/{recipe_id}/ingredients")
+    assert recorded[0].sql_count >= 1
+
+    # Server-Timing in debug mode, slow requests logged with their statements
+    test_app.debug = True
+    test_app.config["SLOW_REQUEST_MAX_QUERIES"] = 0
+    with caplog.at_level("WARNING"):
+        response = test_client.get(f"/api/v1/recipes/{recipe_id}/rating")
+    timings = response.headers.getlist("Server-Timing")
+    assert timings[0].startswith("sql;dur=") and 'desc="1 statement(s)"' in timings[0]
+    assert timings[1].startswith("mongo;dur=")
+    assert "Slow request GET /api/v1/recipes/" in caplog.text
+    assert "1 x sql" in caplog.text and "FROM recipe" in caplog.text
+
+    # MongoDB commands are recorded by the listener of the client
+    with test_app.test_request_context():
+        query_profiler._start_request()
+        listener = query_profiler.mongo_listener
+        listener.started(
+            SimpleNamespace(
+                command={"find": "comments"},
+                command_name="find",
+                database_name="test",
+                request_id=1,
+            )
+        )
+        listener.succeeded(
+            SimpleNamespace(command_name="find", request_id=1, duration_micros=1500)
+        )
+        stats = query_profiler.current_stats()
+    assert stats.mongo_count == 1 and stats.mongo_seconds == 0.0015
+    assert stats.statements == [("mongo", 0.0015, "find test.comments")]
+
+
+def test_metrics_endpoint(test_app, test_client):
+    def sample(name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    labels = {"endpoint": "api.recipe_rating", "method": "GET", "status": "404"}
+    before = sample("http_requests_total", labels)
+    assert test_client.get("/api/v1/recipes/999/rating").status_code == 404
+    assert sample("http_requests_total", labels) == before + 1
+
+    test_app.config["METRICS_TOKEN"] = "secret"
+    response = test_client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    assert (
+        'http_request_duration_seconds_count{endpoint="api.recipe_rating",method="GET"}'
+        in body
+    )
+    assert "sql_pool_checked_out" in body
+
+    # Scheduled jobs: a result with an error is a failure
+    job = {"job": "backup_test", "outcome": "failure"}
+    before = sample("scheduler_job_runs_total", job)
+    assert metrics.run_job("backup_test", lambda: {"error": True})["error"]
+    assert sample("scheduler_job_runs_total", job) == before + 1
+
+
+def test_metrics_endpoint_is_restricted(test_app, test_client):
+    # Behind a reverse proxy every client comes from a private address
+    private = {"REMOTE_ADDR": "10.1.2.3"}
+    assert test_client.get("/metrics", environ_base=private).status_code == 403
+    assert test_client.get("/metrics").status_code == 403
+
+    test_app.config["METRICS_TOKEN"] = "secret"
+    assert test_client.get("/metrics", environ_base=private).status_code == 403
+    headers = {"Authorization": "Bearer wrong"}
+    assert test_client.get("/metrics", headers=headers).status_code == 403
+    headers = {"Authorization": "Bearer secret"}
+    response = test_client.get("/metrics", headers=headers, environ_base=private)
+    assert response.status_code == 200
+
+
+def test_configure_extensions_is_idempotent(test_app, test_client):
+    configure_extensions(test_app)
+    assert test_app.before_request_funcs[None].count(metrics._start_request) == 1
+
+    labels = {"endpoint": "api.recipe_rating", "method": "GET", "status": "404"}
+    before = REGISTRY.get_sample_value("http_requests_total", labels) or 0
+    test_client.get("/api/v1/recipes/999/rating")
+    assert REGISTRY.get_sample_value("http_requests_total", labels) == before + 1
+
+
+@patch("models.models_nosql.mongo_db")
+def test_api_recipe_comments_of_unknown_recipe(mock_mongo, test_app, test_client):
+    mock_mongo.comments.find.return_value.sort.return_value.limit.return_value = []
+    with test_app.app_context():
+        recipe = Recipe(title="Tarte")
+        db.session.add(recipe)
+        db.session.commit()
+        recipe_id = recipe.id
+
+    response = test_client.get(f"/api/v1/recipes/{recipe_id}/comments")
+    assert response.status_code == 200
+    assert response.get_json() == {"comments": [], "next_cursor": None}
+
+    mock_mongo.comments.find.reset_mock()
+    response = test_client.get(f"/api/v1/recipes/{recipe_id + 1}/comments")
+    assert response.status_code == 404
+    mock_mongo.comments.find.assert_not_called()
+
+
+@patch("models.models_nosql.mongo_db")
+@patch("services.listing_service.mongo_db")
+def test_recipe_listing_conditional_get(mock_mongo, mock_nosql, test_app):
+    mock_nosql.comments.aggregate.return_value = []
+    mock_mongo.comments.find.return_value.sort.return_value = []
+    index = test_app.view_functions["recipes.index"]
+    test_app.secret_key = "test"  # Flash messages are kept in the session
+
+    def get_listing(headers=None, flashes=None):
+        with test_app.test_request_context("/?per_page=1", headers=headers):
+            if flashes:
+                session["_flashes"] = flashes
+            return index()
+
+    with test_app.app_context():
+        db.session.add(Recipe(title="Tarte"))
+        db.session.commit()
+    response = get_listing()
+    assert response.status_code == 200 and response.cache_control.public
+    etag = response.headers["ETag"]
+    assert get_listing({"If-None-Match": etag}).status_code == 304
+
+    # A new recipe after a full last page adds a "next" link: the ETag changes
+    with test_app.app_context():
+        db.session.add(Recipe(title="Quiche"))
+        db.session.commit()
+    response = get_listing({"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+
+    # A pending flash message, or a logged-in user, gets a private page
+    response = get_listing(
+        {"If-None-Match": response.headers["ETag"]}, flashes=[("info", "Bonjour")]
+    )
+    assert response.status_code == 200
+    assert response.cache_control.private and "ETag" not in response.headers
+    with patch("services.http_cache.current_user") as mock_user:
+        mock_user.is_authenticated = True
+        response = get_listing()
+    assert response.cache_control.private and not response.cache_control.public
@@ -0,0 +1,223 @@
+import json
+from array import array
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from extensions import db
+from models.models_sql import Ingredient, Recipe, SearchIndexChange
+from services.ingredient_service import upsert_recipe_ingredients
+from services.listing_service import paginate_ranked_recipes
+from services.recipe_index import (
+    INDEX_CHANGE_GRACE,
+    RecipeIndex,
+    get_recipe_index,
+    intersect_sorted,
+    record_index_changes,
+    recipe_index,
+)
+from services.recipe_service import edit_recipe
+from services.search_service import (
+    ingredient_tokens,
+    normalize_text,
+    parse_search_terms,
+    search_recipes,
+)
+
+
+def _add_recipe(title, ingredient_names):
+    """Create a recipe with the given ingredients and return its ID."""
+    recipe = Recipe(title=title)
+    db.session.add(recipe)
+    db.session.flush()
+    rows = upsert_recipe_ingredients(
+        recipe.id,
+        [{"name": name, "quantity": 1, "unit": None} for name in ingredient_names],
+    )
+    record_index_changes(added=[(i, recipe.id) for i in rows])
+    db.session.commit()
+    return recipe.id
+
+
+def _change(id, ingredient_id, recipe_id, removed=False, created_at=None):
+    """Return a row of the search index change log."""
+    return SimpleNamespace(
+        id=id,
+        ingredient_id=ingredient_id,
+        recipe_id=recipe_id,
+        removed=removed,
+        created_at=created_at or datetime.utcnow(),
+    )
+
+
+def _ingredient_ids(name):
+    """Return the IDs of the ingredients with the given name."""
+    return [i.id for i in Ingredient.query.filter_by(name_ingredient=name)]
+
+
+def test_normalize_text_folds_case_and_accents():
+    assert normalize_text("  Crème  Fraîche-Épaisse ") == "creme fraiche epaisse"
+
+
+def test_ingredient_tokens_are_word_prefixes():
+    tokens = ingredient_tokens("Concentré de tomate")
+    assert {"co", "concentre", "de", "tom", "tomate"} <= tokens
+    assert "omate" not in tokens
+
+
+def test_parse_search_terms():
+    assert parse_search_terms("Tomate, huile d'olive, tomate") == [
+        ["tomate"],
+        ["huile", "d", "olive"],
+    ]
+
+
+def test_search_matches_every_ingredient_sharing_a_prefix(test_app):
+    with test_app.app_context():
+        salad = _add_recipe("Salade", ["Tomate"])
+        pasta = _add_recipe("Pâtes", ["Concentré de tomate"])
+        _add_recipe("Crêpes", ["Farine"])
+
+        ranked, error = search_recipes("tom")
+
+        assert error is None
+        assert [recipe_id for _, recipe_id in ranked] == [salad, pasta]
+
+
+def test_search_combines_ingredients_with_and_or(test_app):
+    with test_app.app_context():
+        both = _add_recipe("Caprese", ["Tomate", "Mozzarella"])
+        tomato_only = _add_recipe("Gaspacho", ["Tomate"])
+
+        ranked_and, _ = search_recipes("tomate, mozza", mode="and")
+        ranked_or, _ = search_recipes("tomate, mozza", mode="or")
+
+        assert ranked_and == [(2, both)]
+        # Recipes containing more requested ingredients come first.
+        assert ranked_or == [(2, both), (1, tomato_only)]
+
+
+def test_search_reports_unknown_ingredient(test_app):
+    with test_app.app_context():
+        _add_recipe("Crêpes", ["Farine"])
+        assert search_recipes("chocolat") == (
+            [],
+            "Aucun ingrédient trouvé avec ce nom.",
+        )
+
+
+def test_paginate_ranked_recipes(test_app):
+    with test_app.app_context():
+        ids = [_add_recipe(f"Recette {i}", ["Sel"]) for i in range(3)]
+        ranked = [(2, ids[2]), (1, ids[0]), (1, ids[1])]
+
+        first = paginate_ranked_recipes(ranked, page_size=2)
+        assert [r.id for r in first["recipes"]] == [ids[2], ids[0]]
+        assert first["prev_cursor"] is None
+
+        second = paginate_ranked_recipes(
+            ranked, after=first["next_cursor"], page_size=2
+        )
+        assert [r.id for r in second["recipes"]] == [ids[1]]
+        assert second["next_cursor"] is None
+
+        back = paginate_ranked_recipes(
+            ranked, before=second["prev_cursor"], page_size=2
+        )
+        assert [r.id for r in back["recipes"]] == [ids[2], ids[0]]
+
+
+def test_intersect_sorted():
+    left = array("i", [1, 3, 5, 7, 9])
+    right = array("i", [2, 3, 4, 9, 10, 11])
+    assert list(intersect_sorted(left, right)) == [3, 9]
+
+
+def test_recipe_index_waits_for_missing_changes():
+    index = RecipeIndex()
+    index.build([(1, 10), (1, 30), (2, 20)], version=4)
+
+    assert index.apply([_change(5, 1, 20), _change(6, 2, 20, removed=True)])
+    assert list(index.recipes_for([1])) == [10, 20, 30]
+    assert list(index.recipes_for([2])) == []
+    assert index.version == 6
+
+    # Change 7 is not committed yet: change 8 is applied, the version waits.
+    assert index.apply([_change(8, 3, 40)])
+    assert list(index.recipes_for([3])) == [40]
+    assert index.version == 6
+
+    # Replaying change 8 with change 7 applies change 7 only.
+    assert index.apply([_change(7, 3, 50), _change(8, 3, 40)])
+    assert list(index.recipes_for([3])) == [40, 50]
+    assert index.version == 8
+
+
+def test_recipe_index_skips_rolled_back_changes():
+    index = RecipeIndex()
+    index.build([], version=1)
+
+    old = datetime.utcnow() - INDEX_CHANGE_GRACE - timedelta(seconds=1)
+    assert index.apply([_change(3, 1, 10, created_at=old), _change(5, 1, 20)])
+    assert index.version == 3
+
+
+def test_recipe_index_is_updated_incrementally(test_app, monkeypatch):
+    with test_app.app_context():
+        first = _add_recipe("Salade", ["Tomate"])
+        assert list(get_recipe_index().recipes_for(_ingredient_ids("Tomate"))) == [
+            first
+        ]
+
+        def rebuild(now):
+            raise AssertionError("The index must not be rebuilt.")
+
+        monkeypatch.setattr("services.recipe_index._rebuild_recipe_index", rebuild)
+        second = _add_recipe("Gaspacho", ["Tomate"])
+
+        # The change logged by any worker is replayed without rebuilding.
+        assert list(get_recipe_index().recipes_for(_ingredient_ids("Tomate"))) == [
+            first,
+            second,
+        ]
+        assert recipe_index.version == 2
+
+
+def test_recipe_index_rebuilds_on_reset(test_app):
+    with test_app.app_context():
+        recipe = _add_recipe("Salade", ["Tomate"])
+        get_recipe_index()
+
+        # Simulate a restore: the relationships change without logged changes.
+        recipe_index.build([], recipe_index.version)
+        record_index_changes(reset=True)
+        db.session.commit()
+
+        assert list(get_recipe_index().recipes_for(_ingredient_ids("Tomate"))) == [
+            recipe
+        ]
+
+
+def test_edit_recipe_logs_only_added_ingredients(test_app):
+    with test_app.app_context():
+        recipe = _add_recipe("Salade", ["Tomate"])
+        logged = SearchIndexChange.query.count()
+
+        ingredients = [{"name": "Tomate", "quantity": 2, "unit": "kg"}]
+        result = edit_recipe(recipe, "Salade", "", json.dumps(ingredients))
+        assert result["error"] is False
+        assert SearchIndexChange.query.count() == logged
+
+        ingredients.append({"name": "Basilic", "quantity": 1, "unit": None})
+        edit_recipe(recipe, "Salade", "", json.dumps(ingredients))
+        assert SearchIndexChange.query.count() == logged + 1
+
+
+def test_recipe_index_rebuilds_when_the_log_goes_back(test_app):
+    with test_app.app_context():
+        recipe = _add_recipe("Salade", ["Tomate"])
+        get_recipe_index()
+
+        # Simulate a restore of an older log.
+        recipe_index.build([], recipe_index.version + 10)
+        assert list(get_recipe_index().recipes_for(_ingredient_ids("Tomate"))) == [
+            recipe
+        ]
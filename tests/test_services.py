@@ -1,10 +1,56 @@
+from datetime import datetime
 from unittest.mock import patch, MagicMock
-from services.comment_service import add_comment, delete_comment, update_comment
+import pytest
+from bson import ObjectId
+from flask import Flask
+from pymongo import ASCENDING
+from sqlalchemy import create_engine, event, exc, text
+from extensions import db, ensure_mongo_indexes, mongo, mongo_db
+from models.models_nosql import (
+    CommentNoSQL,
+    COMMENT_PROJECTION,
+    encode_comment_cursor,
+    decode_comment_cursor,
+)
+from models.models_sql import User, Recipe, Rating, Ingredient, RecipeIngredient
+from services import password_service
+from services.comment_service import (
+    add_comment,
+    delete_comment,
+    update_comment,
+    get_comments_page,
+)
+from services.fragment_cache import fragment_cache
+from services.host_semaphore import acquire_host_slot
 from services.ingredient_service import (
     add_ingredient_to_recipe,
     delete_ingredient,
+    resolve_ingredients,
+    upsert_recipe_ingredients,
+)
+from services.job_lock import job_lock
+from services.listing_service import (
+    build_recipe_listing,
+    paginate_recipes,
+    render_recipe_cards,
+)
+from services.password_service import PasswordHasherBusy, hash_password
+from services.recipe_service import (
+    add_recipe,
+    delete_recipe,
+    delete_recipes,
+    rate_recipe,
+    reconcile_rating_aggregates,
 )
-from services.recipe_service import add_recipe, delete_recipe, rate_recipe
+from services.search_service import find_ingredient_ids
+from services.sql_pool import sql_engine_options, sql_pool_metrics, TimedQueuePool
+from services.user_cache import (
+    UserProfileCache,
+    get_user_profiles,
+    load_cached_user,
+    user_cache,
+)
+from services.user_service import UserService
 
 
 # Comment Service Tests
@@ -32,6 +78,152 @@ def test_update_comment(mock_comment):
     assert result["message"] == "Comment updated."
 
 
+@patch("models.models_nosql.mongo_db")
+def test_get_comments_by_recipe_projects_and_sorts(mock_mongo):
+    mock_mongo.comments.find.return_value.sort.return_value = []
+    assert CommentNoSQL.get_comments_by_recipe(3) == []
+    mock_mongo.comments.find.assert_called_once_with(
+        {"recipe_id": 3}, COMMENT_PROJECTION
+    )
+    mock_mongo.comments.find.return_value.sort.assert_called_once_with(
+        "date", ASCENDING
+    )
+
+
+def test_comment_cursor_round_trip():
+    comment = {"_id": ObjectId(), "date": datetime(2024, 5, 1, 12, 30, 15, 250000)}
+    assert decode_comment_cursor(encode_comment_cursor(comment)) == (
+        comment["date"],
+        comment["_id"],
+    )
+
+
+@patch("models.models_nosql.mongo_db")
+def test_get_comments_page_uses_keyset(mock_mongo):
+    comments = [{"_id": ObjectId(), "date": datetime(2024, 5, i + 1)} for i in range(3)]
+    cursor = mock_mongo.comments.find.return_value.sort.return_value
+    cursor.limit.return_value = comments
+
+    page, next_cursor = CommentNoSQL.get_comments_page(3, limit=2)
+    assert page == comments[:2]
+    assert next_cursor == encode_comment_cursor(comments[1])
+    cursor.limit.assert_called_once_with(3)
+
+    cursor.limit.return_value = comments[2:]
+    page, next_cursor = CommentNoSQL.get_comments_page(3, after=next_cursor, limit=2)
+    assert page == comments[2:]
+    assert next_cursor is None
+    query = mock_mongo.comments.find.call_args[0][0]
+    assert query["$or"] == [
+        {"date": {"$gt": comments[1]["date"]}},
+        {"date": comments[1]["date"], "_id": {"$gt": comments[1]["_id"]}},
+    ]
+
+
+@patch("services.comment_service.get_usernames")
+@patch("services.comment_service.CommentNoSQL")
+def test_get_comments_page_service(mock_comment, mock_usernames, test_app):
+    mock_comment.get_comments_page.return_value = ([{"user_id": 1}], "cursor")
+    mock_usernames.return_value = {1: "alice"}
+
+    with test_app.app_context():
+        result = get_comments_page(3, page_size=1000)
+        assert result["error"] is False
+        assert result["comments"] == [{"user_id": 1, "username": "alice"}]
+        assert result["next_cursor"] == "cursor"
+        mock_comment.get_comments_page.assert_called_once_with(
+            3, after=None, limit=test_app.config.get("COMMENTS_MAX_PER_PAGE", 100)
+        )
+
+        mock_comment.get_comments_page.side_effect = ValueError
+        result = get_comments_page(3, after="bad")
+        assert result["message"] == "Invalid comment cursor."
+
+
+@patch("extensions.mongo_db")
+def test_ensure_mongo_indexes(mock_mongo):
+    mock_mongo.comments.create_index.side_effect = lambda keys, name: name
+    assert ensure_mongo_indexes() == ["recipe_id_date", "user_id", "date"]
+    mock_mongo.comments.create_index.assert_any_call(
+        [("recipe_id", ASCENDING), ("date", ASCENDING)], name="recipe_id_date"
+    )
+
+
+def test_mongo_client_is_lazy_and_per_process():
+    app = Flask(__name__)
+    app.config.update(
+        MONGO_URI="mongodb://localhost:1",
+        MONGO_DB_NAME="radiscool",
+        MONGO_SERVER_SELECTION_TIMEOUT_MS=100,
+        MONGO_TLS=False,
+    )
+    mongo.init_app(app)
+    assert app.extensions["mongo"].peek() is None  # Nothing created yet
+
+    with app.app_context():
+        client = mongo.client
+        assert mongo.client is client
+        assert mongo_db.comments.full_name == "radiscool.comments"
+        assert client.options.pool_options.max_pool_size == 50
+
+        # A forked worker gets its own client
+        with patch("services.process_local.os.getpid", return_value=-1):
+            assert mongo.client is not client
+
+        reachable, error = mongo.ping()
+        assert reachable is False
+        assert error
+
+
+# SQL Pool Tests
+def test_sql_engine_options_from_environment():
+    assert sql_engine_options("sqlite:///:memory:") == {}
+
+    options = sql_engine_options(
+        "mysql://user:pass@db/radiscool",
+        {"SQLALCHEMY_POOL_SIZE": "8", "SQLALCHEMY_STATEMENT_TIMEOUT_MS": "3000"},
+    )
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_size"] == 8
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"]["init_command"] == (
+        "SET SESSION max_execution_time=3000"
+    )
+
+
+def test_timed_queue_pool_metrics(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    with engine.connect():
+        assert sql_pool_metrics(engine)["checked_out"] == 1
+        try:
+            engine.connect()
+        except exc.TimeoutError:
+            pass
+
+    metrics = sql_pool_metrics(engine)
+    assert metrics["checked_out"] == 0
+    assert metrics["checkouts"] == 2
+    assert metrics["timeouts"] == 1
+    assert metrics["wait_seconds_max"] >= 0.05
+    engine.dispose()
+
+
+# Scheduler Tests
+def test_job_lock_allows_a_single_instance(test_app):
+    with test_app.app_context():
+        with job_lock("test_job") as first, job_lock("test_job") as second:
+            assert first is True
+            assert second is False
+        with job_lock("test_job") as again:
+            assert again is True
+
+
 # Ingredient Service Tests
 @patch("services.ingredient_service.db.session")
 @patch("services.ingredient_service.Ingredient")
@@ -58,6 +250,62 @@ def test_delete_ingredient(mock_recipe_ingredient, mock_db):
     assert result["message"] == "Ingredient removed from recipe."
 
 
+def test_upsert_recipe_ingredients_in_bulk(test_app):
+    with test_app.app_context():
+        recipe = Recipe(title="Pot-au-feu")
+        db.session.add_all([recipe, Ingredient(name_ingredient="Carotte")])
+        db.session.commit()
+        recipe_id = recipe.id
+        ingredients = [
+            {"name": name, "quantity": 1, "unit": "kg"}
+            for name in ["Carotte", "Poireau", "Boeuf", "Navet"]
+        ]
+
+        statements = []
+        event.listen(
+            db.engine, "before_cursor_execute", lambda *a: statements.append(a)
+        )
+        upsert_recipe_ingredients(recipe_id, ingredients)
+        ingredients[0]["quantity"] = 3
+        upsert_recipe_ingredients(recipe_id, ingredients)
+        db.session.commit()
+
+        # Lookup, insert, re-lookup, search index refresh (delete and insert) and
+        # relation upsert, then only the lookup and the upsert the second time.
+        assert len(statements) == 8
+        assert Ingredient.query.count() == 4
+        carrot = RecipeIngredient.query.join(Ingredient).filter(
+            Ingredient.name_ingredient == "Carotte"
+        )
+        assert carrot.one().quantity == 3
+        assert RecipeIngredient.query.filter_by(recipe_id=recipe_id).count() == 4
+
+
+def test_resolve_ingredients_uses_the_database_collation(test_app):
+    with test_app.app_context():
+        # Case-insensitive names, as with the default MySQL collations
+        db.session.execute(text("DROP TABLE ingredient"))
+        db.session.execute(
+            text(
+                "CREATE TABLE ingredient (id INTEGER PRIMARY KEY, "
+                "name_ingredient VARCHAR(128) COLLATE NOCASE NOT NULL UNIQUE, "
+                "updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+            )
+        )
+        db.session.add(Ingredient(name_ingredient="Crème"))
+        db.session.commit()
+
+        ids = resolve_ingredients(["CRèME", "Sucre", "sucre"])
+        db.session.commit()
+        assert (
+            ids["CRèME"] == Ingredient.query.filter_by(name_ingredient="Crème").one().id
+        )
+        assert ids["Sucre"] == ids["sucre"]
+        # Created once, indexed and stored under the first spelling
+        assert Ingredient.query.count() == 2
+        assert find_ingredient_ids([["sucre"]]) == [{ids["Sucre"]}]
+
+
 # Recipe Service Tests
 @patch("services.recipe_service.db.session")
 @patch("services.recipe_service.Recipe")
@@ -75,14 +323,85 @@ def test_add_recipe(mock_recipe, mock_db):
     assert "recipe_id" in result
 
 
+@patch("services.recipe_service.CommentNoSQL")
 @patch("services.recipe_service.db.session")
 @patch("services.recipe_service.Recipe")
-def test_delete_recipe(mock_recipe, mock_db):
-    mock_recipe.query.get_or_404.return_value = MagicMock()
+def test_delete_recipe(mock_recipe, mock_db, mock_comment):
+    mock_recipe.query.get_or_404.return_value = MagicMock(id=1)
     mock_db.commit = MagicMock()
     result = delete_recipe(id=1)
     assert result["error"] is False
     assert result["message"] == "Recipe and unused ingredients deleted."
+    mock_comment.delete_recipe_comments.assert_called_once_with([1])
+
+
+@patch("models.models_nosql.mongo_db")
+def test_delete_recipes_removes_orphan_ingredients(mock_mongo, test_app, user):
+    with test_app.app_context():
+        recipes = [
+            Recipe(title=title, user_id=user.id)
+            for title in ["Crêpes", "Gaufres", "Pancakes"]
+        ]
+        db.session.add_all(recipes)
+        db.session.commit()
+        upsert_recipe_ingredients(
+            recipes[0].id, [{"name": "Farine", "quantity": 250, "unit": "g"}]
+        )
+        upsert_recipe_ingredients(
+            recipes[1].id, [{"name": "Levure", "quantity": 1, "unit": "sachet"}]
+        )
+        upsert_recipe_ingredients(
+            recipes[2].id, [{"name": "Farine", "quantity": 200, "unit": "g"}]
+        )
+        db.session.add(Rating(stars=4, recipe_id=recipes[0].id, user_id=1))
+        db.session.commit()
+
+        ids = [recipes[0].id, recipes[1].id]
+        result = delete_recipes(ids, db.session.get(User, user.id))
+
+        assert result["error"] is False
+        assert result["deleted"] == 2
+        assert Recipe.query.count() == 1
+        assert Rating.query.count() == 0
+        # "Farine" is still used by the remaining recipe, "Levure" is not.
+        assert [i.name_ingredient for i in Ingredient.query.all()] == ["Farine"]
+        mock_mongo.comments.delete_many.assert_called_once_with(
+            {"recipe_id": {"$in": sorted(ids)}}
+        )
+
+
+@patch("models.models_nosql.mongo_db")
+def test_delete_recipes_requires_ownership_or_moderation(mock_mongo, test_app, user):
+    with test_app.app_context():
+        owner = db.session.get(User, user.id)
+        other = User(email="other@example.com", password="password")
+        db.session.add(other)
+        db.session.flush()
+        recipes = [
+            Recipe(title="Crêpes", user_id=owner.id),
+            Recipe(title="Gaufres", user_id=other.id),
+            Recipe(title="Pancakes"),
+        ]
+        db.session.add_all(recipes)
+        db.session.commit()
+        ids = [recipe.id for recipe in recipes]
+
+        for recipe_ids in (ids[:2], ids[2:]):
+            result = delete_recipes(recipe_ids, owner)
+            assert result["error"] is True
+            assert result["forbidden"] is True
+        assert Recipe.query.count() == 3
+        mock_mongo.comments.delete_many.assert_not_called()
+
+        other.is_moderator = True
+        db.session.commit()
+        assert delete_recipes(ids, other)["deleted"] == 3
+
+
+def test_delete_recipes_rejects_invalid_ids():
+    result = delete_recipes([1, -2], None)
+    assert result["error"] is True
+    assert result["message"] == "Recipe ID must be a positive integer."
 
 
 @patch("services.recipe_service.db.session")
@@ -93,3 +412,220 @@ def test_rate_recipe(mock_rating, mock_db):
     result = rate_recipe(recipe_id=1, user_id=1, stars=5)
     assert result["error"] is False
     assert "note" in result["message"]
+
+
+def test_rate_recipe_maintains_aggregates(test_app):
+    with test_app.app_context():
+        recipe = Recipe(title="Tarte tatin")
+        db.session.add(recipe)
+        db.session.commit()
+
+        rate_recipe(recipe_id=recipe.id, user_id=1, stars=2)
+        rate_recipe(recipe_id=recipe.id, user_id=2, stars=4)
+        rate_recipe(recipe_id=recipe.id, user_id=1, stars=5)  # Update, not a new rating
+
+        db.session.refresh(recipe)
+        assert recipe.rating_count == 2
+        assert recipe.rating_sum == 9
+        assert recipe.average_rating == 4.5
+
+
+def test_reconcile_rating_aggregates(test_app):
+    with test_app.app_context():
+        recipe = Recipe(title="Far breton", rating_count=7, rating_sum=1)
+        db.session.add(recipe)
+        db.session.commit()
+        db.session.add(Rating(stars=3, recipe_id=recipe.id, user_id=1))
+        db.session.commit()
+
+        result = reconcile_rating_aggregates()
+
+        assert result["error"] is False
+        assert result["updated"] == 1
+        db.session.refresh(recipe)
+        assert (recipe.rating_count, recipe.rating_sum) == (1, 3)
+
+
+# Listing Service Tests
+@patch("services.listing_service.mongo_db")
+def test_build_recipe_listing(mock_mongo, test_app):
+    with test_app.app_context():
+        user = User(username="chef", email="chef@example.com", password="password")
+        db.session.add(user)
+        db.session.commit()
+        rated = Recipe(title="Ratatouille", user_id=user.id)
+        unrated = Recipe(title="Quiche", user_id=user.id)
+        db.session.add_all([rated, unrated])
+        db.session.commit()
+        rate_recipe(recipe_id=rated.id, user_id=user.id, stars=4)
+        rate_recipe(recipe_id=rated.id, user_id=user.id + 1, stars=5)
+        mock_mongo.comments.find.return_value.sort.return_value = [
+            {"recipe_id": rated.id, "user_id": user.id, "text": "Miam"}
+        ]
+
+        listing = build_recipe_listing([rated, unrated])
+
+        # A single MongoDB query is issued for the whole page.
+        mock_mongo.comments.find.assert_called_once()
+        assert listing[0]["average_rating"] == 4.5
+        assert listing[0]["comments"][0]["username"] == "chef"
+        assert listing[1]["average_rating"] is None
+        assert listing[1]["comments"] == []
+
+
+@patch("models.models_nosql.mongo_db")
+@patch("services.listing_service.mongo_db")
+def test_render_recipe_cards_uses_fragment_cache(mock_mongo, mock_nosql, test_app):
+    test_app.config["FRAGMENT_CACHE_URL"] = "memory://"
+    with test_app.test_request_context():
+        recipe = Recipe(title="Ratatouille")
+        db.session.add(recipe)
+        db.session.commit()
+        comment = {
+            "recipe_id": recipe.id,
+            "user_id": 7,
+            "text": "Miam",
+            "date": datetime(2024, 5, 1),
+        }
+        mock_mongo.comments.find.return_value.sort.return_value = [comment]
+        mock_nosql.comments.aggregate.return_value = [
+            {"_id": recipe.id, "count": 1, "last": comment["date"]}
+        ]
+
+        card = render_recipe_cards([recipe])[0]
+        assert "Miam" in card and 'data-owner-id="7"' in card
+        assert render_recipe_cards([recipe]) == [card]
+        mock_mongo.comments.find.assert_called_once()
+
+        # Another worker reads the card from the shared backend
+        fragment_cache.clear()
+        assert render_recipe_cards([recipe]) == [card]
+        mock_mongo.comments.find.assert_called_once()
+
+        # A rating changes the state of the recipe: the card is rendered again
+        rate_recipe(recipe_id=recipe.id, user_id=1, stars=4)
+        assert "4.0/5" in render_recipe_cards([recipe])[0]
+        assert mock_mongo.comments.find.call_count == 2
+
+        # So does a comment edited through another worker, without invalidation
+        comment = {**comment, "text": "Délicieux", "date": datetime(2024, 5, 2)}
+        mock_mongo.comments.find.return_value.sort.return_value = [comment]
+        mock_nosql.comments.aggregate.return_value = [
+            {"_id": recipe.id, "count": 1, "last": comment["date"]}
+        ]
+        assert "Délicieux" in render_recipe_cards([recipe])[0]
+
+
+def test_paginate_recipes_keyset(test_app):
+    with test_app.app_context():
+        db.session.add_all([Recipe(title=f"Recette {i}") for i in range(5)])
+        db.session.commit()
+        ids = [recipe.id for recipe in Recipe.query.order_by(Recipe.id)]
+
+        first = paginate_recipes(Recipe.query, page_size=2)
+        assert [r.id for r in first["recipes"]] == ids[:2]
+        assert first["prev_cursor"] is None
+        assert first["next_cursor"] == ids[1]
+
+        last = paginate_recipes(Recipe.query, after=ids[3], page_size=2)
+        assert [r.id for r in last["recipes"]] == ids[4:]
+        assert last["next_cursor"] is None
+        assert last["prev_cursor"] == ids[4]
+
+        previous = paginate_recipes(Recipe.query, before=ids[4], page_size=2)
+        assert [r.id for r in previous["recipes"]] == ids[2:4]
+        assert previous["prev_cursor"] == ids[2]
+        assert previous["next_cursor"] == ids[3]
+
+
+# User Cache Tests
+def test_user_profile_cache_lru_and_ttl():
+    cache = UserProfileCache(maxsize=2, ttl=60)
+    cache.set_many({1: "a", 2: "b"})
+    cache.get_many([1])  # 1 becomes the most recently used profile
+    cache.set_many({3: "c"})
+    assert cache.get_many([1, 2, 3]) == ({1: "a", 3: "c"}, {2})
+
+    expired = UserProfileCache(ttl=0)
+    expired.set_many({1: "a"})
+    assert expired.get_many([1]) == ({}, {1})
+
+
+def test_get_user_profiles_uses_cache(test_app):
+    with test_app.app_context():
+        db.session.add(User(id=1, username="chef", email="chef@example.com"))
+        db.session.commit()
+
+        statements = []
+        event.listen(
+            db.engine, "before_cursor_execute", lambda *a: statements.append(a)
+        )
+        assert get_user_profiles([1, 2])[1]["username"] == "chef"
+        assert get_user_profiles([1])[1]["username"] == "chef"
+        user = load_cached_user(1)
+        assert user.username == "chef"
+        assert len(statements) == 1  # Only the first lookup hits the database
+
+        # Updating the user drops its cached profile
+        user.username = "grand chef"
+        db.session.commit()
+        assert user_cache.get_many([1]) == ({}, {1})
+        assert get_user_profiles([1])[1]["username"] == "grand chef"
+
+
+# Password Service Tests
+def test_authenticate_user_rehashes_with_new_policy(test_app):
+    test_app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:1000"
+    with test_app.app_context():
+        UserService.create_user("chef", "chef@example.com", "secret-password")
+        user = User.query.filter_by(email="chef@example.com").one()
+        assert user.password.startswith("pbkdf2:sha256:1000$")
+
+        with pytest.raises(ValueError):
+            UserService.authenticate_user("chef@example.com", "wrong-password")
+
+        test_app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:2000"
+        UserService.authenticate_user("chef@example.com", "secret-password")
+        db.session.expire_all()
+        user = User.query.filter_by(email="chef@example.com").one()
+        assert user.password.startswith("pbkdf2:sha256:2000$")
+
+
+def test_password_pool_rejects_when_saturated(test_app):
+    test_app.config.update(
+        PASSWORD_HASH_WORKERS=1,
+        PASSWORD_HASH_METHOD="pbkdf2:sha256:1000",
+        PASSWORD_HASH_MAX_PENDING=2,
+    )
+    with test_app.app_context():
+        assert hash_password("secret").startswith("pbkdf2:sha256:1000$")
+
+        # The slots are shared with the other worker processes of the host
+        held = [acquire_host_slot("password", 2) for _ in range(2)]
+        try:
+            with pytest.raises(PasswordHasherBusy):
+                hash_password("secret")
+        finally:
+            for slot in held:
+                slot.close()
+
+        # A hash still running after the timeout keeps its slot until it ends
+        test_app.config.update(
+            PASSWORD_HASH_METHOD="pbkdf2:sha256:2000000", PASSWORD_HASH_TIMEOUT=0.01
+        )
+        executor = password_service._executor.get()
+        try:
+            with pytest.raises(PasswordHasherBusy):
+                hash_password("secret")
+            other = acquire_host_slot("password", 2)
+            assert other is not None
+            assert acquire_host_slot("password", 2) is None
+            other.close()
+        finally:
+            password_service._executor.reset()
+            executor.shutdown()
+
+        held = [acquire_host_slot("password", 2) for _ in range(2)]
+        assert None not in held
+        for slot in held:
+            slot.close()